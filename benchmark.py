@@ -0,0 +1,205 @@
+"""
+Offline benchmark admin aplikácie dochádzky.
+
+Vygeneruje syntetické záznamy attendance (striedanie smien v okne SWAP_WINDOW_MINUTES,
+chýbajúce Príchod/Odchod, dvojité pípnutia, dvojzmeny Veliteľa), uloží ich do SQLiteBackend
+(lokálna náhrada DB) a zmeria hlavné kroky aplikácie pri rastúcom počte týždňov.
+Výsledok ide do JSON reportu; s --baseline sa porovná so starším reportom a pri spomalení
+nad --tolerance skončí s kódom 1 (na kontrolu pred nasadením).
+
+    python benchmark.py --weeks 1 4 13 --guards 60 --out benchmark_report.json
+    python benchmark.py --baseline benchmark_report.json --tolerance 1.5
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time as _clock
+from datetime import datetime, date, time, timedelta
+
+import numpy as np
+import pandas as pd
+
+import dochadzka as app
+
+BENCH_MONDAY = date(2025, 1, 6)
+
+
+def generate_attendance(weeks: int, guards: int = 60, positions=None, seed: int = 1,
+                        monday: date = BENCH_MONDAY,
+                        p_missing: float = 0.04, p_double_tap: float = 0.05,
+                        p_velitel_double: float = 0.5, p_gap: float = 0.05) -> list:
+    """
+    Záznamy attendance (dict-y pre AttendanceBackend.insert) pre weeks týždňov od monday.
+    Na každú pozíciu a deň: ranná + poobedná smena s odovzdaním v okne SWAP_WINDOW_MINUTES,
+    pri Veliteľovi často jedna dvojzmena; náhodne chýba Príchod/Odchod, pípnutia sa zdvoja
+    a niektoré smeny úplne vypadnú.
+    """
+    rnd = random.Random(seed)
+    positions = positions or app.POSITIONS
+    codes = [f"G{i:04d}" for i in range(guards)]
+    records = []
+
+    def tap(user, pos, action, ts):
+        if rnd.random() < p_missing:
+            return
+        records.append({
+            "user_code": user, "position": pos, "action": action,
+            "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S.%f") + "+00", "valid": True,
+        })
+        if rnd.random() < p_double_tap:
+            again = ts + timedelta(seconds=rnd.randint(2, 90))
+            records.append({**records[-1], "timestamp": again.strftime("%Y-%m-%d %H:%M:%S.%f") + "+00"})
+
+    def around(day, hour, spread_min):
+        return datetime.combine(day, time(hour)) + timedelta(
+            minutes=rnd.uniform(-spread_min, spread_min), microseconds=rnd.randint(0, 999999)
+        )
+
+    for d in range(weeks * 7):
+        day = monday + timedelta(days=d)
+        for pos in positions:
+            if rnd.random() < p_gap:
+                continue
+            first, second = rnd.sample(codes, 2)
+            if pos.lower().startswith("vel") and rnd.random() < p_velitel_double:
+                tap(first, pos, "Príchod", around(day, 6, 10))
+                tap(first, pos, "Odchod", around(day, 22, 10))
+                continue
+            # odovzdanie smeny: príchod poobednej do SWAP_WINDOW_MINUTES od odchodu rannej
+            handover = around(day, 14, 10)
+            tap(first, pos, "Príchod", around(day, 6, 10))
+            tap(first, pos, "Odchod", handover)
+            tap(second, pos, "Príchod", handover + timedelta(minutes=rnd.uniform(-app.SWAP_WINDOW_MINUTES, 0)))
+            tap(second, pos, "Odchod", around(day, 22, 10))
+    return records
+
+
+def _timed(fn, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        t0 = _clock.perf_counter()
+        fn()
+        runs.append(_clock.perf_counter() - t0)
+    return {"best": min(runs), "median": statistics.median(runs), "mean": statistics.fmean(runs), "repeat": repeat}
+
+
+def run_scale(weeks: int, guards: int, repeat: int, seed: int) -> dict:
+    """Zmeria jednotlivé kroky pre weeks týždňov dát (SQLite v pamäti)."""
+    backend = app.SQLiteBackend(":memory:")
+    records = generate_attendance(weeks, guards=guards, seed=seed)
+    backend.insert(records)
+
+    start, end = BENCH_MONDAY, BENCH_MONDAY + timedelta(days=weeks * 7 - 1)
+    start_dt = app.tz.localize(datetime.combine(start, time(0, 0)))
+    end_dt = app.tz.localize(datetime.combine(end + timedelta(days=1), time(0, 0)))
+    mondays = [start + timedelta(days=7 * w) for w in range(weeks)]
+    days = [start + timedelta(days=i) for i in range(weeks * 7)]
+
+    df = app.AttendanceCache(backend.fetch_range).get(start_dt, end_dt)
+    pair_table = app.AttendanceCache(backend.fetch_pairs, prepare=lambda t: t, incremental=False).get(start_dt, end_dt)
+    cov_table = app.coverage_table(pair_table)
+    df_raw = app.raw_export_frame(df)
+
+    def week_summaries():
+        return [
+            app.WeekSummary(m, app._days_slice(pair_table, app.day_number(m), app.day_number(m) + 6))
+            for m in mondays
+        ]
+
+    summaries = week_summaries()
+    store = app.SummaryStore(backend)
+    archive = app.ArchivedBackend(backend, tempfile.mkdtemp(prefix="dochadzka_archive_"))
+    archive.fetch_range(start_dt, end_dt)  # naplní archív pre load_attendance_archived
+    app.RangeReport(start, end, lambda: pair_table, store)  # naplní uložené súhrny pre range_report_stored
+
+    steps = {
+        "load_attendance": lambda: app.AttendanceCache(backend.fetch_range).get(start_dt, end_dt),
+        "load_attendance_archived": lambda: app.AttendanceCache(archive.fetch_range).get(start_dt, end_dt),
+        "load_attendance_pairs": lambda: app.AttendanceCache(
+            backend.fetch_pairs, prepare=lambda t: t, incremental=False
+        ).get(start_dt, end_dt),
+        # get_user_pairs/summarize_day = pôvodné volanie po bunkách, appka ide cez *_pair_table
+        "get_user_pairs": lambda: app.get_user_pairs(df),
+        "build_pair_table": lambda: app.build_pair_table(df),
+        "build_stream_pair_table": lambda: app.build_stream_pair_table(df),
+        "summarize_day": lambda: [app.summarize_day(df[df["day"] == app.day_number(d)], d) for d in days],
+        "summarize_day_pair_table": lambda: [app.summarize_day(None, d, pair_table, cov_table) for d in days],
+        "week_matrix": lambda: [s.matrix() for s in week_summaries()],
+        "get_chip_assignments": lambda: [app.get_chip_assignments(df_raw, m, pair_table) for m in mondays],
+        "excel_with_colors": lambda: [
+            app.excel_with_colors(
+                s.matrix().reset_index().rename(columns={"index": "position"}), s.day_details(s.monday),
+                df_raw, s.monday, pair_table,
+            )
+            for s in summaries
+        ],
+        "range_report": lambda: app.excel_range_report(app.RangeReport(start, end, pair_table), df_raw),
+        "range_report_stored": lambda: app.RangeReport(start, end, pair_table, store).matrix(),
+        "guard_ledger": lambda: app.GuardLedger(pair_table).totals(start, end),
+    }
+    return {
+        "weeks": weeks,
+        "guards": guards,
+        "rows": len(df),
+        "pairs": len(pair_table),
+        "timings": {name: _timed(fn, repeat) for name, fn in steps.items()},
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Kroky, ktoré sú oproti baseline pomalšie ako tolerance-krát (porovnáva sa best)."""
+    old = {(r["weeks"], name): t["best"] for r in baseline.get("results", []) for name, t in r["timings"].items()}
+    slower = []
+    for r in report["results"]:
+        for name, t in r["timings"].items():
+            before = old.get((r["weeks"], name))
+            if before and t["best"] > before * tolerance:
+                slower.append({"weeks": r["weeks"], "step": name, "baseline": before, "now": t["best"]})
+    return slower
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark dochádzky (SQLite, syntetické dáta).")
+    parser.add_argument("--weeks", type=int, nargs="+", default=[1, 4, 13], help="počty týždňov (škály)")
+    parser.add_argument("--guards", type=int, default=60, help="počet strážnikov (čipov)")
+    parser.add_argument("--repeat", type=int, default=3, help="opakovania každého kroku (berie sa aj best)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="benchmark_report.json", help="kam zapísať JSON report")
+    parser.add_argument("--baseline", help="starší JSON report na porovnanie")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="povolené spomalenie oproti baseline")
+    args = parser.parse_args(argv)
+
+    report = {
+        "generated_at": datetime.now(app.tz).isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "config": {"guards": args.guards, "repeat": args.repeat, "seed": args.seed, "positions": app.POSITIONS},
+        "results": [],
+    }
+    for weeks in args.weeks:
+        result = run_scale(weeks, args.guards, args.repeat, args.seed)
+        report["results"].append(result)
+        print(f"{weeks:>3} týž. {result['rows']:>7} riadkov: "
+              + ", ".join(f"{k} {v['best'] * 1000:.1f} ms" for k, v in result["timings"].items()))
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        for r in report["regressions"]:
+            print(f"POMALŠIE: {r['step']} ({r['weeks']} týž.): {r['baseline'] * 1000:.1f} -> {r['now'] * 1000:.1f} ms")
+        status = 1 if report["regressions"] else 0
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
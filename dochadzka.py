@@ -0,0 +1,3180 @@
+"""
+Jadro admin aplikácie dochádzky bez Streamlitu: úložiská (Supabase, Postgres, SQLite), cache rozsahov,
+párovanie Príchod/Odchod, súhrny dní a týždňov, report za obdobie, anomálie, hodiny po čipoch a Excel exporty.
+streamlit_app.py nad ním stavia UI; modul sa dá importovať samostatne (benchmark.py, cron) a spustiť ako CLI:
+
+    python dochadzka.py --start 2025-01-06 --end 2025-01-12 --backend sqlite --sqlite dochadzka.sqlite
+    python dochadzka.py --start 2025-01-01 --end 2025-03-31 --format xlsx --out q1.xlsx
+
+Import nemá vedľajšie účinky (secrets, pripojenia, logovacie handlery) a ťažké závislosti
+(supabase, postgrest, psycopg2, openpyxl) sa načítajú až pri použití.
+"""
+import pandas as pd
+import numpy as np
+from datetime import datetime, date, time, timedelta
+import pytz
+import os
+import sys
+import json
+import pickle
+import logging
+import argparse
+from time import perf_counter, sleep
+from contextlib import contextmanager, suppress
+import threading
+import itertools
+import random
+import copy
+import multiprocessing
+import sqlite3
+from io import StringIO, BytesIO
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+tz = pytz.timezone("Europe/Bratislava")
+
+# ================== KONŠTANTY ==================
+# POSITIONS = [
+#     "Veliteľ", "CCTV", "Brány", "Sklad2", "Sklad3",
+#     "Turniket2", "Turniket3", "Plombovac2", "Plombovac3"
+# ]
+POSITIONS = [
+    "Veliteľ", "Plombovac", "Kontrolor_DC3", "Kontrolor_DC2", "Mobilny_SBS"
+]
+SHIFT_HOURS = 7.5
+DOUBLE_SHIFT_HOURS = 15.25
+VELITEL_DOUBLE = 16.25
+SWAP_WINDOW_MINUTES = 30  # <-- zmena: 30 minút
+
+# cache pre load_attendance
+CACHE_TTL_SECONDS = 300      # po tomto čase sa rozsah načíta z DB celý nanovo
+CACHE_REFRESH_SECONDS = 10   # do tohto času sa rozsah vráti z pamäte bez dotazu do DB
+CACHE_MAX_RANGES = 16        # max. počet rozsahov v cache (najstarší použitý sa vyhodí)
+CHANGE_LOG_SIZE = 32         # koľko posledných zmien (verzia, dotknuté bunky) si pamätá DataFrame rozsahu
+_DATA_VERSIONS = itertools.count(1)  # spoločné pre všetky AttendanceCache: verzia jednoznačne určí dáta
+
+# živý režim: zmeny attendance cez ChangeFeed (Postgres LISTEN/NOTIFY, sql/attendance_notify.sql)
+CHANGE_CHANNEL = "attendance_changes"
+LIVE_WAIT_SECONDS = 30       # najdlhšie čakanie na zmenu, potom sa stránka aj tak obnoví
+FEED_RETRY_SECONDS = 5       # pauza pred novým pripojením LISTEN po chybe
+
+# sťahovanie z DB po stránkach (PostgREST vráti max. max-rows riadkov na dotaz)
+ATTENDANCE_COLUMNS = ["id", "user_code", "position", "action", "timestamp", "valid"]
+EDITABLE_COLUMNS = ["position", "action", "valid"]  # hromadná úprava záznamov
+FETCH_PAGE_SIZE = 1000
+FETCH_WORKERS = 4
+
+# HTTP spojenia na Supabase: jeden pool na proces (PooledHttp), zdieľaný všetkými reláciami
+HTTP_MAX_IN_FLIGHT = 8        # max. súbežných požiadaviek z celého procesu (= max. otvorených spojení)
+HTTP_KEEPALIVE_SECONDS = 60   # nečinné spojenie sa nechá otvorené tak dlho na ďalšie požiadavky
+HTTP_RETRIES = 3              # opakovania pri prechodnej chybe (výpadok spojenia, 429/502/503/504)
+HTTP_BACKOFF_SECONDS = 0.25   # pauza pred n-tým opakovaním = HTTP_BACKOFF_SECONDS * 2**n (+ náhodný rozptyl)
+HTTP_RETRY_STATUSES = (429, 502, 503, 504)
+HTTP_LATENCY_SAMPLES = 512    # z koľkých posledných požiadaviek sa počíta latencia v metrikách
+
+# export Excelu na pozadí
+EXPORT_WORKERS = 2
+EXPORT_MAX_ENTRIES = 8  # max. počet hotových/rozrobených exportov v pamäti
+
+# report za obdobie (mesiac, rok, vlastný rozsah) sa počíta po týždňoch paralelne
+REPORT_WORKERS = min(8, os.cpu_count() or 1)
+
+# anomálie: dve rovnaké akcie toho istého čipu do DOUBLE_TAP_SECONDS = dvojité pípnutie
+DOUBLE_TAP_SECONDS = 120
+
+# uložené výsledky summarize_day pre uzavreté dni (sql/attendance_daily_summary.sql)
+SUMMARY_TABLE = "attendance_daily_summary"
+SUMMARY_COLUMNS = ["day", "position", "version", "fingerprint", "morning_status", "afternoon_status",
+                   "total_hours", "result"]
+SUMMARY_VERSION = 2  # zvýšiť pri zmene výpočtu summarize_day, staré uložené výsledky sa potom ignorujú
+
+# lokálny archív uzavretých týždňov (ArchivedBackend), zapína sa DATABAZA_ARCHIVE = adresár
+ARCHIVE_VERSION = 1  # zvýšiť pri zmene _prepare_attendance alebo formátu súborov, staršie týždne sa stiahnu nanovo
+
+# riadky agregácie attendance_pairs (jeden na deň + pozíciu + user_code)
+PAIR_AGG_COLUMNS = ["day", "position", "user_code", "pr", "od", "pr_count", "od_count", "first_id"]
+
+# kompaktné stĺpce načítaných záznamov
+CATEGORY_COLUMNS = ["user_code", "position", "action"]
+ACTION_NONE, ACTION_PRICHOD, ACTION_ODCHOD = 0, 1, 2  # stĺpec action_code
+EPOCH_DATE = date(1970, 1, 1)  # stĺpec day = počet dní od EPOCH_DATE
+DAY_NS = 86400 * 10**9
+
+# párovanie Príchod/Odchod: "day" = v rámci kalendárneho dňa (prvý Príchod, posledný Odchod),
+# "stream" = po čase naprieč dňami (build_stream_pair_table, nočné smeny cez polnoc)
+PAIRING_MODE = os.environ.get("DOCHADZKA_PAIRING", "day")
+MAX_PAIR_HOURS = 20  # pri "stream" najdlhší pár Príchod-Odchod, dlhšia medzera pár rozdelí
+PAIR_PADDING = timedelta(hours=MAX_PAIR_HOURS)  # pri "stream" presah načítania pred a za rozsahom
+
+# ================== MERANIA ==================
+# každý krok (načítanie, sumarizácia, matica, export) sa zapíše do logu ako JSON riadok
+# a do zoznamu aktuálneho rerunu (panel "⏱️ Merania" v sidebare)
+logger = logging.getLogger("dochadzka")
+
+def configure_logging():
+    """Merania do stderr ako JSON riadky (volá streamlit_app a CLI; samotný import modulu logging nemení)."""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(os.environ.get("DOCHADZKA_LOG_LEVEL", "INFO"))
+        logger.propagate = False
+
+_stage_state = threading.local()
+
+def begin_stages():
+    """Začne nový zoznam meraní pre aktuálne vlákno (jeden rerun)."""
+    _stage_state.records = []
+
+def stage_records() -> list:
+    return list(getattr(_stage_state, "records", []))
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    """Približná veľkosť DataFrame v pamäti (bez deep prechodu objektov)."""
+    return int(df.memory_usage(index=True).sum()) if df is not None else 0
+
+@contextmanager
+def stage(name: str, **info):
+    """
+    Zmeria čas bloku. Do yieldnutého dict-u sa dajú doplniť rows/bytes a pod.:
+        with stage("load_attendance") as info:
+            df = ...
+            info["rows"] = len(df)
+    """
+    record = {"stage": name, **info}
+    start = perf_counter()
+    try:
+        yield record
+    finally:
+        record["ms"] = round((perf_counter() - start) * 1000, 2)
+        record["thread"] = threading.current_thread().name
+        records = getattr(_stage_state, "records", None)
+        if records is not None:
+            records.append(record)
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+# ================== HELPERS ==================
+# agregácia párov v DB, rovnaká ako funkcia attendance_pairs v sql/attendance_pairs.sql
+PAIRS_SQL = """
+    SELECT (timestamp AT TIME ZONE 'UTC')::date AS day, position, user_code,
+           MIN(timestamp) FILTER (WHERE lower(action) = 'príchod') AS pr,
+           MAX(timestamp) FILTER (WHERE lower(action) = 'odchod') AS od,
+           COUNT(*) FILTER (WHERE lower(action) = 'príchod') AS pr_count,
+           COUNT(*) FILTER (WHERE lower(action) = 'odchod') AS od_count,
+           MIN(id) AS first_id
+    FROM attendance
+    WHERE timestamp >= %s AND timestamp < %s
+    GROUP BY 1, 2, 3
+    ORDER BY first_id
+"""
+
+class AttendanceBackend:
+    """
+    Úložisko tabuľky attendance.
+    fetch_range vracia surové riadky (stĺpce ATTENDANCE_COLUMNS, zoradené podľa id)
+    a počet stiahnutých riadkov v df.attrs["fetched_rows"]; insert/update vracajú zapísané riadky.
+    """
+
+    def fetch_range(self, start_dt: datetime, end_dt: datetime, after_id=None, after_ts=None) -> pd.DataFrame:
+        """Záznamy so start_dt <= timestamp < end_dt; s after_id/after_ts len novšie ako posledné načítanie."""
+        raise NotImplementedError
+
+    def fetch_pairs(self, start_dt: datetime, end_dt: datetime) -> pd.DataFrame:
+        """
+        Tabuľka párov (ako z build_pair_table) pre rozsah. Pri PAIRING_MODE "stream" sa stiahnu surové riadky
+        s presahom PAIR_PADDING a spárujú sa po čase (build_stream_pair_table), inak fetch_pair_aggregates.
+        """
+        if PAIRING_MODE != "stream":
+            return self.fetch_pair_aggregates(start_dt, end_dt)
+        raw = self.fetch_range(*pairing_range(start_dt, end_dt))
+        table = pair_table_from_frame(
+            _prepare_attendance(raw), day_number(start_dt.date()), day_number((end_dt - timedelta(microseconds=1)).date())
+        )
+        table.attrs["fetched_rows"] = raw.attrs["fetched_rows"]
+        return table
+
+    def fetch_pair_aggregates(self, start_dt: datetime, end_dt: datetime) -> pd.DataFrame:
+        """
+        Páry v rámci dňa (build_pair_table). Predvolene sa stiahnu surové riadky a spárujú sa lokálne;
+        backendy s agregáciou v DB posielajú len jeden riadok na (deň, pozícia, user).
+        """
+        raw = self.fetch_range(start_dt, end_dt)
+        table = build_pair_table(_prepare_attendance(raw))
+        table.attrs["fetched_rows"] = raw.attrs["fetched_rows"]
+        return table
+
+    def insert(self, records: list) -> list:
+        raise NotImplementedError
+
+    def update(self, record_id: int, fields: dict) -> list:
+        raise NotImplementedError
+
+    def update_many(self, records: list) -> list:
+        """
+        Úprava viacerých riadkov podľa id naraz: z každého dict-u (s id) sa zapíšu len EDITABLE_COLUMNS.
+        Riadok, ktorý medzitým zmizol, sa znova nevloží. Vráti upravené riadky.
+        """
+        raise NotImplementedError
+
+    def change_feed(self):
+        """ChangeFeed so zmenami z DB, None ak ich úložisko neposiela (stačí lokálny ChangeFeed)."""
+        return None
+
+    def fetch_summaries(self, first: date, last: date) -> list:
+        """Uložené súhrny (dict-y so stĺpcami SUMMARY_COLUMNS, result ako dict) pre dni first..last."""
+        raise NotImplementedError
+
+    def store_summaries(self, rows: list):
+        """Zapíše súhrny (SUMMARY_COLUMNS), existujúce (day, position) prepíše."""
+        raise NotImplementedError
+
+    def delete_summaries(self, cells: list):
+        """Zmaže uložené súhrny pre bunky (day: date, position)."""
+        raise NotImplementedError
+
+    def connection_stats(self) -> dict:
+        """Metriky spojení (PooledHttp.stats), prázdny dict ak ich úložisko nemeria."""
+        return {}
+
+    def range_stats(self, start_dt: datetime, end_dt: datetime) -> tuple:
+        """(počet riadkov, najväčšie id) pre start_dt <= timestamp < end_dt; id je None pre prázdny rozsah."""
+        raise NotImplementedError
+
+    def day_stats(self, first: date, last: date) -> dict:
+        """
+        Deň -> (počet riadkov, najväčšie id) pre dni first..last; deň podľa času uloženého v DB, rovnako ako
+        deň párov. Dni bez riadkov chýbajú. Predvolene jeden range_stats na deň (súbežne).
+        """
+        days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        stats = parallel_map(self.range_stats, [_stored_day_range(d) for d in days], workers=HTTP_MAX_IN_FLIGHT)
+        return {d: (rows, max_id) for d, (rows, max_id) in zip(days, stats) if rows}
+
+    def discard_archived(self, stamps):
+        """Zahodí archivované týždne s timestampmi stamps (ArchivedBackend); ostatné úložiská nič nearchivujú."""
+
+    @staticmethod
+    def _frame(rows) -> pd.DataFrame:
+        df = pd.DataFrame(rows, columns=ATTENDANCE_COLUMNS) if len(rows) else pd.DataFrame()
+        df.attrs["fetched_rows"] = len(df)
+        return df
+
+class PooledHttp:
+    """
+    HTTP session PostgREST klienta (postgrest.utils.SyncClient) s poolom keep-alive spojení pre celý proces.
+    Súbežných požiadaviek je najviac max_in_flight (aj keď stránky sťahuje viac relácií naraz),
+    prechodné chyby sa opakujú s rastúcou pauzou a stats() vráti počty požiadaviek,
+    nových/znovu použitých spojení a latenciu. Ostatné atribúty (headers, base_url...) idú na session.
+
+    Opakuje sa vždy, keď sa požiadavka k serveru nedostala (nové spojenie zlyhalo, plný pool);
+    výpadok spojenia počas požiadavky a HTTP_RETRY_STATUSES len pri čítaní (GET/HEAD a RPC,
+    ktoré v tejto aplikácii len čítajú), aby sa insert nezapísal dvakrát.
+    """
+
+    def __init__(self, session, max_in_flight: int = HTTP_MAX_IN_FLIGHT, retries: int = HTTP_RETRIES,
+                 backoff: float = HTTP_BACKOFF_SECONDS):
+        import httpx
+        from postgrest.utils import SyncClient
+
+        self._httpx = httpx
+        self.session = SyncClient(
+            base_url=session.base_url,
+            headers=session.headers,
+            timeout=session.timeout,
+            limits=httpx.Limits(
+                max_connections=max_in_flight,
+                max_keepalive_connections=max_in_flight,
+                keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+            ),
+        )
+        session.close()
+        self.retries = retries
+        self.backoff = backoff
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(["requests", "new_connections", "reused_connections", "retries", "errors"], 0)
+        self._latency_ms = deque(maxlen=HTTP_LATENCY_SAMPLES)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._counts[key] += value
+
+    def request(self, method: str, url, **kwargs):
+        httpx = self._httpx
+        reading = method.upper() in ("GET", "HEAD") or str(url).startswith("/rpc/")
+        extensions = kwargs.pop("extensions", None) or {}
+        for attempt in itertools.count():
+            connects = []
+
+            def trace(event, info):
+                # nové spojenie (aj neúspešný pokus); bez neho išla požiadavka cez spojenie z poolu
+                if event in ("connection.connect_tcp.started", "connection.connect_unix_socket.started"):
+                    connects.append(event)
+
+            start = perf_counter()
+            response = error = None
+            with self._slots:
+                try:
+                    response = self.session.request(method, url, extensions={**extensions, "trace": trace}, **kwargs)
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as exc:
+                    error, retryable = exc, True
+                except httpx.TransportError as exc:
+                    error, retryable = exc, reading
+            with self._lock:
+                self._counts["requests"] += 1
+                self._counts["new_connections" if connects else "reused_connections"] += 1
+                self._latency_ms.append((perf_counter() - start) * 1000)
+            if response is not None:
+                retryable = reading and response.status_code in HTTP_RETRY_STATUSES
+                if not retryable or attempt >= self.retries:
+                    return response
+                reason = response.status_code
+            elif not retryable or attempt >= self.retries:
+                self._count(errors=1)
+                raise error
+            else:
+                reason = type(error).__name__
+            self._count(retries=1)
+            pause = self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+            logger.warning(json.dumps({"stage": "http_retry", "method": method, "url": str(url), "reason": reason,
+                                       "attempt": attempt + 1, "pause_ms": round(pause * 1000)}))
+            sleep(pause)
+
+    def stats(self) -> dict:
+        """Počty od štartu procesu a latencia posledných HTTP_LATENCY_SAMPLES požiadaviek (ms)."""
+        with self._lock:
+            stats = dict(self._counts)
+            latency = np.array(self._latency_ms)
+        connections = stats["new_connections"] + stats["reused_connections"]
+        stats["reuse_rate"] = round(stats["reused_connections"] / connections, 3) if connections else None
+        if len(latency):
+            stats.update({
+                "latency_avg_ms": round(float(latency.mean()), 1),
+                "latency_p50_ms": round(float(np.percentile(latency, 50)), 1),
+                "latency_p95_ms": round(float(np.percentile(latency, 95)), 1),
+                "latency_max_ms": round(float(latency.max()), 1),
+            })
+        return stats
+
+
+class SupabaseBackend(AttendanceBackend):
+    """Supabase REST (PostgREST); rozsahy sťahuje po stránkach paralelne."""
+
+    def __init__(self, client):
+        self.client = client  # supabase.Client
+
+    def connection_stats(self) -> dict:
+        session = self.client.postgrest.session
+        return session.stats() if isinstance(session, PooledHttp) else {}
+
+    def _query(self, start_dt: datetime, end_dt: datetime, after_id=None, after_ts=None, count=None):
+        """Dotaz na attendance v rozsahu, len so stĺpcami ATTENDANCE_COLUMNS, zoradený podľa id."""
+        query = (
+            self.client.table("attendance")
+            .select(",".join(ATTENDANCE_COLUMNS), count=count)
+            .gte("timestamp", start_dt.isoformat())
+            .lt("timestamp", end_dt.isoformat())
+        )
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        elif after_ts is not None:
+            query = query.gt("timestamp", after_ts.isoformat())
+        return query.order("id")
+
+    @staticmethod
+    def _page(query, first: int, last: int):
+        # stránka cez hlavičku Range (first..last vrátane); .range() sa medzi verziami postgrest-py líši
+        query.headers["Range-Unit"] = "items"
+        query.headers["Range"] = f"{first}-{last}"
+        return query
+
+    def _fetch_pages(self, make_query) -> list:
+        """
+        Stiahne všetky stránky dotazu make_query(count: bool). Prvá stránka vráti aj celkový počet
+        riadkov, zvyšné stránky sa stiahnu paralelne (max. FETCH_WORKERS naraz).
+        """
+        first = self._page(make_query(True), 0, FETCH_PAGE_SIZE - 1).execute()
+        rows = list(first.data)
+        total = first.count if first.count is not None else len(rows)
+
+        if total > len(rows) and rows:
+            # ak má server nižší max-rows ako FETCH_PAGE_SIZE, ideme po jeho veľkosti stránky
+            page = len(rows)
+
+            def fetch_page(offset):
+                return self._page(make_query(False), offset, offset + page - 1).execute().data
+
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+                for data in pool.map(fetch_page, range(page, total, page)):
+                    rows.extend(data)
+        return rows
+
+    def fetch_range(self, start_dt: datetime, end_dt: datetime, after_id=None, after_ts=None) -> pd.DataFrame:
+        return self._frame(self._fetch_pages(
+            lambda count: self._query(start_dt, end_dt, after_id, after_ts, count="exact" if count else None)
+        ))
+
+    def range_stats(self, start_dt: datetime, end_dt: datetime) -> tuple:
+        # count z hlavičky Content-Range, najväčšie id z jediného riadku
+        res = (
+            self.client.table("attendance").select("id", count="exact")
+            .gte("timestamp", start_dt.isoformat())
+            .lt("timestamp", end_dt.isoformat())
+            .order("id", desc=True)
+            .limit(1)
+            .execute()
+        )
+        return res.count or 0, res.data[0]["id"] if res.data else None
+
+    def day_stats(self, first: date, last: date) -> dict:
+        """Počty po dňoch z RPC attendance_day_stats (sql/attendance_daily_summary.sql); bez nej range_stats po dňoch."""
+        from postgrest.exceptions import APIError
+
+        start_dt, end_dt = _stored_day_range(first, last)
+        params = {"start_ts": start_dt.isoformat(), "end_ts": end_dt.isoformat()}
+        try:
+            rows = self.client.rpc("attendance_day_stats", params).execute().data
+        except APIError:
+            return super().day_stats(first, last)
+        return {date.fromisoformat(str(r["day"])[:10]): (r["rows"], r["max_id"]) for r in rows}
+
+    def fetch_pair_aggregates(self, start_dt: datetime, end_dt: datetime) -> pd.DataFrame:
+        """Agregáty z RPC attendance_pairs (sql/attendance_pairs.sql); ak funkcia v DB nie je, spáruje sa lokálne."""
+        from postgrest.exceptions import APIError
+
+        params = {"start_ts": start_dt.isoformat(), "end_ts": end_dt.isoformat()}
+
+        def make_query(count):
+            query = self.client.rpc("attendance_pairs", params)
+            if count:
+                query.headers["Prefer"] = "count=exact"
+            return query
+
+        try:
+            rows = self._fetch_pages(make_query)
+        except APIError:
+            return super().fetch_pair_aggregates(start_dt, end_dt)
+        return pair_table_from_aggregates(pd.DataFrame(rows, columns=PAIR_AGG_COLUMNS))
+
+    def insert(self, records: list) -> list:
+        return self.client.table("attendance").insert(records).execute().data
+
+    def update(self, record_id: int, fields: dict) -> list:
+        return self.client.table("attendance").update(fields).eq("id", record_id).execute().data
+
+    def update_many(self, records: list) -> list:
+        # PostgREST nemá update s rôznymi hodnotami po riadkoch: jeden PATCH na každú kombináciu hodnôt
+        groups = {}
+        for r in records:
+            groups.setdefault(tuple(r[c] for c in EDITABLE_COLUMNS), []).append(int(r["id"]))
+        rows = []
+        for values, ids in groups.items():
+            rows += self.client.table("attendance").update(dict(zip(EDITABLE_COLUMNS, values))).in_("id", ids).execute().data
+        return rows
+
+    def fetch_summaries(self, first: date, last: date) -> list:
+        return self._fetch_pages(
+            lambda count: self.client.table(SUMMARY_TABLE)
+            .select(",".join(SUMMARY_COLUMNS), count="exact" if count else None)
+            .gte("day", first.isoformat())
+            .lte("day", last.isoformat())
+            .order("day")
+            .order("position")
+        )
+
+    def store_summaries(self, rows: list):
+        rows = [{**r, "day": r["day"].isoformat()} for r in rows]
+        self.client.table(SUMMARY_TABLE).upsert(rows, on_conflict="day,position").execute()
+
+    def delete_summaries(self, cells: list):
+        by_day = {}
+        for day, position in cells:
+            by_day.setdefault(day.isoformat(), set()).add(position)
+        for day, positions in by_day.items():
+            self.client.table(SUMMARY_TABLE).delete().eq("day", day).in_("position", sorted(positions)).execute()
+
+class PostgresBackend(AttendanceBackend):
+    """
+    Priame pripojenie na Postgres cez psycopg2 s poolom spojení.
+    Rozsahy číta jedným COPY ... TO STDOUT, zápisy posiela jedným execute_values.
+    """
+
+    def __init__(self, dsn: str, max_connections: int = FETCH_WORKERS):
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self.dsn = dsn
+        self.pool = ThreadedConnectionPool(1, max_connections, dsn)
+
+    def _run(self, fn):
+        conn = self.pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    # timestampy ako v REST API (UTC)
+                    cur.execute("SET TIME ZONE 'UTC'")
+                    return fn(cur)
+        finally:
+            self.pool.putconn(conn)
+
+    def _copy_csv(self, select: str, params: list, **read_csv) -> pd.DataFrame:
+        """Výsledok SELECT-u cez COPY ... TO STDOUT (CSV) rovno do DataFrame."""
+
+        def copy(cur):
+            buf = StringIO()
+            cur.copy_expert(f"COPY ({cur.mogrify(select, params).decode()}) TO STDOUT WITH CSV HEADER", buf)
+            buf.seek(0)
+            return buf
+
+        return pd.read_csv(self._run(copy), **read_csv)
+
+    def range_stats(self, start_dt: datetime, end_dt: datetime) -> tuple:
+        def run(cur):
+            cur.execute("SELECT count(*), max(id) FROM attendance WHERE timestamp >= %s AND timestamp < %s",
+                        [start_dt, end_dt])
+            return cur.fetchone()
+
+        rows, max_id = self._run(run)
+        return rows, max_id
+
+    def day_stats(self, first: date, last: date) -> dict:
+        def run(cur):
+            cur.execute(
+                "SELECT (timestamp AT TIME ZONE 'UTC')::date, count(*), max(id) FROM attendance"
+                " WHERE timestamp >= %s AND timestamp < %s GROUP BY 1",
+                list(_stored_day_range(first, last)),
+            )
+            return cur.fetchall()
+
+        return {day: (rows, max_id) for day, rows, max_id in self._run(run)}
+
+    def fetch_pair_aggregates(self, start_dt: datetime, end_dt: datetime) -> pd.DataFrame:
+        agg = self._copy_csv(PAIRS_SQL, [start_dt, end_dt], dtype={"position": str, "user_code": str, "pr": str, "od": str})
+        return pair_table_from_aggregates(agg)
+
+    def fetch_range(self, start_dt: datetime, end_dt: datetime, after_id=None, after_ts=None) -> pd.DataFrame:
+        where = ["timestamp >= %s", "timestamp < %s"]
+        params = [start_dt, end_dt]
+        if after_id is not None:
+            where.append("id > %s")
+            params.append(after_id)
+        elif after_ts is not None:
+            where.append("timestamp > %s")
+            params.append(after_ts.to_pydatetime() if isinstance(after_ts, pd.Timestamp) else after_ts)
+        select = f"SELECT {', '.join(ATTENDANCE_COLUMNS)} FROM attendance WHERE {' AND '.join(where)} ORDER BY id"
+        df = self._copy_csv(
+            select, params,
+            dtype={"user_code": str, "position": str, "action": str, "timestamp": str},
+            true_values=["t"], false_values=["f"],
+        )
+        df.attrs["fetched_rows"] = len(df)
+        return df if len(df) else self._frame([])
+
+    def insert(self, records: list) -> list:
+        from psycopg2.extras import execute_values, RealDictCursor
+
+        cols = [c for c in ATTENDANCE_COLUMNS if c != "id"]
+        values = [tuple(r.get(c) for c in cols) for r in records]
+
+        def run(cur):
+            with cur.connection.cursor(cursor_factory=RealDictCursor) as dict_cur:
+                return execute_values(
+                    dict_cur,
+                    f"INSERT INTO attendance ({', '.join(cols)}) VALUES %s RETURNING {', '.join(ATTENDANCE_COLUMNS)}",
+                    values, fetch=True,
+                )
+
+        return [dict(r) for r in self._run(run)]
+
+    def update(self, record_id: int, fields: dict) -> list:
+        from psycopg2.extras import RealDictCursor
+
+        sets = ", ".join(f"{col} = %s" for col in fields)
+
+        def run(cur):
+            with cur.connection.cursor(cursor_factory=RealDictCursor) as dict_cur:
+                dict_cur.execute(
+                    f"UPDATE attendance SET {sets} WHERE id = %s RETURNING {', '.join(ATTENDANCE_COLUMNS)}",
+                    [*fields.values(), record_id],
+                )
+                return dict_cur.fetchall()
+
+        return [dict(r) for r in self._run(run)]
+
+    def update_many(self, records: list) -> list:
+        from psycopg2.extras import execute_values, RealDictCursor
+
+        values = [(int(r["id"]), *(r[c] for c in EDITABLE_COLUMNS)) for r in records]
+        sets = ", ".join(f"{c} = v.{c}" for c in EDITABLE_COLUMNS)
+
+        def run(cur):
+            with cur.connection.cursor(cursor_factory=RealDictCursor) as dict_cur:
+                return execute_values(
+                    dict_cur,
+                    f"UPDATE attendance AS a SET {sets} FROM (VALUES %s) AS v (id, {', '.join(EDITABLE_COLUMNS)}) "
+                    f"WHERE a.id = v.id RETURNING {', '.join('a.' + c for c in ATTENDANCE_COLUMNS)}",
+                    values, fetch=True,
+                )
+
+        return [dict(r) for r in self._run(run)]
+
+    def change_feed(self):
+        return PostgresChangeFeed(self.dsn)
+
+    def fetch_summaries(self, first: date, last: date) -> list:
+        from psycopg2.extras import RealDictCursor
+
+        def run(cur):
+            with cur.connection.cursor(cursor_factory=RealDictCursor) as dict_cur:
+                dict_cur.execute(
+                    f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM {SUMMARY_TABLE} WHERE day BETWEEN %s AND %s",
+                    [first, last],
+                )
+                return dict_cur.fetchall()
+
+        return [dict(r) for r in self._run(run)]
+
+    def store_summaries(self, rows: list):
+        from psycopg2.extras import execute_values, Json
+
+        values = [tuple(Json(r[c]) if c == "result" else r[c] for c in SUMMARY_COLUMNS) for r in rows]
+        sets = ", ".join(f"{c} = EXCLUDED.{c}" for c in SUMMARY_COLUMNS[2:])
+        self._run(lambda cur: execute_values(
+            cur,
+            f"INSERT INTO {SUMMARY_TABLE} ({', '.join(SUMMARY_COLUMNS)}) VALUES %s "
+            f"ON CONFLICT (day, position) DO UPDATE SET {sets}, updated_at = now()",
+            values,
+        ))
+
+    def delete_summaries(self, cells: list):
+        from psycopg2.extras import execute_values
+
+        self._run(lambda cur: execute_values(
+            cur, f"DELETE FROM {SUMMARY_TABLE} WHERE (day, position) IN (VALUES %s)",
+            list(cells), template="(%s::date, %s)",
+        ))
+
+class SQLiteBackend(AttendanceBackend):
+    """
+    Lokálna náhrada databázy v SQLite (offline testy, benchmarky).
+    Timestampy ukladá ako text v UTC v jednotnom tvare, aby sa dali porovnávať ako reťazce.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS attendance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_code TEXT NOT NULL,
+            position TEXT NOT NULL,
+            action TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            valid INTEGER NOT NULL DEFAULT 1
+        )
+    """
+    SUMMARY_SCHEMA = f"""
+        CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+            day TEXT NOT NULL,
+            position TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            morning_status TEXT NOT NULL,
+            afternoon_status TEXT NOT NULL,
+            total_hours REAL NOT NULL,
+            result TEXT NOT NULL,
+            PRIMARY KEY (day, position)
+        )
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # SQLite lower() mení len ASCII znaky
+        self.conn.create_function("py_lower", 1, lambda v: v.lower() if isinstance(v, str) else v, deterministic=True)
+        self.conn.execute(self.SCHEMA)
+        self.conn.execute(self.SUMMARY_SCHEMA)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS attendance_timestamp ON attendance (timestamp)")
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _ts(value) -> str:
+        ts = pd.Timestamp(value)
+        if ts.tzinfo is None:
+            ts = ts.tz_localize(tz)
+        return ts.tz_convert("UTC").strftime("%Y-%m-%d %H:%M:%S.%f+00:00")
+
+    def fetch_range(self, start_dt: datetime, end_dt: datetime, after_id=None, after_ts=None) -> pd.DataFrame:
+        sql = f"SELECT {', '.join(ATTENDANCE_COLUMNS)} FROM attendance WHERE timestamp >= ? AND timestamp < ?"
+        params = [self._ts(start_dt), self._ts(end_dt)]
+        if after_id is not None:
+            sql += " AND id > ?"
+            params.append(int(after_id))
+        elif after_ts is not None:
+            sql += " AND timestamp > ?"
+            params.append(self._ts(after_ts))
+        with self.lock:
+            df = pd.read_sql_query(sql + " ORDER BY id", self.conn, params=params)
+        df["valid"] = df["valid"].astype(bool)
+        df.attrs["fetched_rows"] = len(df)
+        return df if len(df) else self._frame([])
+
+    def range_stats(self, start_dt: datetime, end_dt: datetime) -> tuple:
+        with self.lock:
+            rows, max_id = self.conn.execute(
+                "SELECT count(*), max(id) FROM attendance WHERE timestamp >= ? AND timestamp < ?",
+                [self._ts(start_dt), self._ts(end_dt)],
+            ).fetchone()
+        return rows, max_id
+
+    def day_stats(self, first: date, last: date) -> dict:
+        start_dt, end_dt = _stored_day_range(first, last)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT substr(timestamp, 1, 10), count(*), max(id) FROM attendance"
+                " WHERE timestamp >= ? AND timestamp < ? GROUP BY 1",
+                [self._ts(start_dt), self._ts(end_dt)],
+            ).fetchall()
+        return {date.fromisoformat(day): (count, max_id) for day, count, max_id in rows}
+
+    def fetch_pair_aggregates(self, start_dt: datetime, end_dt: datetime) -> pd.DataFrame:
+        sql = """
+            SELECT substr(timestamp, 1, 10) AS day, position, user_code,
+                   MIN(CASE WHEN py_lower(action) = 'príchod' THEN timestamp END) AS pr,
+                   MAX(CASE WHEN py_lower(action) = 'odchod' THEN timestamp END) AS od,
+                   SUM(py_lower(action) = 'príchod') AS pr_count,
+                   SUM(py_lower(action) = 'odchod') AS od_count,
+                   MIN(id) AS first_id
+            FROM attendance
+            WHERE timestamp >= ? AND timestamp < ?
+            GROUP BY 1, 2, 3
+            ORDER BY first_id
+        """
+        with self.lock:
+            agg = pd.read_sql_query(sql, self.conn, params=[self._ts(start_dt), self._ts(end_dt)])
+        return pair_table_from_aggregates(agg)
+
+    @staticmethod
+    def _rows(cur) -> list:
+        rows = [dict(zip(ATTENDANCE_COLUMNS, r)) for r in cur.fetchall()]
+        for row in rows:
+            row["valid"] = bool(row["valid"])
+        return rows
+
+    def insert(self, records: list) -> list:
+        cols = [c for c in ATTENDANCE_COLUMNS if c != "id"]
+        rows = [tuple(self._ts(r[c]) if c == "timestamp" else r.get(c, True) for c in cols) for r in records]
+        with self.lock, self.conn:
+            first = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM attendance").fetchone()[0]
+            self.conn.executemany(f"INSERT INTO attendance ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", rows)
+            return self._rows(self.conn.execute(
+                f"SELECT {', '.join(ATTENDANCE_COLUMNS)} FROM attendance WHERE id > ? ORDER BY id", [first]
+            ))
+
+    def update(self, record_id: int, fields: dict) -> list:
+        sets = ", ".join(f"{col} = ?" for col in fields)
+        with self.lock, self.conn:
+            self.conn.execute(f"UPDATE attendance SET {sets} WHERE id = ?", [*fields.values(), record_id])
+            return self._rows(self.conn.execute(
+                f"SELECT {', '.join(ATTENDANCE_COLUMNS)} FROM attendance WHERE id = ?", [record_id]
+            ))
+
+    def update_many(self, records: list) -> list:
+        rows = [(*(r[c] for c in EDITABLE_COLUMNS), int(r["id"])) for r in records]
+        sets = ", ".join(f"{c} = ?" for c in EDITABLE_COLUMNS)
+        ids = [int(r["id"]) for r in records]
+        with self.lock, self.conn:
+            self.conn.executemany(f"UPDATE attendance SET {sets} WHERE id = ?", rows)
+            return self._rows(self.conn.execute(
+                f"SELECT {', '.join(ATTENDANCE_COLUMNS)} FROM attendance WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id",
+                ids,
+            ))
+
+    def fetch_summaries(self, first: date, last: date) -> list:
+        with self.lock:
+            cur = self.conn.execute(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM {SUMMARY_TABLE} WHERE day BETWEEN ? AND ?",
+                [first.isoformat(), last.isoformat()],
+            )
+            rows = [dict(zip(SUMMARY_COLUMNS, r)) for r in cur.fetchall()]
+        for row in rows:
+            row["result"] = json.loads(row["result"])
+        return rows
+
+    def store_summaries(self, rows: list):
+        values = [
+            tuple(json.dumps(r[c]) if c == "result" else r[c].isoformat() if c == "day" else r[c] for c in SUMMARY_COLUMNS)
+            for r in rows
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {SUMMARY_TABLE} ({', '.join(SUMMARY_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(SUMMARY_COLUMNS))})",
+                values,
+            )
+
+    def delete_summaries(self, cells: list):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                f"DELETE FROM {SUMMARY_TABLE} WHERE day = ? AND position = ?",
+                [(day.isoformat(), position) for day, position in cells],
+            )
+
+class ArchivedBackend(AttendanceBackend):
+    """
+    Úložisko s lokálnym archívom uzavretých týždňov (pondelok..nedeľa, ktoré skončili pred dneškom).
+    Týždeň sú dva súbory v root: <pondelok>.<generácia>.bin s pripravenými stĺpcami (_prepare_attendance)
+    uloženými za sebou (kategórie ako kódy, čas ako UTC datetime64) a <pondelok>.json s ich rozložením,
+    počtom riadkov a najväčším id. Súbor sa číta cez np.memmap bez parsovania; celý jeden týždeň ide
+    do DataFrame bez kopírovania, viac týždňov sa spojí po stĺpcoch v numpy.
+
+    Pred čítaním sa pre každý súvislý úsek archivovaných týždňov porovná počet riadkov a max. id s DB
+    (range_stats, jeden dotaz na úsek); pri nezhode sa porovnajú týždne úseku a zmenené sa stiahnu znova.
+    Úprava existujúceho riadku počet ani id nemení, preto zápisy cez toto úložisko a zmeny z ChangeFeed
+    (discard_archived) dotknuté týždne rovno zahadzujú. Zápisy a súhrny idú do vnoreného úložiska.
+    fetch_range vracia už pripravený DataFrame (_prepare_attendance ho nechá tak).
+    """
+
+    ALIGN = 64  # zarovnanie stĺpcov v .bin súbore (bajty)
+
+    def __init__(self, backend: AttendanceBackend, root: str):
+        self.backend = backend
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()  # zápis a mazanie týždňov
+
+    # ---- týždne ----
+    @staticmethod
+    def _week_range(monday: date) -> tuple:
+        return day_range(monday, monday + timedelta(days=6))
+
+    @staticmethod
+    def _runs(mondays: list) -> list:
+        """Zoradené pondelky -> súvislé úseky (zoznamy po sebe idúcich týždňov)."""
+        runs = []
+        for m in mondays:
+            if runs and runs[-1][-1] + timedelta(days=7) == m:
+                runs[-1].append(m)
+            else:
+                runs.append([m])
+        return runs
+
+    def _closed_weeks(self, start_dt: datetime, end_dt: datetime) -> list:
+        """Pondelky uzavretých týždňov, ktoré zasahujú do rozsahu start_dt..end_dt."""
+        today = datetime.now(tz).date()
+        monday = start_dt.astimezone(tz).date()
+        monday -= timedelta(days=monday.weekday())
+        mondays = []
+        while monday + timedelta(days=7) <= today and self._week_range(monday)[0] < end_dt:
+            mondays.append(monday)
+            monday += timedelta(days=7)
+        return mondays
+
+    # ---- stĺpce ----
+    @staticmethod
+    def _utc64(ts) -> np.datetime64:
+        """Čas s pásmom -> UTC datetime64 na porovnanie s uloženým stĺpcom timestamp."""
+        return pd.Timestamp(ts).tz_convert("UTC").tz_localize(None).to_datetime64()
+
+    @staticmethod
+    def _part(df: pd.DataFrame):
+        """
+        Pripravený DataFrame -> časť {rows, columns, arrays, categories, tz}: numpy stĺpce, kategórie ako kódy,
+        čas ako UTC datetime64. None, ak má stĺpec typu object (ten sa nedá uložiť bez pickle).
+        """
+        part = {"rows": len(df), "columns": list(df.columns), "arrays": {}, "categories": {}, "tz": {}}
+        for col in df.columns:
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                part["arrays"][col] = values.cat.codes.to_numpy()
+                part["categories"][col] = values.cat.categories.tolist()
+            elif isinstance(values.dtype, pd.DatetimeTZDtype):
+                part["arrays"][col] = values.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy()
+                part["tz"][col] = str(values.dt.tz)
+            elif values.dtype != object:
+                part["arrays"][col] = values.to_numpy()
+            else:
+                return None
+        return part
+
+    @staticmethod
+    def _part_frame(part: dict) -> pd.DataFrame:
+        """Časť -> pripravený DataFrame nad tými istými poliami (bez kopírovania)."""
+        if not part["rows"]:
+            return pd.DataFrame()
+        columns = {}
+        for col in part["columns"]:
+            values = part["arrays"][col]
+            if col in part["categories"]:
+                values = pd.Categorical.from_codes(values, pd.Index(part["categories"][col], dtype=object))
+            elif col in part["tz"]:
+                values = pd.arrays.DatetimeArray(values, dtype=pd.DatetimeTZDtype(tz=part["tz"][col]))
+            columns[col] = values
+        return pd.DataFrame(columns, copy=False)
+
+    @staticmethod
+    def _combine(parts: list, start_dt: datetime = None, end_dt: datetime = None) -> pd.DataFrame:
+        """
+        Spojí časti disjunktných rozsahov (s start_dt/end_dt len riadky start_dt <= timestamp < end_dt)
+        do DataFrame zoradeného podľa id, s použitými kategóriami zoradenými ako po astype("category"),
+        teda rovnako ako jedno načítanie celého rozsahu z DB.
+        """
+        parts = [p for p in parts if p["rows"]]
+        if not parts:
+            return pd.DataFrame()
+        first = parts[0]
+        arrays, categories = {}, {}
+        for col in first["columns"]:
+            if col in first["categories"]:
+                union = sorted(set().union(*(p["categories"][col] for p in parts)))
+                position = {value: i for i, value in enumerate(union)}
+                # kód -1 (chýbajúca hodnota) ukáže na posledný prvok lookup-u
+                arrays[col] = np.concatenate([
+                    np.array([position[v] for v in p["categories"][col]] + [-1], dtype="int32")[p["arrays"][col]]
+                    for p in parts
+                ])
+                categories[col] = union
+            else:
+                arrays[col] = np.concatenate([p["arrays"][col] for p in parts])
+
+        index = None
+        if start_dt is not None:
+            ts = arrays["timestamp"]
+            keep = (ts >= ArchivedBackend._utc64(start_dt)) & (ts < ArchivedBackend._utc64(end_dt))
+            if not keep.all():
+                index = np.flatnonzero(keep)
+        ids = arrays["id"] if index is None else arrays["id"][index]
+        if len(ids) > 1 and (np.diff(ids) < 0).any():
+            order = np.argsort(ids, kind="stable")
+            index = order if index is None else index[order]
+        if index is not None:
+            arrays = {col: values[index] for col, values in arrays.items()}
+
+        for col, union in categories.items():
+            codes = arrays[col]
+            used = np.bincount(codes[codes >= 0], minlength=len(union)) > 0
+            if not used.all():
+                remap = np.append(np.cumsum(used) - 1, -1).astype("int32")
+                arrays[col] = remap[codes]
+                categories[col] = [value for value, u in zip(union, used) if u]
+        zones = {col: {p["tz"][col] for p in parts} for col in first["tz"]}
+        return ArchivedBackend._part_frame({
+            "rows": len(arrays["id"]), "columns": first["columns"], "arrays": arrays, "categories": categories,
+            "tz": {col: names.pop() if len(names) == 1 else "UTC" for col, names in zones.items()},
+        })
+
+    # ---- súbory ----
+    def _meta(self, monday: date):
+        try:
+            with open(os.path.join(self.root, f"{monday}.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("version") == ARCHIVE_VERSION else None
+
+    def _write(self, monday: date, df: pd.DataFrame) -> bool:
+        """Uloží pripravené riadky týždňa; False, ak sa nedajú uložiť (stĺpec typu object)."""
+        part = self._part(df)
+        if part is None:
+            logger.warning("týždeň %s sa nearchivuje, niektorý stĺpec je typu object", monday)
+            return False
+        generation = datetime.now(tz).strftime("%Y%m%d%H%M%S%f")
+        meta = {"version": ARCHIVE_VERSION, "generation": generation, "rows": part["rows"],
+                "max_id": int(part["arrays"]["id"].max()) if part["rows"] else None,
+                "columns": [], "categories": part["categories"], "tz": part["tz"]}
+        with self._lock:
+            if part["rows"]:
+                offset = 0
+                with open(os.path.join(self.root, f"{monday}.{generation}.bin"), "wb") as f:
+                    for col in part["columns"]:
+                        values = np.ascontiguousarray(part["arrays"][col])
+                        meta["columns"].append({"name": col, "dtype": values.dtype.str, "offset": offset})
+                        f.write(values.tobytes())
+                        padding = -values.nbytes % self.ALIGN
+                        f.write(b"\0" * padding)
+                        offset += values.nbytes + padding
+            tmp = os.path.join(self.root, f"{monday}.json.{generation}")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp, os.path.join(self.root, f"{monday}.json"))
+            # staršie generácie; otvorené mapy v iných vláknach na Linuxe zostanú platné
+            for name in os.listdir(self.root):
+                if name.startswith(f"{monday}.") and name.endswith(".bin") and name != f"{monday}.{generation}.bin":
+                    with suppress(OSError):
+                        os.remove(os.path.join(self.root, name))
+        return True
+
+    def _read(self, monday: date, meta: dict):
+        """Časť týždňa nad namapovaným súborom, None ak súbor chýba alebo nesedí s meta."""
+        part = {"rows": meta["rows"], "columns": [c["name"] for c in meta["columns"]], "arrays": {},
+                "categories": meta["categories"], "tz": meta["tz"]}
+        if not part["rows"]:
+            return part
+        try:
+            data = np.memmap(os.path.join(self.root, f"{monday}.{meta['generation']}.bin"), dtype="uint8", mode="r")
+            for col in meta["columns"]:
+                dtype = np.dtype(col["dtype"])
+                part["arrays"][col["name"]] = data[col["offset"]:col["offset"] + part["rows"] * dtype.itemsize].view(dtype)
+        except (OSError, ValueError):
+            logger.warning("archív týždňa %s sa nedá načítať, stiahne sa znova", monday, exc_info=True)
+            return None
+        return part
+
+    def discard_archived(self, stamps):
+        """Zahodí týždne obsahujúce timestampy stamps (text z DB alebo datetime; None = celý archív)."""
+        if stamps is None:
+            prefixes = None
+        else:
+            ts = pd.to_datetime(pd.Series(list(stamps), dtype=object), errors="coerce", utc=True).dropna()
+            days = ts.dt.tz_convert(tz).dt.date
+            prefixes = {f"{d - timedelta(days=d.weekday())}." for d in days}
+            if not prefixes:
+                return
+        with self._lock:
+            # najprv meta (týždeň sa prestane čítať), potom dáta
+            names = sorted(os.listdir(self.root), key=lambda name: not name.endswith(".json"))
+            for name in names:
+                if prefixes is None or name[:11] in prefixes:
+                    with suppress(OSError):
+                        os.remove(os.path.join(self.root, name))
+
+    # ---- čítanie ----
+    def _stale(self, run: list, metas: dict) -> list:
+        """Týždne súvislého úseku, ktorých archív nesedí s DB (jeden dotaz, pri nezhode po týždňoch)."""
+        def expected(weeks):
+            ids = [metas[m]["max_id"] for m in weeks if metas[m]["max_id"] is not None]
+            return sum(metas[m]["rows"] for m in weeks), max(ids, default=None)
+
+        if tuple(self.backend.range_stats(self._week_range(run[0])[0], self._week_range(run[-1])[1])) == expected(run):
+            return []
+        if len(run) == 1:
+            return run
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            stats = list(pool.map(lambda m: tuple(self.backend.range_stats(*self._week_range(m))), run))
+        return [m for m, got in zip(run, stats) if got != expected([m])]
+
+    def _weeks(self, mondays: list) -> tuple:
+        """
+        (pondelok -> časť týždňa, počet stiahnutých riadkov); chýbajúce a zmenené týždne sa stiahnu a uložia.
+        Namiesto častí None, ak sa týždeň nedá uložiť (stĺpec typu object).
+        """
+        metas = {m: self._meta(m) for m in mondays}
+        refresh = [m for m in mondays if metas[m] is None]
+        for run in self._runs([m for m in mondays if metas[m] is not None]):
+            refresh += self._stale(run, metas)
+
+        weeks, fetched = {}, 0
+        for run in self._runs(sorted(refresh)):
+            raw = self.backend.fetch_range(self._week_range(run[0])[0], self._week_range(run[-1])[1])
+            fetched += raw.attrs["fetched_rows"]
+            df = _prepare_attendance(raw)
+            whole = self._part(df) if len(run) > 1 else None
+            for m in run:
+                week = df if whole is None else self._combine([whole], *self._week_range(m))
+                if not self._write(m, week):
+                    return None, fetched
+                metas[m] = self._meta(m)
+
+        for m in mondays:
+            weeks[m] = self._read(m, metas[m]) if metas[m] is not None else None
+            if weeks[m] is None:
+                # súbor zmizol (súbežný zápis) alebo je poškodený: týždeň priamo z DB
+                self.discard_archived([self._week_range(m)[0]])
+                raw = self.backend.fetch_range(*self._week_range(m))
+                fetched += raw.attrs["fetched_rows"]
+                weeks[m] = self._part(_prepare_attendance(raw))
+                if weeks[m] is None:
+                    return None, fetched
+        return weeks, fetched
+
+    def fetch_range(self, start_dt: datetime, end_dt: datetime, after_id=None, after_ts=None) -> pd.DataFrame:
+        mondays = [] if after_id is not None or after_ts is not None else self._closed_weeks(start_dt, end_dt)
+        if not mondays:
+            return _prepare_attendance(self.backend.fetch_range(start_dt, end_dt, after_id, after_ts))
+        with stage("archive_read", weeks=len(mondays)) as info:
+            weeks, fetched = self._weeks(mondays)
+            if weeks is None:
+                df = _prepare_attendance(self.backend.fetch_range(start_dt, end_dt))
+                info.update(rows=len(df), fetched_rows=fetched + df.attrs["fetched_rows"])
+                return df
+            parts = [weeks[m] for m in mondays]
+            rest_start = max(start_dt, self._week_range(mondays[-1])[1])
+            if rest_start < end_dt:
+                rest = self.backend.fetch_range(rest_start, end_dt)
+                fetched += rest.attrs["fetched_rows"]
+                parts.append(self._part(_prepare_attendance(rest)))
+            week_start, week_end = self._week_range(mondays[0])[0], self._week_range(mondays[-1])[1]
+            if len(parts) == 1 and start_dt <= week_start and week_end <= end_dt:
+                df = self._part_frame(parts[0])  # celý jeden týždeň priamo nad súborom
+            else:
+                df = self._combine(parts, start_dt, end_dt)
+            info.update(rows=len(df), fetched_rows=fetched)
+        df.attrs["fetched_rows"] = fetched
+        return df
+
+    def fetch_pair_aggregates(self, start_dt: datetime, end_dt: datetime) -> pd.DataFrame:
+        # s uzavretými týždňami sa páruje lokálne z archívu, inak agregácia vnoreného úložiska
+        if self._closed_weeks(start_dt, end_dt):
+            return super().fetch_pair_aggregates(start_dt, end_dt)
+        return self.backend.fetch_pair_aggregates(start_dt, end_dt)
+
+    def range_stats(self, start_dt: datetime, end_dt: datetime) -> tuple:
+        return self.backend.range_stats(start_dt, end_dt)
+
+    def day_stats(self, first: date, last: date) -> dict:
+        return self.backend.day_stats(first, last)
+
+    # ---- zápisy (dotknuté týždne sa zahodia) ----
+    def insert(self, records: list) -> list:
+        rows = self.backend.insert(records)
+        self.discard_archived([r.get("timestamp") for r in list(records) + list(rows)])
+        return rows
+
+    def update(self, record_id: int, fields: dict) -> list:
+        rows = self.backend.update(record_id, fields)
+        # bez vrátených riadkov nevieme týždeň, zahodí sa celý archív
+        self.discard_archived([r.get("timestamp") for r in rows] if rows else None)
+        return rows
+
+    def update_many(self, records: list) -> list:
+        rows = self.backend.update_many(records)
+        self.discard_archived([r.get("timestamp") for r in rows])
+        return rows
+
+    def change_feed(self):
+        return self.backend.change_feed()
+
+    def fetch_summaries(self, first: date, last: date) -> list:
+        return self.backend.fetch_summaries(first, last)
+
+    def store_summaries(self, rows: list):
+        self.backend.store_summaries(rows)
+
+    def delete_summaries(self, cells: list):
+        self.backend.delete_summaries(cells)
+
+    def connection_stats(self) -> dict:
+        return self.backend.connection_stats()
+
+def make_backend(settings) -> AttendanceBackend:
+    """
+    Úložisko podľa nastavení (st.secrets v aplikácii, premenné prostredia v CLI):
+    DATABAZA_BACKEND "supabase" (DATABAZA_URL + DATABAZA_KEY), "postgres" (DATABAZA_DSN)
+    alebo "sqlite" (DATABAZA_SQLITE = cesta k súboru, lokálna náhrada pre offline testy).
+    S DATABAZA_ARCHIVE (adresár) sa uzavreté týždne čítajú z lokálneho archívu (ArchivedBackend).
+    """
+    kind = settings.get("DATABAZA_BACKEND", "supabase")
+    if kind == "postgres":
+        backend = PostgresBackend(settings["DATABAZA_DSN"])
+    elif kind == "sqlite":
+        backend = SQLiteBackend(settings.get("DATABAZA_SQLITE", "dochadzka.sqlite"))
+    else:
+        from supabase import create_client
+
+        client = create_client(settings["DATABAZA_URL"], settings["DATABAZA_KEY"])
+        # všetky dotazy (table, rpc) idú cez client.postgrest.session -> jeden pool spojení na backend
+        client.postgrest.session = PooledHttp(client.postgrest.session)
+        backend = SupabaseBackend(client)
+    archive = settings.get("DATABAZA_ARCHIVE")
+    return ArchivedBackend(backend, archive) if archive else backend
+
+def day_number(d: date) -> int:
+    """Dátum -> hodnota stĺpca day."""
+    return (d - EPOCH_DATE).days
+
+def day_range(start: date, end: date) -> tuple:
+    """Dni start..end (vrátane) -> (start_dt, end_dt): lokálne polnoci, end_dt je exclusive."""
+    start_dt = tz.localize(datetime.combine(start, time(0, 0)))
+    return start_dt, tz.localize(datetime.combine(end + timedelta(days=1), time(0, 0)))
+
+def _stored_day_range(start: date, end: date = None) -> tuple:
+    """Dni start..end podľa času uloženého v DB (lokálny čas označený ako +00, deň ako v agregácii párov)."""
+    end = start if end is None else end
+    return (pytz.utc.localize(datetime.combine(start, time(0, 0))),
+            pytz.utc.localize(datetime.combine(end + timedelta(days=1), time(0, 0))))
+
+def _parse_timestamps(values: pd.Series) -> pd.Series:
+    """
+    Naparsuje timestampy naraz pre celý stĺpec.
+    Časy s offsetom ostávajú v pôvodnom pásme, časy bez offsetu sa lokalizujú do tz.
+    Ak pandas nevie stĺpec zjednotiť (rôzne offsety, zmiešané časy), všetko sa prevedie do UTC.
+    """
+    ts = pd.to_datetime(values, errors="coerce")
+    if isinstance(ts.dtype, pd.DatetimeTZDtype):
+        return ts
+    if pd.api.types.is_datetime64_dtype(ts.dtype):
+        return ts.dt.tz_localize(tz, ambiguous=False, nonexistent="shift_forward")
+
+    text = values.astype(str).str.strip()
+    aware = text.str.contains(r"(?:Z|[+-]\d{2}(?::?\d{2})?)$", regex=True)
+    out = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns, UTC]")
+    if aware.any():
+        out[aware] = pd.to_datetime(text[aware], errors="coerce", utc=True)
+    if (~aware).any():
+        naive = pd.to_datetime(text[~aware], errors="coerce")
+        out[~aware] = naive.dt.tz_localize(tz, ambiguous=False, nonexistent="shift_forward").dt.tz_convert("UTC")
+    return out
+
+def _prepare_attendance(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pripraví načítané záznamy (celé stĺpce naraz, bez apply po riadkoch):
+    - timestamp: tz-aware datetime,
+    - day (int32): deň podľa lokálneho času záznamu, počet dní od EPOCH_DATE (-1 pre neplatný čas),
+    - sec (int32): sekunda dňa (-1 pre neplatný čas),
+    - user_code/position/action ako category, action_code (int8) = ACTION_PRICHOD/ACTION_ODCHOD/ACTION_NONE.
+    Už pripravený DataFrame (napr. z ArchivedBackend) vráti bez zmeny.
+    """
+    if df.empty or "action_code" in df.columns:
+        return df
+    df["timestamp"] = _parse_timestamps(df["timestamp"])
+
+    wall = df["timestamp"].dt.tz_localize(None)
+    valid = wall.notna().to_numpy()
+    wall_ns = wall.to_numpy(dtype="datetime64[ns]").view("int64")
+    df["day"] = np.where(valid, wall_ns // DAY_NS, -1).astype("int32")
+    df["sec"] = np.where(valid, (wall_ns % DAY_NS) // 10**9, -1).astype("int32")
+
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype("category")
+
+    actions = df["action"].cat.categories.str.lower()
+    lookup = np.select(
+        [actions == "príchod", actions == "odchod"], [ACTION_PRICHOD, ACTION_ODCHOD], ACTION_NONE
+    ).astype("int8")
+    codes = df["action"].cat.codes.to_numpy()
+    df["action_code"] = np.where(codes >= 0, lookup[codes], ACTION_NONE).astype("int8")
+    return df
+
+def _concat_attendance(df: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """Pripojí pripravené nové záznamy k pripraveným existujúcim a zachová category stĺpce."""
+    if df.empty:
+        return delta
+    out = pd.concat([df, delta], ignore_index=True)
+    for col in CATEGORY_COLUMNS:
+        out[col] = pd.api.types.union_categoricals([df[col], delta[col]], ignore_order=True)
+    return out
+
+def _touched_cells(df: pd.DataFrame) -> set:
+    """Bunky (day, position) s aspoň jedným riadkom pripraveného DataFrame (bez neplatného času)."""
+    rows = df[df["day"] >= 0]
+    return set(zip(rows["day"].tolist(), rows["position"].astype(str).tolist()))
+
+def _merge_attendance(df: pd.DataFrame, delta: pd.DataFrame) -> tuple:
+    """
+    Zapracuje pripravené riadky delta do pripraveného df: riadok s existujúcim id nahradí, nové pripojí.
+    Riadky zhodné s už načítanými sa preskočia; ak sa nezmenilo nič, vráti pôvodný df.
+    Vráti (DataFrame zoradený podľa id, dotknuté bunky (day, position) pred aj po zmene,
+    či to nebolo len pripojenie riadkov na koniec: zmenený existujúci riadok alebo nové id
+    menšie ako doterajšie najväčšie).
+    """
+    delta = delta.drop_duplicates("id", keep="last")
+    if df.empty:
+        return delta.sort_values("id", kind="stable", ignore_index=True), _touched_cells(delta), False
+    existing = delta["id"].isin(df["id"]).to_numpy()
+    if existing.any():
+        cols = ["user_code", "timestamp"] + EDITABLE_COLUMNS
+        after = delta[existing].set_index("id")[cols].astype(object)
+        before = df.set_index("id").loc[after.index, cols].astype(object)
+        same = after.index[~(before != after).any(axis=1).to_numpy()]
+        delta = delta[~delta["id"].isin(same).to_numpy()]
+    if delta.empty:
+        return df, set(), False
+    replaced = df["id"].isin(delta["id"]).to_numpy()
+    new_ids = delta.loc[~delta["id"].isin(df["id"]).to_numpy(), "id"]
+    changed = bool(replaced.any()) or bool(len(new_ids)) and int(new_ids.min()) < int(df["id"].max())
+    touched = _touched_cells(delta) | _touched_cells(df[replaced])
+    df = df[~replaced]
+    out = _concat_attendance(df, delta)
+    if not out["id"].is_monotonic_increasing:
+        out = out.sort_values("id", kind="stable", ignore_index=True)
+    return out, touched, changed
+
+class AttendanceCache:
+    """
+    Cache načítaných rozsahov attendance, kľúčom je (start_dt, end_dt).
+    - do CACHE_REFRESH_SECONDS sa rozsah vráti priamo z pamäte,
+    - potom sa dotiahnu len nové záznamy (id > posledné id, resp. novší timestamp),
+    - po CACHE_TTL_SECONDS sa rozsah načíta celý nanovo (ak sa dáta nezmenili, ostane pôvodný DataFrame
+      aj s verziou),
+    - pri viac ako CACHE_MAX_RANGES rozsahoch sa vyhodí najdlhšie nepoužitý.
+    Vrátené DataFrame-y sú zdieľané medzi rerunmi, volajúci ich nemá meniť.
+    Pri každej zmene dát rozsahu dostane DataFrame nové df.attrs["data_version"] (zo spoločného počítadla,
+    verzie z rôznych cache sa nezhodujú, takže verzia stačí ako kľúč napr. exportu);
+    df.attrs["base_version"] sa mení len pri načítaní celého rozsahu alebo zmene existujúceho riadku
+    (doťahovanie riadky len pridáva). df.attrs["changes"] je zoznam (predchádzajúca verzia, dotknuté
+    bunky (day, position)) od posledného celého načítania.
+    apply() zapracuje zmenené riadky z ChangeFeed bez dotazu do DB.
+    S incremental=False (napr. agregované páry) sa po CACHE_REFRESH_SECONDS načíta celý rozsah znova
+    a apply() dotknuté rozsahy len zahodí.
+    Dotazy do DB bežia mimo spoločného zámku, súbežne sa čaká len na ten istý rozsah.
+    """
+
+    def __init__(self, fetch, prepare=_prepare_attendance, incremental=True,
+                 ttl=CACHE_TTL_SECONDS, refresh=CACHE_REFRESH_SECONDS, max_ranges=CACHE_MAX_RANGES):
+        self.fetch = fetch  # AttendanceBackend.fetch_range / fetch_pairs
+        self.prepare = prepare
+        self.incremental = incremental
+        self.ttl = ttl
+        self.refresh = refresh
+        self.max_ranges = max_ranges
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()  # len na čítanie a zápis _entries, nie počas dotazu do DB
+        self._key_locks = {}
+        self._generation = 0  # zvýši invalidate()/zahodenie v apply(); rozsah načítaný počas toho sa neuloží
+
+    def get(self, start_dt: datetime, end_dt: datetime, fresh=False) -> pd.DataFrame:
+        """Rozsah z cache; fresh=True ho hneď overí v DB celým načítaním (bez zmeny ostane DataFrame aj verzia)."""
+        key = (start_dt, end_dt)
+        with self._lock:
+            # [zámok, počet vlákien, ktoré ho držia alebo naň čakajú]; zámok sa zahodí až bez používateľov
+            key_lock = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+        # do DB sa ide mimo self._lock: pomalé načítanie jedného rozsahu nebrzdí ostatné rozsahy,
+        # ten istý rozsah sa z viacerých vlákien načíta len raz (key_lock)
+        try:
+            with key_lock[0]:
+                now = datetime.now(tz)
+                with self._lock:
+                    entry = self._entries.get(key)
+                    generation = self._generation
+                if entry is None or fresh or (now - entry["loaded_at"]).total_seconds() > self.ttl:
+                    df = self._load(key, entry, now, generation)
+                elif (now - entry["checked_at"]).total_seconds() > self.refresh:
+                    df = self._refresh(key, entry, now)
+                else:
+                    with self._lock:
+                        entry["fetched_rows"] = 0
+                        df = entry["df"]
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_ranges:
+                        self._entries.popitem(last=False)
+                return df
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if not key_lock[1] and self._key_locks.get(key) is key_lock:
+                    del self._key_locks[key]
+
+    def _load(self, key, expired, now, generation) -> pd.DataFrame:
+        """Celé načítanie rozsahu (prvé alebo po TTL); bez zmeny v DB ostane pôvodný DataFrame aj s verziou."""
+        df = self.fetch(*key)
+        entry = {"df": self.prepare(df), "loaded_at": now, "checked_at": now,
+                 "fetched_rows": df.attrs["fetched_rows"], "polled_id": self._max_id(df)}
+        with self._lock:
+            current = self._entries.get(key)
+            if expired is not None and current is expired and entry["df"].equals(expired["df"]):
+                entry["df"] = expired["df"]
+            else:
+                self._stamp(entry["df"])
+            # invalidate() počas načítania: výsledok môže byť starší ako zápis, do cache sa nedá
+            if self._generation == generation:
+                self._entries[key] = entry
+            return entry["df"]
+
+    def _refresh(self, key, entry, now) -> pd.DataFrame:
+        """Doťahovanie po CACHE_REFRESH_SECONDS: nové riadky (incremental) alebo celý rozsah znova."""
+        df = entry["df"]
+        if not self.incremental:
+            fresh = self.prepare(self.fetch(*key))
+        elif entry.get("polled_id") is not None:
+            # po id z DB, nie z df: riadky z apply() môžu mať vyššie id ako ešte nedotiahnuté
+            delta = self.fetch(*key, after_id=entry["polled_id"])
+        elif df.empty:
+            delta = self.fetch(*key)
+        else:
+            delta = self.fetch(*key, after_ts=df["timestamp"].max())
+        with self._lock:
+            # apply() mohol medzitým zmeniť entry["df"]; pracuje sa s aktuálnym
+            df = entry["df"]
+            if not self.incremental:
+                entry["fetched_rows"] = fresh.attrs["fetched_rows"]
+                if not fresh.equals(df):
+                    entry["df"] = fresh
+                    self._stamp(fresh)
+            else:
+                if not delta.empty:
+                    entry["polled_id"] = self._max_id(delta) or entry.get("polled_id")
+                    if "id" in df.columns or df.empty:
+                        merged, touched, changed = _merge_attendance(df, self.prepare(delta))
+                    else:
+                        merged, touched, changed = _concat_attendance(df, self.prepare(delta)), set(), False
+                    if merged is not df:
+                        entry["df"] = merged
+                        self._stamp(merged, None if changed else df.attrs.get("base_version"), df, touched)
+                entry["fetched_rows"] = delta.attrs["fetched_rows"]
+            entry["checked_at"] = now
+            return entry["df"]
+
+    def _stamp(self, df: pd.DataFrame, base_version=None, previous=None, touched=None):
+        df.attrs["data_version"] = next(_DATA_VERSIONS)
+        df.attrs["base_version"] = base_version if base_version is not None else df.attrs["data_version"]
+        if previous is None:
+            df.attrs["changes"] = []
+        else:
+            changes = previous.attrs.get("changes", []) + [(previous.attrs["data_version"], frozenset(touched))]
+            df.attrs["changes"] = changes[-CHANGE_LOG_SIZE:]
+
+    @staticmethod
+    def _max_id(df: pd.DataFrame):
+        return int(df["id"].max()) if "id" in df.columns and len(df) else None
+
+    def apply(self, delta: pd.DataFrame):
+        """
+        Zapracuje pripravené nové/zmenené riadky (napr. z ChangeFeed) do načítaných rozsahov, ktorých sa týkajú.
+        Rozsahy bez stĺpca id a pri incremental=False sa zahodia (načítajú sa pri ďalšom get()).
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                part = delta[((delta["timestamp"] >= key[0]) & (delta["timestamp"] < key[1])).to_numpy()]
+                if part.empty:
+                    continue
+                df = entry["df"]
+                if not self.incremental or "id" not in df.columns and not df.empty:
+                    del self._entries[key]
+                    self._generation += 1
+                    continue
+                merged, touched, changed = _merge_attendance(df, part)
+                if merged is not df:
+                    entry["df"] = merged
+                    self._stamp(merged, None if changed else df.attrs.get("base_version"), df, touched)
+
+    def fetched_rows(self, start_dt: datetime, end_dt: datetime) -> int:
+        """Koľko riadkov sa pre rozsah stiahlo z DB pri poslednom volaní get()."""
+        with self._lock:
+            entry = self._entries.get((start_dt, end_dt))
+            return entry["fetched_rows"] if entry else 0
+
+    def invalidate(self, ts=None):
+        """Zahodí rozsahy, ktoré obsahujú ts alebo niektorý z listu ts (bez ts zahodí všetko)."""
+        stamps = list(ts) if isinstance(ts, (list, tuple, set)) else [ts]
+        with self._lock:
+            self._generation += 1
+            if ts is None or any(t is None or pd.isna(t) for t in stamps):
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if any(k[0] <= t < k[1] for t in stamps)]:
+                del self._entries[key]
+
+# ================== ŽIVÉ ZMENY ==================
+class ChangeFeed:
+    """
+    Odber zmien tabuľky attendance v rámci procesu.
+    publish(rows) pošle nové/zmenené riadky (dict-y so stĺpcami ATTENDANCE_COLUMNS) všetkým odberateľom
+    a zobudí čakajúcich vo wait(); riadok zhodný s naposledy poslaným pre to isté id sa preskočí.
+    Sám slúži ako lokálny vydavateľ (vlastné zápisy aplikácie, testy), PostgresChangeFeed doň posiela zmeny z DB.
+    """
+
+    def __init__(self, remember=4096):
+        self.version = 0
+        self._callbacks = []
+        self._seen = OrderedDict()
+        self._remember = remember
+        self._changed = threading.Condition()
+
+    def subscribe(self, callback):
+        self._callbacks.append(callback)
+
+    def start(self):
+        return self
+
+    @staticmethod
+    def _signature(row: dict) -> tuple:
+        ts = pd.Timestamp(row.get("timestamp")) if row.get("timestamp") is not None else pd.NaT
+        return (row.get("user_code"), row.get("position"), row.get("action"),
+                ts.value if pd.notna(ts) else None, bool(row.get("valid", True)))
+
+    def publish(self, rows: list):
+        fresh = []
+        with self._changed:
+            for row in rows:
+                signature = self._signature(row)
+                if self._seen.get(row.get("id")) == signature:
+                    continue
+                self._seen[row.get("id")] = signature
+                self._seen.move_to_end(row.get("id"))
+                fresh.append(row)
+            while len(self._seen) > self._remember:
+                self._seen.popitem(last=False)
+        if not fresh:
+            return
+        for callback in list(self._callbacks):
+            try:
+                callback(fresh)
+            except Exception:
+                logger.exception("spracovanie zmien attendance zlyhalo")
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait(self, version: int, timeout: float) -> bool:
+        """Počká na zmenu po verzii version (najviac timeout sekúnd); True, ak prišla."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.version != version, timeout)
+
+class PostgresChangeFeed(ChangeFeed):
+    """
+    Zmeny z Postgres cez LISTEN/NOTIFY: trigger zo sql/attendance_notify.sql posiela každý vložený/upravený
+    riadok ako JSON na kanál CHANGE_CHANNEL, vlákno na pozadí ich publikuje.
+    """
+
+    def __init__(self, dsn: str, channel: str = CHANGE_CHANNEL):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._listen, name="attendance_feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def _listen(self):
+        import select
+        import psycopg2
+
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_session(autocommit=True)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                while True:
+                    if select.select([conn], [], [], LIVE_WAIT_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    rows = [json.loads(n.payload) for n in conn.notifies]
+                    conn.notifies.clear()
+                    self.publish(rows)
+            except Exception:
+                logger.exception("LISTEN %s zlyhal, nové pripojenie o %s s", self.channel, FEED_RETRY_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
+            sleep(FEED_RETRY_SECONDS)
+
+PAIR_KEYS = ["day", "position", "user_code"]
+PAIR_INDEX = PAIR_KEYS + ["n"]  # n = poradie páru používateľa v bunke (viac párov len pri "stream")
+PAIR_COLUMNS = ["pr", "od", "pr_count", "od_count", "order", "pr_sec", "od_sec", "mor", "aft", "hours_m", "hours_p"]
+
+def _seconds_of_day(ts: pd.Series, day=None) -> np.ndarray:
+    """
+    Sekunda dňa (float, aj so zlomkom) podľa lokálneho času timestampu; NaN pre NaT.
+    S day (hodnoty stĺpca day) sa počíta od polnoci daného dňa, odchod po polnoci má teda viac ako 86400.
+    """
+    wall = ts.dt.tz_localize(None) if isinstance(ts.dtype, pd.DatetimeTZDtype) else ts
+    ns = wall.to_numpy(dtype="datetime64[ns]").view("int64")
+    since = ns % DAY_NS if day is None else ns - np.asarray(day, dtype="int64") * DAY_NS
+    return np.where(wall.notna().to_numpy(), since / 1e9, np.nan)
+
+def pairing_range(start_dt: datetime, end_dt: datetime) -> tuple:
+    """Rozsah záznamov potrebný na páry dní start_dt..end_dt: pri "stream" s presahom PAIR_PADDING z oboch strán."""
+    if PAIRING_MODE != "stream":
+        return start_dt, end_dt
+    return start_dt - PAIR_PADDING, end_dt + PAIR_PADDING
+
+def pairing_stamps(ts) -> list:
+    """Časy zápisov (jeden alebo list), ktorých rozsahy párov treba zahodiť; pri "stream" aj ± PAIR_PADDING."""
+    stamps = list(ts) if isinstance(ts, (list, tuple, set)) else [ts]
+    if PAIRING_MODE != "stream":
+        return stamps
+    return [t if t is None or pd.isna(t) else t + shift for t in stamps for shift in (-PAIR_PADDING, timedelta(0), PAIR_PADDING)]
+
+def pair_table_from_frame(df: pd.DataFrame, first_day: int, last_day: int) -> pd.DataFrame:
+    """Tabuľka párov dní first_day..last_day z pripravených záznamov podľa PAIRING_MODE."""
+    if PAIRING_MODE == "stream":
+        return build_stream_pair_table(df, first_day, last_day)
+    return _days_slice(build_pair_table(df), first_day, last_day)
+
+def build_pair_table(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Jedným prechodom spáruje všetky načítané záznamy.
+    Vráti tabuľku s indexom (day, position, user_code, n = 0) a stĺpcami
+    pr (prvý Príchod), od (posledný Odchod), pr_count, od_count, order (poradie prvého výskytu),
+    pr_sec/od_sec (sekunda dňa) a klasifikáciou z classify_pairs (mor, aft, hours_m, hours_p).
+    """
+    if df.empty or "day" not in df.columns:
+        return _empty_pair_table()
+
+    work = df.loc[df["day"] >= 0, PAIR_KEYS + ["timestamp", "action_code"]]
+    work = work.assign(order=np.arange(len(work)))
+    table = work.groupby(PAIR_KEYS, observed=True, sort=False)["order"].min().to_frame()
+
+    pr = work[work["action_code"] == ACTION_PRICHOD].groupby(PAIR_KEYS, observed=True, sort=False)["timestamp"]
+    od = work[work["action_code"] == ACTION_ODCHOD].groupby(PAIR_KEYS, observed=True, sort=False)["timestamp"]
+    table = table.join(pr.min().rename("pr")).join(pr.size().rename("pr_count"))
+    table = table.join(od.max().rename("od")).join(od.size().rename("od_count"))
+    table[["pr_count", "od_count"]] = table[["pr_count", "od_count"]].fillna(0).astype("int64")
+    table = table.set_index(pd.Index(np.zeros(len(table), dtype="int64"), name="n"), append=True)
+    return _finish_pair_table(table)
+
+def build_stream_pair_table(df: pd.DataFrame, first_day: int = None, last_day: int = None) -> pd.DataFrame:
+    """
+    Párovanie po čase naprieč dňami (PAIRING_MODE "stream"), tabuľka v tvare ako z build_pair_table.
+    Pípnutia každého (position, user_code) sa zoradia podľa času a rozdelia na behy rovnakej akcie
+    (dvojité pípnutie, nová medzera nad MAX_PAIR_HOURS začne nový beh). Beh Príchodov sa spáruje
+    s najbližším nasledujúcim behom Odchodov (searchsorted), ak je hneď za ním a do MAX_PAIR_HOURS:
+    pr = prvý Príchod, od = posledný Odchod, počty = dĺžky behov. Pár patrí dňu príchodu
+    (bez príchodu dňu odchodu), odchod po polnoci teda ostane pri nočnej smene a viac smien
+    toho istého používateľa v jeden deň dá viac párov (n = 0, 1, ...).
+    S first_day/last_day sa vrátia len páry týchto dní; záznamy treba načítať s presahom (pairing_range).
+    """
+    if df.empty or "day" not in df.columns:
+        return _empty_pair_table()
+    work = df.loc[(df["day"] >= 0) & (df["action_code"] != ACTION_NONE), PAIR_KEYS + ["timestamp", "action_code"]]
+    if work.empty:
+        return _empty_pair_table()
+
+    positions = work["position"].astype("category").cat
+    users = work["user_code"].astype("category").cat
+    group = positions.codes.to_numpy("int64") * len(users.categories) + users.codes.to_numpy("int64")
+    ns = pd.DatetimeIndex(work["timestamp"]).asi8
+    by_time = np.lexsort((ns, group))  # stabilné: pri rovnakom čase ostáva poradie podľa id
+    group, ns = group[by_time], ns[by_time]
+    action = work["action_code"].to_numpy()[by_time]
+    day = work["day"].to_numpy("int64")[by_time]
+    order = by_time  # poradie riadku v df (podľa id)
+
+    # behy rovnakej akcie (run_start/run_end = prvé/posledné pípnutie behu)
+    max_ns = MAX_PAIR_HOURS * 3600 * 10**9
+    gap = np.diff(ns) > max_ns
+    new_run = np.r_[True, (group[1:] != group[:-1]) | (action[1:] != action[:-1]) | gap]
+    run_start = np.flatnonzero(new_run)
+    run_end = np.r_[run_start[1:], len(ns)] - 1
+    run_action = action[run_start]
+    run_order = np.minimum.reduceat(order, run_start)
+
+    # každému behu Príchodov najbližší nasledujúci beh Odchodov
+    pr_runs = np.flatnonzero(run_action == ACTION_PRICHOD)
+    od_runs = np.flatnonzero(run_action == ACTION_ODCHOD)
+    nxt = np.searchsorted(od_runs, pr_runs)
+    od_of_pr = od_runs[np.minimum(nxt, max(len(od_runs) - 1, 0))] if len(od_runs) else np.full(len(pr_runs), -1)
+    matched = (nxt < len(od_runs)) & (od_of_pr == pr_runs + 1)
+    matched[matched] = (
+        (group[run_start[od_of_pr[matched]]] == group[run_start[pr_runs[matched]]])
+        & (ns[run_end[od_of_pr[matched]]] - ns[run_start[pr_runs[matched]]] <= max_ns)
+    )
+    lone_od = np.setdiff1d(od_runs, od_of_pr[matched], assume_unique=True)
+
+    # jeden riadok na pár: beh Príchodov (+ spárovaný beh Odchodov) alebo osamelý beh Odchodov
+    has_pr = np.r_[np.ones(len(pr_runs), dtype=bool), np.zeros(len(lone_od), dtype=bool)]
+    has_od = np.r_[matched, np.ones(len(lone_od), dtype=bool)]
+    pr_run = np.r_[pr_runs, np.zeros(len(lone_od), dtype="int64")]
+    od_run = np.r_[np.where(matched, od_of_pr, 0), lone_od]
+    pr_row, od_row = run_start[pr_run], run_end[od_run]
+    cell_row = np.where(has_pr, pr_row, od_row)
+    sizes = run_end - run_start + 1
+    stamps = pd.to_datetime(ns, utc=True)
+    table = pd.DataFrame({
+        "day": day[cell_row].astype("int32"),
+        "position": pd.Categorical.from_codes(group[cell_row] // len(users.categories), categories=positions.categories),
+        "user_code": pd.Categorical.from_codes(group[cell_row] % len(users.categories), categories=users.categories),
+        "pr": pd.Series(stamps[pr_row]).where(has_pr),
+        "od": pd.Series(stamps[od_row]).where(has_od),
+        "pr_count": np.where(has_pr, sizes[pr_run], 0).astype("int64"),
+        "od_count": np.where(has_od, sizes[od_run], 0).astype("int64"),
+        "order": np.minimum(
+            np.where(has_pr, run_order[pr_run], len(ns)), np.where(has_od, run_order[od_run], len(ns))
+        ),
+    })
+    if first_day is not None:
+        table = table[(table["day"] >= first_day) & (table["day"] <= last_day)]
+    # n = poradie páru v bunke podľa času (príchod, inak odchod)
+    table = table.assign(start=table["pr"].fillna(table["od"])).sort_values(PAIR_KEYS + ["start"], kind="stable")
+    table["n"] = table.groupby(PAIR_KEYS, observed=True, sort=False).cumcount().astype("int64")
+    table["order"] = table["order"].rank(method="first").astype("int64") - 1
+    return _finish_pair_table(table.set_index(PAIR_INDEX))
+
+def _empty_pair_table() -> pd.DataFrame:
+    index = pd.MultiIndex.from_arrays([[], [], [], []], names=PAIR_INDEX)
+    return pd.DataFrame({
+        "pr": pd.Series(dtype="datetime64[ns, UTC]"), "od": pd.Series(dtype="datetime64[ns, UTC]"),
+        "pr_count": pd.Series(dtype="int64"), "od_count": pd.Series(dtype="int64"),
+        "order": pd.Series(dtype="int64"), "pr_sec": pd.Series(dtype="float64"),
+        "od_sec": pd.Series(dtype="float64"), "mor": pd.Series(dtype="int8"), "aft": pd.Series(dtype="int8"),
+        "hours_m": pd.Series(dtype="float64"), "hours_p": pd.Series(dtype="float64"),
+    }, index=index)
+
+def _finish_pair_table(table: pd.DataFrame) -> pd.DataFrame:
+    """Zoradí tabuľku párov podľa indexu a doplní pr_sec/od_sec a klasifikáciu."""
+    table = table.sort_index()
+    table["pr_sec"] = _seconds_of_day(table["pr"])
+    table["od_sec"] = _seconds_of_day(table["od"], table.index.get_level_values("day"))
+    table["mor"], table["aft"], table["hours_m"], table["hours_p"] = classify_pairs(
+        table["pr_sec"].to_numpy(), table["od_sec"].to_numpy(), is_velitel(table.index.get_level_values("position"))
+    )
+    return table[PAIR_COLUMNS]
+
+def pair_table_from_aggregates(agg: pd.DataFrame) -> pd.DataFrame:
+    """
+    Riadky agregácie z DB (PAIR_AGG_COLUMNS: day ako dátum, pr/od, počty, first_id)
+    -> tabuľka párov v rovnakom tvare ako z build_pair_table.
+    """
+    if agg.empty:
+        table = _empty_pair_table()
+        table.attrs["fetched_rows"] = 0
+        return table
+    table = pd.DataFrame({
+        "day": ((pd.to_datetime(agg["day"]) - pd.Timestamp(EPOCH_DATE)).dt.days).astype("int32"),
+        "position": agg["position"].astype("category"),
+        "user_code": agg["user_code"].astype("category"),
+        "pr": _parse_timestamps(agg["pr"]),
+        "od": _parse_timestamps(agg["od"]),
+        "pr_count": agg["pr_count"].fillna(0).astype("int64"),
+        "od_count": agg["od_count"].fillna(0).astype("int64"),
+        "order": agg["first_id"].rank(method="first").astype("int64") - 1,
+        "n": 0,
+    }).set_index(PAIR_INDEX)
+    table = _finish_pair_table(table)
+    table.attrs["fetched_rows"] = len(agg)
+    return table
+
+def _pairs_dict(table: pd.DataFrame) -> dict:
+    """
+    Riadky tabuľky párov -> dict user -> {pr, od, pr_count, od_count, user_code}.
+    Ďalšie páry toho istého používateľa v bunke (n > 0, len pri "stream") majú kľúč "user (n+1)";
+    skutočný čip je v user_code.
+    """
+    pairs = {}
+    table = table.sort_values("order")
+    users = table.index.get_level_values("user_code")
+    seq = table.index.get_level_values("n") if "n" in table.index.names else np.zeros(len(table), dtype="int64")
+    for row, user, n in zip(table.itertuples(index=False), users, seq):
+        key = user if n == 0 else f"{user} ({n + 1})"
+        pairs[key] = {"pr": row.pr, "od": row.od, "pr_count": row.pr_count, "od_count": row.od_count, "user_code": user}
+        if hasattr(row, "mor"):
+            pairs[key].update(mor=row.mor, aft=row.aft, hours_m=row.hours_m, hours_p=row.hours_p)
+    return pairs
+
+def pairs_for(pair_table: pd.DataFrame, day: int, position) -> dict:
+    """Páry pre jeden deň (hodnota day) a pozíciu, výrez z tabuľky z build_pair_table."""
+    try:
+        part = pair_table.loc[(day, position)]
+    except KeyError:
+        return {}
+    return _pairs_dict(part)
+
+def pairs_by_cell(pair_table: pd.DataFrame) -> dict:
+    """(day, position) -> páry bunky ako z pairs_for, pre všetky bunky tabuľky jedným prechodom."""
+    cells = {}
+    if pair_table.empty:
+        return cells
+    table = pair_table.reset_index()
+    table = table.sort_values(["day", "position", "order"], kind="stable", ignore_index=True)
+    table["position"] = table["position"].astype(str)
+    classified = "mor" in table.columns
+    for row in table.itertuples(index=False):
+        key = row.user_code if row.n == 0 else f"{row.user_code} ({row.n + 1})"
+        pair = {"pr": row.pr, "od": row.od, "pr_count": row.pr_count, "od_count": row.od_count,
+                "user_code": row.user_code}
+        if classified:
+            pair.update(mor=row.mor, aft=row.aft, hours_m=row.hours_m, hours_p=row.hours_p)
+        cells.setdefault((row.day, row.position), {})[key] = pair
+    return cells
+
+def collapse_pairs(pair_table: pd.DataFrame) -> pd.DataFrame:
+    """Zlúči páry cez všetky dni: index (position, user_code), pr = min, od = max, počty sa spočítajú."""
+    return pair_table.groupby(level=["position", "user_code"], observed=True).agg(
+        pr=("pr", "min"), od=("od", "max"), pr_count=("pr_count", "sum"),
+        od_count=("od_count", "sum"), order=("order", "min")
+    )
+
+def get_user_pairs(pos_day_df: pd.DataFrame):
+    """
+    Pre daný pos_day_df (záznamy pre jednu pozíciu a deň) vráti dict user-> {pr, od, pr_count, od_count}.
+    Jedna redukcia cez user_code (ako build_stream_pair_table); pre veľa buniek naraz build_pair_table + pairs_for.
+    """
+    pairs = {}
+    if pos_day_df.empty:
+        return pairs
+    ts = pos_day_df["timestamp"]
+    valid = pos_day_df["day"].to_numpy() >= 0 if "day" in pos_day_df.columns else ts.notna().to_numpy()
+    if "action_code" in pos_day_df.columns:
+        codes = pos_day_df["action_code"].to_numpy()
+    else:
+        action = pos_day_df["action"].astype(str).str.lower()
+        codes = np.select([action == "príchod", action == "odchod"], [ACTION_PRICHOD, ACTION_ODCHOD], ACTION_NONE)
+    is_pr, is_od = valid & (codes == ACTION_PRICHOD), valid & (codes == ACTION_ODCHOD)
+    users = pos_day_df["user_code"].to_numpy()[valid]
+    if not len(users):
+        return pairs
+    # jedna redukcia cez user_code (poradie prvého výskytu): prvý Príchod a posledný Odchod
+    # = prvý riadok skupiny po zoradení (user, čas), resp. (user, -čas)
+    group, uniques = pd.factorize(users)
+    stamps = pd.DatetimeIndex(ts[valid])
+    ns = stamps.asi8
+    picked = []
+    for rows, sign in ((np.flatnonzero(is_pr[valid]), 1), (np.flatnonzero(is_od[valid]), -1)):
+        rows = rows[np.lexsort((sign * ns[rows], group[rows]))]
+        first, at = np.unique(group[rows], return_index=True)
+        row = np.full(len(uniques), -1)
+        row[first] = rows[at]
+        picked.append(([stamps[r] if r >= 0 else pd.NaT for r in row.tolist()],
+                       np.bincount(group[rows], minlength=len(uniques)).tolist()))
+    (pr, pr_count), (od, od_count) = picked
+    for user, *values in zip(uniques, pr, od, pr_count, od_count):
+        pairs[user] = dict(zip(("pr", "od", "pr_count", "od_count"), values))
+    return pairs
+
+def classify_pair(pr, od, position):
+    """Klasifikuje pár pr/od podľa časov a pozície, vracia (mor_status, aft_status, hours_m, hours_p, msgs)."""
+    msgs = []
+    if (pd.isna(pr) or pr is None) and (pd.isna(od) or od is None):
+        return ("none", "none", 0.0, 0.0, msgs)
+    if pd.isna(pr) or pr is None:
+        msgs.append("missing_prichod")
+        return ("missing_pr", "none", 0.0, 0.0, msgs)
+    if pd.isna(od) or od is None:
+        msgs.append("missing_odchod")
+        return ("none", "missing_od", 0.0, 0.0, msgs)
+
+    pr_t = pr.time()
+    od_t = od.time()
+
+    # Veliteľ má špeciálne hodiny
+    if position.lower().startswith("vel"):
+        if pr_t <= time(7, 0) and (od_t >= time(21, 0) or od_t < time(2, 0)):
+            return ("R+P OK", "R+P OK", VELITEL_DOUBLE, VELITEL_DOUBLE, msgs)
+
+    # Dvojitá smena (non-veliteľ)
+    if pr_t <= time(7, 0) and (od_t >= time(21, 0) or od_t < time(2, 0)):
+        return ("R+P OK", "R+P OK", DOUBLE_SHIFT_HOURS, DOUBLE_SHIFT_HOURS, msgs)
+
+    # Ranná
+    if pr_t <= time(7, 0) and od_t <= time(15, 0):
+        return ("Ranna OK", "none", SHIFT_HOURS, 0.0, msgs)
+
+    # Poobedná
+    if pr_t >= time(13, 0) and od_t >= time(21, 0):
+        return ("none", "Poobedna OK", 0.0, SHIFT_HOURS, msgs)
+
+    msgs.append("invalid_times")
+    return ("invalid", "invalid", 0.0, 0.0, msgs)
+
+# kódy stavov z classify_pairs (STATUS_NAMES[kód] = text ako v classify_pair)
+ST_NONE, ST_MISSING_PR, ST_MISSING_OD, ST_RP, ST_RANNA, ST_POOBEDNA, ST_INVALID = range(7)
+STATUS_NAMES = np.array(["none", "missing_pr", "missing_od", "R+P OK", "Ranna OK", "Poobedna OK", "invalid"])
+H7, H13, H15, H21, H2 = 7 * 3600, 13 * 3600, 15 * 3600, 21 * 3600, 2 * 3600
+
+def is_velitel(positions) -> np.ndarray:
+    """Pre každú pozíciu True, ak ide o Veliteľa (ako position.lower().startswith("vel"))."""
+    codes, uniques = pd.factorize(pd.Index(positions))
+    flags = np.asarray(pd.Index(uniques).astype(str).str.lower().str.startswith("vel"), dtype=bool)
+    return np.append(flags, False)[codes]
+
+def classify_pairs(pr_sec, od_sec, velitel):
+    """
+    Vektorová verzia classify_pair pre celé polia naraz.
+    pr_sec/od_sec: sekunda dňa príchodu/odchodu (NaN = chýba), velitel: bool pole.
+    Vráti (mor, aft, hours_m, hours_p) – kódy ST_* (int8) a hodiny (float64), výsledky zhodné s classify_pair.
+    """
+    pr = np.asarray(pr_sec, dtype="float64")
+    od = np.asarray(od_sec, dtype="float64")
+    velitel = np.asarray(velitel, dtype=bool)
+    has_pr = ~np.isnan(pr)
+    has_od = ~np.isnan(od)
+    both = has_pr & has_od
+
+    early = both & (pr <= H7)
+    double = early & ((od >= H21) | (od < H2))
+    ranna = early & ~double & (od <= H15)
+    poobedna = both & ~double & ~ranna & (pr >= H13) & (od >= H21)
+    invalid = both & ~double & ~ranna & ~poobedna
+
+    mor = np.select(
+        [~has_pr & has_od, double, ranna, invalid], [ST_MISSING_PR, ST_RP, ST_RANNA, ST_INVALID], ST_NONE
+    ).astype("int8")
+    aft = np.select(
+        [has_pr & ~has_od, double, poobedna, invalid], [ST_MISSING_OD, ST_RP, ST_POOBEDNA, ST_INVALID], ST_NONE
+    ).astype("int8")
+    double_hours = np.where(velitel, VELITEL_DOUBLE, DOUBLE_SHIFT_HOURS)
+    hours_m = np.select([double, ranna], [double_hours, SHIFT_HOURS], 0.0)
+    hours_p = np.select([double, poobedna], [double_hours, SHIFT_HOURS], 0.0)
+    return mor, aft, hours_m, hours_p
+
+def _pair_class(pair, position):
+    """Ako classify_pair; ak má pár klasifikáciu už z build_pair_table, len ju prevezme."""
+    if "mor" not in pair:
+        return classify_pair(pair["pr"], pair["od"], position)
+    msgs = []
+    if pair["mor"] == ST_MISSING_PR:
+        msgs.append("missing_prichod")
+    elif pair["aft"] == ST_MISSING_OD:
+        msgs.append("missing_odchod")
+    elif pair["mor"] == ST_INVALID:
+        msgs.append("invalid_times")
+    return (STATUS_NAMES[pair["mor"]], STATUS_NAMES[pair["aft"]], float(pair["hours_m"]), float(pair["hours_p"]), msgs)
+
+COVERAGE_COLUMNS = ["total_hours", "morning_hours", "afternoon_hours", "earliest_sec", "latest_sec", "segments"]
+MORNING_WINDOW = (6 * 3600, 15 * 3600)     # prierez pre Čiastočnú rannú
+AFTERNOON_WINDOW = (13 * 3600, 22 * 3600)  # prierez pre Čiastočnú poobednú
+
+def sweep_coverage(start_ns, end_ns, offset_ns, groups, n_groups):
+    """
+    Sweep-line nad intervalmi (príchod, odchod) pre všetky skupiny (napr. deň+pozícia) naraz.
+    start_ns/end_ns: epoch ns (UTC), offset_ns: posun lokálneho času začiatku voči UTC, groups: kód skupiny 0..n_groups-1.
+    Intervaly s medzerou <= SWAP_WINDOW_MINUTES sa zlúčia (ako pôvodné merge_intervals).
+    Vráti (seg_group, seg_start, seg_end, per_group), kde per_group je dict polí dĺžky n_groups:
+    total_hours, morning_hours, afternoon_hours (prierez s MORNING_WINDOW/AFTERNOON_WINDOW dňa začiatku) a segments.
+    Hodiny nie sú zaokrúhlené (zaokrúhľuje coverage_for/pairs_coverage rovnako ako pôvodný kód).
+    """
+    start_ns = np.asarray(start_ns, dtype="int64")
+    end_ns = np.asarray(end_ns, dtype="int64")
+    offset_ns = np.asarray(offset_ns, dtype="int64")
+    groups = np.asarray(groups, dtype="int64")
+    per_group = {c: np.zeros(n_groups) for c in ("total_hours", "morning_hours", "afternoon_hours")}
+    per_group["segments"] = np.zeros(n_groups, dtype="int64")
+    if len(start_ns) == 0:
+        empty = np.array([], dtype="int64")
+        return empty, empty, empty, per_group
+
+    order = np.lexsort((start_ns, groups))
+    g, st_, en, off = groups[order], start_ns[order], end_ns[order], offset_ns[order]
+
+    # nový segment: prvý interval skupiny alebo medzera od doterajšieho konca > SWAP_WINDOW_MINUTES
+    run_end = pd.Series(en).groupby(g).cummax().to_numpy()
+    prev_end = np.empty_like(run_end)
+    prev_end[0] = run_end[0]
+    prev_end[1:] = run_end[:-1]
+    first = np.ones(len(g), dtype=bool)
+    first[1:] = g[1:] != g[:-1]
+    new_seg = first | (st_ - prev_end > SWAP_WINDOW_MINUTES * 60 * 10**9)
+    seg_idx = np.flatnonzero(new_seg)
+
+    seg_group = g[seg_idx]
+    seg_start = st_[seg_idx]
+    seg_end = np.maximum.reduceat(en, seg_idx)
+    hours = (seg_end - seg_start) / 1e9 / 3600
+
+    # okná v lokálnom čase dňa, v ktorom segment začal
+    day_start = (seg_start + off[seg_idx]) // DAY_NS * DAY_NS - off[seg_idx]
+    for col, (w_from, w_to) in (("morning_hours", MORNING_WINDOW), ("afternoon_hours", AFTERNOON_WINDOW)):
+        inter = np.minimum(seg_end, day_start + w_to * 10**9) - np.maximum(seg_start, day_start + w_from * 10**9)
+        np.add.at(per_group[col], seg_group, np.where(inter > 0, inter / 1e9 / 3600, 0.0))
+    np.add.at(per_group["total_hours"], seg_group, hours)
+    np.add.at(per_group["segments"], seg_group, 1)
+    return seg_group, seg_start, seg_end, per_group
+
+def _interval_arrays(pr: pd.Series, od: pd.Series):
+    """Príchody/odchody (tz-aware) -> (start_ns, end_ns, offset_ns) pre sweep_coverage."""
+    start = pd.DatetimeIndex(pr)
+    end = pd.DatetimeIndex(od)
+    wall = start.tz_localize(None) if start.tz is not None else start
+    return start.asi8, end.asi8, wall.asi8 - start.asi8
+
+def coverage_table(pair_table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Zlúčené pokrytie pre všetky (day, position) z tabuľky párov naraz (len páry s príchodom aj odchodom).
+    Index (day, position), stĺpce COVERAGE_COLUMNS; earliest_sec/latest_sec = sekunda dňa
+    najskoršieho príchodu / najneskoršieho odchodu.
+    """
+    complete = pair_table[pair_table["pr"].notna() & pair_table["od"].notna()]
+    if complete.empty:
+        index = pd.MultiIndex.from_arrays([[], []], names=["day", "position"])
+        return pd.DataFrame({c: pd.Series(dtype="float64") for c in COVERAGE_COLUMNS}, index=index)
+
+    codes, cells = pd.factorize(complete.index.droplevel(["user_code", "n"]))
+    start, end, offset = _interval_arrays(complete["pr"], complete["od"])
+    _, _, _, per_group = sweep_coverage(start, end, offset, codes, len(cells))
+    table = pd.DataFrame(per_group, index=pd.MultiIndex.from_tuples(cells, names=["day", "position"]))
+    table["earliest_sec"] = _seconds_of_day(complete["pr"].groupby(codes).min()).tolist()
+    table["latest_sec"] = _seconds_of_day(complete["od"].groupby(codes).max()).tolist()
+    return table[COVERAGE_COLUMNS].sort_index()
+
+def _rounded_coverage(cov: dict) -> dict:
+    # round() ako v pôvodnom kóde (np.round zaokrúhľuje hraničné hodnoty inak)
+    for col in ("total_hours", "morning_hours", "afternoon_hours"):
+        cov[col] = round(float(cov[col]), 2)
+    return cov
+
+def coverage_for(cov_table: pd.DataFrame, day: int, position):
+    """Pokrytie jednej bunky z coverage_table ako dict, None ak bunka nemá žiadny kompletný pár."""
+    try:
+        return _rounded_coverage(cov_table.loc[(day, position)].to_dict())
+    except KeyError:
+        return None
+
+def coverage_by_cell(cov_table: pd.DataFrame) -> dict:
+    """(day, position) -> pokrytie bunky ako z coverage_for, pre celú coverage_table naraz."""
+    rows = cov_table.reset_index()
+    rows["position"] = rows["position"].astype(str)
+    return {(row.pop("day"), row.pop("position")): _rounded_coverage(row) for row in rows.to_dict("records")}
+
+def pairs_coverage(pairs: dict):
+    """Pokrytie pre páry jednej pozície a dňa (dict z get_user_pairs/pairs_for), None ak nie je kompletný pár."""
+    complete = [(p["pr"], p["od"]) for p in pairs.values() if pd.notna(p["pr"]) and pd.notna(p["od"])]
+    if not complete:
+        return None
+    pr = pd.Series([c[0] for c in complete])
+    od = pd.Series([c[1] for c in complete])
+    start, end, offset = _interval_arrays(pr, od)
+    _, _, _, per_group = sweep_coverage(start, end, offset, np.zeros(len(start), dtype="int64"), 1)
+    cov = {c: float(per_group[c][0]) for c in ("total_hours", "morning_hours", "afternoon_hours", "segments")}
+    cov["earliest_sec"] = float(_seconds_of_day(pd.Series([pr.min()]))[0])
+    cov["latest_sec"] = float(_seconds_of_day(pd.Series([od.max()]))[0])
+    return _rounded_coverage(cov)
+
+def merge_intervals(pairs):
+    """
+    Zlúči intervaly (príchod, odchod) pre pozíciu.
+    Ak je medzera medzi intervalmi <= SWAP_WINDOW_MINUTES, spoja sa (považujeme to za swap/pokrývanie).
+    Vráti zoznam zlúčených (start, end) (timezone-aware datetimes).
+    """
+    complete = [(p["pr"], p["od"]) for p in pairs.values() if pd.notna(p["pr"]) and pd.notna(p["od"])]
+    if not complete:
+        return []
+    start, end, offset = _interval_arrays(pd.Series([c[0] for c in complete]), pd.Series([c[1] for c in complete]))
+    _, seg_start, seg_end, _ = sweep_coverage(start, end, offset, np.zeros(len(start), dtype="int64"), 1)
+    tzinfo = complete[0][0].tzinfo
+    return [(pd.Timestamp(a, tz="UTC").tz_convert(tzinfo), pd.Timestamp(b, tz="UTC").tz_convert(tzinfo))
+            for a, b in zip(seg_start, seg_end)]
+
+def summarize_position_day(pos_day_df: pd.DataFrame, position, pairs=None, coverage=None):
+    """Zhrnie jednu pozíciu za deň: ranná, poobedná, detaily.
+    Pôvodné správanie sa zachová; pokiaľ dôjde k nejakému problému/invalid, doplní sa zlúčené pokrytie (30 min).
+    Ak sú zadané pairs (napr. z pairs_for), pos_day_df sa nepoužije; coverage (z coverage_for)
+    je predpočítané pokrytie, inak sa spočíta z pairs."""
+    morning = {"status": "absent", "hours": 0.0, "detail": None}
+    afternoon = {"status": "absent", "hours": 0.0, "detail": None}
+    details = []
+
+    if pairs is None:
+        pairs = get_user_pairs(pos_day_df)
+    if not pairs:
+        return morning, afternoon, details
+
+    # preferujeme užívateľa s kompletnou R+P OK (ak existuje) — pôvodné správanie
+    rp_user = None
+    for user, pair in pairs.items():
+        role_m, role_p, h_m, h_p, msgs = _pair_class(pair, position)
+        if role_m == "R+P OK" and role_p == "R+P OK":
+            rp_user = (user, pair, h_m, h_p)
+            break
+
+    if rp_user:
+        user, pair, h_m, h_p = rp_user
+        morning = {"status": "R+P OK", "hours": h_m, "detail": f"Príchod: {pair['pr']}, Odchod: {pair['od']}"}
+        afternoon = {"status": "R+P OK", "hours": h_p, "detail": f"Príchod: {pair['pr']}, Odchod: {pair['od']}"}
+        return morning, afternoon, details
+
+    # inak skontrolujeme jednotlivcov podľa pôvodnej logiky a zbierame detaily (msgs)
+    had_invalid_or_missing = False
+    for user, pair in pairs.items():
+        role_m, role_p, h_m, h_p, msgs = _pair_class(pair, position)
+        if role_m == "Ranna OK" and morning["status"] not in ("Ranna OK", "R+P OK"):
+            morning = {"status": "Ranna OK", "hours": h_m, "detail": f"{user}: Príchod: {pair['pr']}, Odchod: {pair['od']}"}
+        if role_p == "Poobedna OK" and afternoon["status"] not in ("Poobedna OK", "R+P OK"):
+            afternoon = {"status": "Poobedna OK", "hours": h_p, "detail": f"{user}: Príchod: {pair['pr']}, Odchod: {pair['od']}"}
+
+        if msgs:
+            had_invalid_or_missing = True
+            for m in msgs:
+                details.append(f"{user}: {m} — pr:{pair['pr']} od:{pair['od']}")
+
+    # Ak všetko podľa pôvodnej logiky vyzerá OK (ráno alebo poobedie rozpoznané), nechaj tak
+    if (morning["status"] in ("Ranna OK", "R+P OK") or afternoon["status"] in ("Poobedna OK", "R+P OK")) and not had_invalid_or_missing:
+        return morning, afternoon, details
+
+    # Inak (napr. invalidy, chýbajúce odchody/príchody alebo neúplné) spravíme doplnkové overenie:
+    # zlúčime intervaly s ohľadom na SWAP_WINDOW_MINUTES a prehodnotíme pokrytie pozície
+    if coverage is None:
+        coverage = pairs_coverage(pairs)
+
+    # ak žiadne komplet intervaly, vrátime pôvodné detaily (missing/invalid)
+    if coverage is None:
+        # ponecháme pôvodné morning/afternoon a detaily
+        return morning, afternoon, details
+    total_hours = coverage["total_hours"]
+
+    # rozhodovanie podľa zlúčeného pokrytia
+    if position.lower().startswith("vel"):
+        double_threshold = VELITEL_DOUBLE
+    else:
+        double_threshold = DOUBLE_SHIFT_HOURS
+
+    e_sec = coverage["earliest_sec"]
+    l_sec = coverage["latest_sec"]
+
+    # Ak zlúčené intervaly dávajú kompletnú dvojitú smenu (napr. people swapped) -> R+P OK
+    if e_sec <= H7 and (l_sec >= H21 or l_sec < H2) and total_hours >= double_threshold - 0.01:
+        morning["status"] = "R+P OK"
+        afternoon["status"] = "R+P OK"
+        # rozdeľme hours rovnomerne (len pre report)
+        morning["hours"] = round(total_hours / 2, 2)
+        afternoon["hours"] = round(total_hours / 2, 2)
+        morning["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
+        afternoon["detail"] = morning["detail"]
+        return morning, afternoon, details
+
+    # Ak zlúčené intervaly naplnia ranné okno
+    if e_sec <= H7 and l_sec <= H15 and total_hours >= SHIFT_HOURS - 0.01:
+        morning["status"] = "Ranna OK"
+        morning["hours"] = round(total_hours, 2)
+        morning["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
+        return morning, afternoon, details
+
+    # Ak zlúčené intervaly naplnia poobedné okno
+    if e_sec >= H13 and l_sec >= H21 and total_hours >= SHIFT_HOURS - 0.01:
+        afternoon["status"] = "Poobedna OK"
+        afternoon["hours"] = round(total_hours, 2)
+        afternoon["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
+        return morning, afternoon, details
+
+    # Inak rozdelíme reálne pokrytie na rannú/poobednú podľa prierezu okien (6-15 a 13-22)
+    morning_hours = coverage["morning_hours"]
+    afternoon_hours = coverage["afternoon_hours"]
+
+    if morning_hours > 0:
+        morning["status"] = "Čiastočná"
+        morning["hours"] = morning_hours
+        morning["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
+    if afternoon_hours > 0:
+        afternoon["status"] = "Čiastočná"
+        afternoon["hours"] = afternoon_hours
+        afternoon["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
+
+    # ak žiadne okno nenaplnené, označíme absent s celkovým pokrytím
+    if morning_hours == 0 and afternoon_hours == 0:
+        morning["status"] = "absent"
+        morning["hours"] = total_hours
+        morning["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
+
+    return morning, afternoon, details
+
+def summarize_day(df_day: pd.DataFrame, target_date: date, pair_table=None, cov_table=None):
+    """Zhrnie všetky pozície pre daný deň.
+    S pair_table (z build_pair_table) sa páry len vyberú z tabuľky a df_day sa nefiltruje,
+    s cov_table (z coverage_table) sa použije predpočítané pokrytie."""
+    if pair_table is not None:
+        return summarize_cells([target_date], pair_table, cov_table)[target_date]
+    return {pos: summarize_position(df_day, target_date, pos) for pos in POSITIONS}
+
+def summarize_cells(days: list, pair_table: pd.DataFrame, cov_table=None) -> dict:
+    """
+    summarize_day pre viac dní z jednej tabuľky párov: {deň: {pozícia: výsledok}}.
+    Páry a pokrytie sa rozdelia na bunky (day, position) raz (pairs_by_cell, coverage_by_cell),
+    každá bunka je potom len vyhľadanie v dict.
+    """
+    if not days:
+        return {}
+    numbers = [day_number(d) for d in days]
+    pairs = pairs_by_cell(_days_slice(pair_table, min(numbers), max(numbers)))
+    coverage = None
+    if cov_table is not None:
+        coverage = coverage_by_cell(_days_slice(cov_table, min(numbers), max(numbers)))
+    out = {}
+    for d, day in zip(days, numbers):
+        out[d] = {}
+        for pos in POSITIONS:
+            cov = coverage.get((day, pos)) if coverage is not None else None
+            cell = pairs.get((day, pos), {})
+            out[d][pos] = _position_summary(pos, *summarize_position_day(None, pos, cell, cov), missing_actions(cell, pos))
+    return out
+
+def summarize_position(df_day: pd.DataFrame, target_date: date, pos, pair_table=None, cov_table=None) -> dict:
+    """Výsledok summarize_day pre jednu pozíciu: {morning, afternoon, details, total_hours}."""
+    if pair_table is not None:
+        day = day_number(target_date)
+        coverage = coverage_for(cov_table, day, pos) if cov_table is not None else None
+        pairs = pairs_for(pair_table, day, pos)
+    else:
+        pos_df = df_day[df_day["position"] == pos] if not df_day.empty else pd.DataFrame()
+        pairs, coverage = get_user_pairs(pos_df), None
+    return _position_summary(pos, *summarize_position_day(None, pos, pairs, coverage), missing_actions(pairs, pos))
+
+def missing_actions(pairs: dict, position) -> list:
+    """
+    Chýbajúce príchody/odchody v pároch bunky ako [{"user_code", "action"}] (ako missing_* v details
+    summarize_position_day); user_code je skutočný čip aj pre ďalší pár "user (2)" pri "stream".
+    """
+    classes = {user: _pair_class(pair, position) for user, pair in pairs.items()}
+    if any(c[0] == "R+P OK" and c[1] == "R+P OK" for c in classes.values()):
+        return []
+    missing = []
+    for user, pair in pairs.items():
+        msgs = classes[user][4]
+        for msg, action in (("missing_prichod", "Príchod"), ("missing_odchod", "Odchod")):
+            if msg in msgs:
+                missing.append({"user_code": str(pair.get("user_code", user)), "action": action})
+    return missing
+
+def _position_summary(pos, morning: dict, afternoon: dict, details: list, missing: list) -> dict:
+    if morning["status"] == "R+P OK" and afternoon["status"] == "R+P OK":
+        total = VELITEL_DOUBLE if pos.lower().startswith("vel") else DOUBLE_SHIFT_HOURS
+    elif morning["status"] in ("Ranna OK", "R+P OK") and afternoon["status"] in ("Poobedna OK", "R+P OK"):
+        total = VELITEL_DOUBLE if pos.lower().startswith("vel") else DOUBLE_SHIFT_HOURS
+    else:
+        total = morning.get("hours", 0.0) + afternoon.get("hours", 0.0)
+
+    return {
+        "morning": morning,
+        "afternoon": afternoon,
+        "details": details,
+        "missing": missing,
+        "total_hours": round(total, 2)
+    }
+
+class WeekSummary:
+    """
+    Výsledky summarize_day pre všetky dni týždňa naraz, počítané z jednej tabuľky párov
+    (z load_attendance_pairs alebo build_pair_table).
+    Páry aj pokrytie sa rozdelia na bunky (day, position) raz (summarize_cells), lookup (deň, pozícia) je O(1);
+    deň mimo týždňa sa dopočíta pri prvom prístupe.
+    So store (SummaryStore) sa uzavreté dni vezmú z uložených súhrnov. Novo spočítané sa uložia, len keď je
+    pair_table funkcia bez argumentov: volá sa až po odtlačkoch (day_stamps), hotový DataFrame (napr. z cache)
+    môže byť starší ako odtlačok a uložil by sa pod ním zastaraný výsledok.
+    Objekt je zdieľaný medzi rerunmi, nemá sa meniť zvonka.
+    """
+
+    def __init__(self, monday: date, pair_table, store=None):
+        self.monday = monday
+        self.days = [monday + timedelta(days=i) for i in range(7)]
+        stamps = store.day_stamps(self.days) if store is not None else {}
+        self._days = store.lookup(self.days, stamps) if store is not None else {}
+        loaded = callable(pair_table)
+        self.pair_table = pair_table() if loaded else pair_table
+        self.data_version = self.pair_table.attrs.get("data_version")
+        missing = [d for d in self.days if d not in self._days]
+        with stage("summarize_week", monday=monday, rows=len(self.pair_table), days=len(missing)):
+            self.coverage = coverage_table(self.pair_table)
+            computed = summarize_cells(missing, self.pair_table, self.coverage)
+        self._days.update(computed)
+        if store is not None and loaded:
+            store.store(computed, stamps)
+        self._matrix = None
+
+    def day(self, d: date) -> dict:
+        """Výsledok ako zo summarize_day: pozícia -> {morning, afternoon, details, total_hours}."""
+        if d not in self._days:
+            self._days[d] = summarize_day(None, d, self.pair_table, self.coverage)
+        return self._days[d]
+
+    def get(self, d: date, position) -> dict:
+        return self.day(d)[position]
+
+    def matrix(self) -> pd.DataFrame:
+        """Týždenný prehľad: pozície x dni, hodiny (alebo "—") a stĺpec Spolu."""
+        if self._matrix is None:
+            with stage("week_matrix", monday=self.monday):
+                self._matrix = summary_matrix(self.days, self.day)
+        return self._matrix
+
+    def day_details(self, d: date) -> pd.DataFrame:
+        """Riadky pre sheet "Denné - detail"."""
+        return pd.DataFrame(day_detail_rows(self.day(d)))
+
+    def patched(self, df: pd.DataFrame, touched) -> "WeekSummary":
+        """
+        Nová WeekSummary po zmene záznamov týždňa (df = pripravené záznamy z load_attendance, pri "stream"
+        s presahom pairing_range): páry, pokrytie aj výsledky sa prepočítajú len pre dotknuté bunky (day, position),
+        ostatné sa prevezmú. Pri "stream" sa prepočítajú aj susedné dni (páry cez polnoc).
+        """
+        if not touched:
+            return self
+        first_day = day_number(self.monday)
+        context = touched
+        if PAIRING_MODE == "stream":
+            touched = {(day + shift, pos) for day, pos in touched for shift in (-1, 0, 1)}
+            context = {(day + shift, pos) for day, pos in touched for shift in (-1, 0, 1)}
+        cells = pd.MultiIndex.from_tuples(sorted(touched), names=["day", "position"])
+
+        def in_cells(table):
+            index = table.index
+            keys = pd.MultiIndex.from_arrays(
+                [index.get_level_values("day"), index.get_level_values("position").astype(str)]
+            )
+            return keys.isin(cells)
+
+        def untouched(table):
+            return table[~in_cells(table)]
+
+        rows = pd.MultiIndex.from_arrays([df["day"], df["position"].astype(str)]).isin(
+            pd.MultiIndex.from_tuples(sorted(context), names=["day", "position"])
+        )
+        with stage("patch_week", monday=self.monday, cells=len(cells), rows=int(rows.sum())):
+            part = pair_table_from_frame(df[rows], first_day, first_day + 6)
+            part = part[in_cells(part)]
+            new = copy.copy(self)
+            new.pair_table = pd.concat([untouched(self.pair_table), part]).sort_index()
+            new.coverage = pd.concat([untouched(self.coverage), coverage_table(part)]).sort_index()
+            new._days = {d: dict(summary) for d, summary in self._days.items()}
+            new._matrix = None
+            for day, pos in touched:
+                d = EPOCH_DATE + timedelta(days=int(day))
+                if d in new._days and pos in POSITIONS:
+                    new._days[d][pos] = summarize_position(None, d, pos, new.pair_table, new.coverage)
+        return new
+
+def summary_matrix(days: list, day_summary) -> pd.DataFrame:
+    """Pozície x dni (hodiny alebo "—") a stĺpec Spolu; day_summary(d) vráti výsledok summarize_day."""
+    cols_matrix = [d.strftime("%a %d.%m") for d in days]
+    matrix = pd.DataFrame(index=POSITIONS, columns=cols_matrix)
+    for d, col in zip(days, cols_matrix):
+        summary = day_summary(d)
+        for pos in POSITIONS:
+            total = summary[pos]["total_hours"]
+            matrix.at[pos, col] = total if total > 0 else "—"
+    matrix["Spolu"] = matrix.apply(lambda row: sum(x if isinstance(x, (int, float)) else 0 for x in row), axis=1)
+    return matrix.fillna("—")
+
+def day_detail_rows(summary: dict) -> list:
+    """Riadky sheetu "Denné - detail" z výsledku summarize_day."""
+    rows = []
+    for pos, info in summary.items():
+        m = info["morning"]
+        p = info["afternoon"]
+        rows.append({
+            "position": pos,
+            "morning_status": m['status'],
+            "morning_hours": m.get('hours', 0),
+            "morning_detail": m.get('detail') or "-",
+            "afternoon_status": p['status'],
+            "afternoon_hours": p.get('hours', 0),
+            "afternoon_detail": p.get('detail') or "-",
+            "total_hours": info['total_hours']
+        })
+    return rows
+
+def _days_slice(table: pd.DataFrame, first: int, last: int) -> pd.DataFrame:
+    """Riadky tabuľky s indexom začínajúcim "day" pre dni first..last (vrátane)."""
+    day = table.index.get_level_values("day")
+    return table[(day >= first) & (day <= last)]
+
+def summarize_days(days: list, pair_table: pd.DataFrame, cov_table: pd.DataFrame) -> dict:
+    """summarize_day pre viac dní (jeden kus reportu; beží aj v inom procese)."""
+    return summarize_cells(days, pair_table, cov_table)
+
+def report_chunks(start: date, end: date) -> list:
+    """Rozdelí dni start..end (vrátane) na kusy po týždňoch (pondelok-nedeľa)."""
+    chunks, chunk = [], []
+    d = start
+    while d <= end:
+        chunk.append(d)
+        if d.weekday() == 6:
+            chunks.append(chunk)
+            chunk = []
+        d += timedelta(days=1)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def parallel_map(fn, args_list: list, workers=REPORT_WORKERS, processes=False) -> list:
+    """
+    [fn(*args) for args in args_list] vo vláknach; s processes=True v procesoch (fork), aby Python časť
+    bežala na viacerých jadrách. Procesy len z jednovláknového programu (CLI): fork vo viacvláknovom
+    Streamlit serveri by zdedil zámky držané inými vláknami (cache, HTTP pool, logging) a mohol zamrznúť.
+    Keď sa fn nedá poslať do procesu alebo fork na platforme nie je, použijú sa vlákna.
+    V aplikácii stačia vlákna (merané na ročnom reporte, 52 týždňov, 20-60 strážnikov, 1 jadro):
+    summarize_days za celý rok trvá spolu 0.45-0.65 s, spawn pool s 8 procesmi len naštartuje 7-8 s
+    (import pandas v každom procese) a aj ponechaný pool potrebuje 0.76-0.9 s (prenos tabuliek do procesov).
+    Ani dokonalé rozdelenie na 8 jadier by neušetrilo viac ako ~0.6 s; uzavreté dni navyše idú zo SummaryStore.
+    """
+    if processes and len(args_list) > 1 and workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(args_list)),
+                                     mp_context=multiprocessing.get_context("fork")) as pool:
+                return list(pool.map(fn, *zip(*args_list)))
+        except (ValueError, AttributeError, pickle.PicklingError, BrokenProcessPool, OSError):
+            pass
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(args_list)))) as pool:
+        return list(pool.map(fn, *zip(*args_list))) if args_list else []
+
+
+class RangeReport:
+    """
+    Report za obdobie start..end (vrátane): summarize_day pre každý deň, počítané po týždňoch paralelne
+    z jednej tabuľky párov (load_attendance_pairs za celé obdobie).
+    So store (SummaryStore) sa počítajú len dni bez platného uloženého súhrnu.
+    pair_table môže byť aj funkcia bez argumentov: páry sa načítajú až vtedy, keď treba niečo spočítať
+    (alebo pri prístupe k report.pair_table), report z uložených súhrnov ich nenačíta vôbec. Spočítané dni
+    sa uložia len s takou funkciou: volá sa až po odtlačkoch, hotový DataFrame môže byť starší (ako WeekSummary).
+    processes=True (len CLI) počíta týždne v procesoch, inak vo vláknach (pozri parallel_map).
+    """
+
+    def __init__(self, start: date, end: date, pair_table, store=None, processes=False):
+        self.start = start
+        self.processes = processes
+        self.end = end
+        self._pairs = pair_table
+        loaded = callable(pair_table)
+        self.chunks = report_chunks(start, end)
+        self.days = [d for chunk in self.chunks for d in chunk]
+        stamps = store.day_stamps(self.days) if store is not None else {}
+        self._days = store.lookup(self.days, stamps) if store is not None else {}
+        computed = {}
+        if len(self._days) < len(self.days):
+            pair_table = self.pair_table
+            with stage("summarize_range", start=start, end=end, rows=len(pair_table)) as info:
+                computed = self._summarize(pair_table)
+                info.update(chunks=len(self.chunks), days=len(computed))
+        self._days.update(computed)
+        if store is not None and loaded:
+            store.store(computed, stamps)
+        self._matrix = None
+
+    @property
+    def pair_table(self) -> pd.DataFrame:
+        if callable(self._pairs):
+            self._pairs = self._pairs()
+        return self._pairs
+
+    def _summarize(self, pair_table: pd.DataFrame) -> dict:
+        """summarize_day pre dni bez uloženého súhrnu, po týždňoch (kusy z report_chunks) paralelne."""
+        chunks = [[d for d in chunk if d not in self._days] for chunk in self.chunks]
+        chunks = [chunk for chunk in chunks if chunk]
+        if not chunks:
+            return {}
+        self.coverage = coverage_table(pair_table)
+        args = [
+            (chunk,
+             _days_slice(pair_table, day_number(chunk[0]), day_number(chunk[-1])),
+             _days_slice(self.coverage, day_number(chunk[0]), day_number(chunk[-1])))
+            for chunk in chunks
+        ]
+        computed = {}
+        for result in parallel_map(summarize_days, args, processes=self.processes):
+            computed.update(result)
+        return computed
+
+    @property
+    def mondays(self) -> list:
+        """Pondelky týždňov, ktoré obdobie zasahuje (pre rozpis čipov)."""
+        return [chunk[0] - timedelta(days=chunk[0].weekday()) for chunk in self.chunks]
+
+    def day(self, d: date) -> dict:
+        return self._days[d]
+
+    def matrix(self) -> pd.DataFrame:
+        """Pozície x všetky dni obdobia a stĺpec Spolu (rovnaký formát ako týždenný prehľad)."""
+        if self._matrix is None:
+            with stage("range_matrix", start=self.start, end=self.end):
+                self._matrix = summary_matrix(self.days, self.day)
+        return self._matrix
+
+    def day_details(self) -> pd.DataFrame:
+        """Riadky sheetu "Denné - detail" pre všetky dni obdobia (so stĺpcom date)."""
+        rows = [{"date": d, **row} for d in self.days for row in day_detail_rows(self.day(d))]
+        return pd.DataFrame(rows)
+
+# ================== ULOŽENÉ SÚHRNY ==================
+def _plain(value):
+    """Výsledok summarize_position ako čisté JSON typy (numpy skaláry -> Python)."""
+    return json.loads(json.dumps(value, default=lambda o: o.item() if hasattr(o, "item") else str(o)))
+
+class SummaryStore:
+    """
+    Uložené výsledky summarize_day pre uzavreté dni (tabuľka SUMMARY_TABLE, jeden riadok na deň + pozíciu).
+    Uložený výsledok sa použije len pri rovnakej SUMMARY_VERSION a rovnakom odtlačku dňa (day_stamps:
+    počet a najväčšie id záznamov dňa, jeden dotaz day_stats na celé obdobie), takže lookup nepotrebuje páry
+    a riadok pridaný mimo aplikácie prepočíta len svoj deň. Zápisy cez aplikáciu dotknuté bunky rovno mažú (invalidate).
+    S writable=False sa súhrny len čítajú. Ak tabuľka v DB nie je, store sa vypne a všetko sa počíta ako predtým.
+    """
+
+    def __init__(self, backend: AttendanceBackend, writable=True):
+        self.backend = backend
+        self.writable = writable
+        self.enabled = True
+
+    def _call(self, fn, *args):
+        if not self.enabled:
+            return None
+        try:
+            return fn(*args)
+        except Exception:
+            logger.warning("tabuľka %s nie je dostupná, súhrny sa nebudú ukladať", SUMMARY_TABLE, exc_info=True)
+            self.enabled = False
+            return None
+
+    def day_stamps(self, days: list) -> dict:
+        """
+        Uzavretý deň z days -> "počet:najväčšie id" jeho záznamov; pri "stream" aj predchádzajúceho a nasledujúceho
+        dňa (pár cez polnoc, PAIR_PADDING je kratší ako deň). Záznam iného dňa odtlačok nezmení, uzavretý deň
+        ostane platný aj pri nových pípnutiach v bežiacom týždni. Volať pred načítaním párov, z ktorých sa
+        výsledky uložia: odtlačok je potom najviac taký nový ako dáta.
+        """
+        today = datetime.now(tz).date()
+        closed = sorted(d for d in days if d < today)
+        if not closed or not self.enabled:
+            return {}
+        shifts = (-1, 0, 1) if PAIRING_MODE == "stream" else (0,)
+        first, last = closed[0] + timedelta(days=shifts[0]), closed[-1] + timedelta(days=shifts[-1])
+        with stage("summary_stamps", days=len(closed)):
+            stats = self._call(self.backend.day_stats, first, last)
+        if stats is None:
+            return {}
+
+        def stamp(d):
+            rows, max_id = stats.get(d, (0, None))
+            return f"{rows}:{max_id}"
+
+        return {d: "|".join(stamp(d + timedelta(days=shift)) for shift in shifts) for d in closed}
+
+    def lookup(self, days: list, stamps: dict) -> dict:
+        """Deň -> výsledok ako zo summarize_day pre uzavreté dni, ktoré majú platné uložené všetky POSITIONS."""
+        closed = [d for d in days if d in stamps]
+        if not closed:
+            return {}
+        with stage("summary_lookup", days=len(closed)) as info:
+            rows = self._call(self.backend.fetch_summaries, min(closed), max(closed)) or []
+            stored = {}
+            for row in rows:
+                d = date.fromisoformat(str(row["day"])[:10])
+                if row["version"] == SUMMARY_VERSION and row["fingerprint"] == stamps.get(d):
+                    result = row["result"]
+                    stored.setdefault(d, {})[row["position"]] = json.loads(result) if isinstance(result, str) else result
+            found = {d: {pos: stored[d][pos] for pos in POSITIONS}
+                     for d in closed if d in stored and all(pos in stored[d] for pos in POSITIONS)}
+            info.update(rows=len(rows), hit_days=len(found))
+        return found
+
+    def store(self, results: dict, stamps: dict):
+        """Zapíše výsledky summarize_day (deň -> výsledok) pre uzavreté dni s odtlačkom z day_stamps."""
+        closed = {d: summary for d, summary in results.items() if d in stamps}
+        if not closed or not self.enabled or not self.writable:
+            return
+        rows = [
+            {
+                "day": d, "position": pos, "version": SUMMARY_VERSION,
+                "fingerprint": stamps[d],
+                "morning_status": summary[pos]["morning"]["status"],
+                "afternoon_status": summary[pos]["afternoon"]["status"],
+                "total_hours": float(summary[pos]["total_hours"]),
+                "result": _plain(summary[pos]),
+            }
+            for d, summary in closed.items() for pos in POSITIONS
+        ]
+        with stage("summary_store", rows=len(rows)):
+            self._call(self.backend.store_summaries, rows)
+
+    def invalidate(self, cells):
+        """Zmaže uložené súhrny buniek (deň: date, pozícia)."""
+        cells = sorted(set(cells))
+        if cells:
+            self._call(self.backend.delete_summaries, cells)
+
+def summary_cells(rows: list, all_positions: bool = False) -> set:
+    """Bunky (deň, pozícia) zapísaných riadkov attendance; s all_positions všetky POSITIONS dotknutých dní."""
+    cells = set()
+    for row in rows:
+        ts = pd.to_datetime(row.get("timestamp"), errors="coerce", utc=True)
+        if pd.isna(ts):
+            continue
+        # deň podľa času uloženého v DB (lokálny čas označený ako +00), ako v _prepare_attendance
+        d = ts.date()
+        # pri "stream" môže zápis zmeniť aj pár susedného dňa (smena cez polnoc)
+        days = [d + timedelta(days=shift) for shift in (-1, 0, 1)] if PAIRING_MODE == "stream" else [d]
+        positions = POSITIONS if all_positions else [row.get("position")]
+        cells.update((day, pos) for day in days for pos in positions)
+    return cells
+
+ANOMALY_COLUMNS = ["typ", "user_code", "position", "date", "detail"]
+
+class AnomalyIndex:
+    """
+    Anomálie v rozsahu, udržiavané priebežne podľa nových riadkov z AttendanceCache:
+    - počet: (deň, pozícia, user) s pr_count != 1 alebo od_count != 1; jediný príchod bez odchodu sa ukáže
+      až po MAX_PAIR_HOURS (dovtedy je to prebiehajúca smena),
+    - dvojité pípnutie: rovnaká akcia toho istého čipu do DOUBLE_TAP_SECONDS,
+    - prekrývanie: ten istý čip má v jeden deň prekrývajúce sa smeny na dvoch pozíciách.
+    Index je po používateľoch (zoradené pípnutia + bunky dní), pri nových riadkoch sa prepočítajú
+    len dotknutí používatelia. Po novom načítaní celého rozsahu v cache (iné df.attrs["base_version"],
+    napr. po úprave záznamu) sa index postaví nanovo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.seen_rows = 0
+        self.base_version = None
+        self.cells = {}       # (day, position, user) -> [pr_count, od_count, pr_min_ns, od_max_ns]
+        self.user_cells = {}  # user -> {(day, position)}
+        self.taps = {}        # user -> {"ts", "action", "position", "id"} zoradené podľa času
+        self.anomalies = {}   # user -> [(riadok ANOMALY_COLUMNS, od kedy platí: ns lokálneho času alebo None)]
+
+    def refresh(self, df: pd.DataFrame) -> bool:
+        """Zapracuje riadky df (výstup load_attendance), ktoré index ešte nevidel. Vráti True, ak sa niečo zmenilo."""
+        with self._lock:
+            if df.empty or "id" not in df.columns:
+                changed = self.seen_rows > 0
+                self._reset()
+                return changed
+            base_version = df.attrs.get("base_version")
+            appended = base_version is not None and base_version == self.base_version and len(df) >= self.seen_rows
+            if not appended:
+                self._reset()
+            if len(df) == self.seen_rows:
+                return False
+            with stage("anomaly_index", rows=len(df) - self.seen_rows, rebuild=not appended):
+                self._add(df.iloc[self.seen_rows:])
+            self.seen_rows = len(df)
+            self.base_version = base_version
+            return True
+
+    def _add(self, delta: pd.DataFrame):
+        delta = delta[(delta["day"] >= 0) & (delta["action_code"] != ACTION_NONE)]
+        if delta.empty:
+            return
+        wall = delta["timestamp"].dt.tz_localize(None).to_numpy(dtype="datetime64[ns]").view("int64")
+        delta = delta.assign(ns=wall)
+
+        # bunky (deň, pozícia, user): počty a krajné časy
+        pr = delta[delta["action_code"] == ACTION_PRICHOD].groupby(PAIR_KEYS, observed=True)["ns"].agg(["size", "min"])
+        od = delta[delta["action_code"] == ACTION_ODCHOD].groupby(PAIR_KEYS, observed=True)["ns"].agg(["size", "max"])
+        for (day, pos, user), (n, first) in zip(pr.index, pr.to_numpy()):
+            cell = self.cells.setdefault((day, pos, user), [0, 0, None, None])
+            cell[0] += int(n)
+            cell[2] = int(first) if cell[2] is None else min(cell[2], int(first))
+            self.user_cells.setdefault(user, set()).add((day, pos))
+        for (day, pos, user), (n, last) in zip(od.index, od.to_numpy()):
+            cell = self.cells.setdefault((day, pos, user), [0, 0, None, None])
+            cell[1] += int(n)
+            cell[3] = int(last) if cell[3] is None else max(cell[3], int(last))
+            self.user_cells.setdefault(user, set()).add((day, pos))
+
+        # pípnutia po používateľoch, zoradené podľa času
+        for user, rows in delta.groupby("user_code", observed=True, sort=False):
+            new = {
+                "ts": rows["ns"].to_numpy(),
+                "action": rows["action_code"].to_numpy(),
+                "position": rows["position"].astype(str).to_numpy(dtype=object),
+                "id": rows["id"].to_numpy(),
+            }
+            old = self.taps.get(user)
+            if old is not None:
+                new = {k: np.concatenate([old[k], new[k]]) for k in new}
+            order = np.lexsort((new["id"], new["ts"]))
+            self.taps[user] = {k: v[order] for k, v in new.items()}
+            self.anomalies[user] = self._user_anomalies(user)
+
+    def _user_anomalies(self, user) -> list:
+        out = []
+        intervals = []
+        for day, pos in sorted(self.user_cells.get(user, ())):
+            pr_count, od_count, pr_ns, od_ns = self.cells[(day, pos, user)]
+            d = EPOCH_DATE + timedelta(days=int(day))
+            if pr_count != 1 or od_count != 1:
+                # otvorená smena (jeden príchod, zatiaľ bez odchodu) je anomália až po MAX_PAIR_HOURS
+                open_until = pr_ns + MAX_PAIR_HOURS * 3600 * 10**9 if (pr_count, od_count) == (1, 0) else None
+                out.append((["počet", user, pos, d, f"príchody: {pr_count}, odchody: {od_count}"], open_until))
+            if pr_ns is not None and od_ns is not None and pr_ns < od_ns:
+                intervals.append((pr_ns, od_ns, pos, d))
+
+        taps = self.taps[user]
+        for action, name in ((ACTION_PRICHOD, "Príchod"), (ACTION_ODCHOD, "Odchod")):
+            idx = np.flatnonzero(taps["action"] == action)
+            gaps = np.diff(taps["ts"][idx])
+            for i in np.flatnonzero(gaps <= DOUBLE_TAP_SECONDS * 10**9):
+                a, b = idx[i], idx[i + 1]
+                when = pd.Timestamp(int(taps["ts"][a]))
+                out.append((["dvojité pípnutie", user, taps["position"][b], when.date(),
+                             f"{name} {when:%H:%M:%S} + {gaps[i] / 1e9:.0f} s (id {taps['id'][a]}, {taps['id'][b]})"], None))
+
+        intervals.sort()
+        for (s1, e1, p1, d1), (s2, e2, p2, d2) in zip(intervals, intervals[1:]):
+            if s2 < e1 and p1 != p2:
+                out.append((["prekrývanie", user, f"{p1} / {p2}", d2,
+                             f"{pd.Timestamp(s1):%H:%M}–{pd.Timestamp(e1):%H:%M} a {pd.Timestamp(s2):%H:%M}–{pd.Timestamp(e2):%H:%M}"], None))
+        return out
+
+    def _current(self) -> dict:
+        """user -> riadky anomálií platné teraz (bez prebiehajúcich smien); volať pod self._lock."""
+        now = pd.Timestamp(datetime.now(tz).replace(tzinfo=None)).value
+        current = {}
+        for user, user_rows in self.anomalies.items():
+            rows = [row for row, since in user_rows if since is None or since <= now]
+            if rows:
+                current[user] = rows
+        return current
+
+    def table(self) -> pd.DataFrame:
+        """Všetky anomálie (ANOMALY_COLUMNS), zoradené podľa dňa a používateľa."""
+        with self._lock:
+            rows = [row for user_rows in self._current().values() for row in user_rows]
+        return pd.DataFrame(rows, columns=ANOMALY_COLUMNS).sort_values(["date", "user_code", "typ"], ignore_index=True)
+
+    def users(self) -> list:
+        with self._lock:
+            return sorted(self._current())
+
+    def user_taps(self, user) -> pd.DataFrame:
+        """Detail používateľa: všetky jeho pípnutia v rozsahu, zoradené podľa času."""
+        with self._lock:
+            taps = self.taps.get(user)
+            if taps is None:
+                return pd.DataFrame(columns=["id", "timestamp", "position", "action"])
+            return pd.DataFrame({
+                "id": taps["id"],
+                "timestamp": pd.to_datetime(taps["ts"]),
+                "position": taps["position"],
+                "action": np.where(taps["action"] == ACTION_PRICHOD, "Príchod", "Odchod"),
+            })
+
+LEDGER_COLUMNS = ["date", "user_code", "position", "shift", "hours", "worked_hours", "pr", "od"]
+LEDGER_TOTAL_COLUMNS = ["days", "shifts", "hours", "worked_hours", "issues"]
+LEDGER_KEY_SPAN = 1 << 32  # kľúč riadku = index usera * LEDGER_KEY_SPAN + day
+
+class GuardLedger:
+    """
+    Hodiny po čipoch (user_code) z tabuľky párov, jeden riadok (LEDGER_COLUMNS) na pár:
+    hours podľa klasifikácie páru (ranná/poobedná SHIFT_HOURS, R+P DOUBLE_SHIFT_HOURS alebo VELITEL_DOUBLE,
+    neúplný alebo neplatný pár 0, počíta sa do issues), worked_hours = skutočný čas od príchodu po odchod.
+    Riadky sú zoradené podľa (user, deň) s prefixovými súčtami, súčty za ľubovoľný rozsah sú
+    dva searchsorted a rozdiel súčtov, bez prechádzania riadkov.
+    """
+
+    def __init__(self, pair_table: pd.DataFrame):
+        self.data_version = pair_table.attrs.get("data_version")
+        with stage("guard_ledger", rows=len(pair_table)):
+            index = pair_table.index
+            self.user_codes, user_idx = np.unique(
+                np.asarray(index.get_level_values("user_code").astype(str), dtype=str), return_inverse=True
+            )
+            day = index.get_level_values("day").to_numpy("int64")
+            mor, aft = pair_table["mor"].to_numpy(), pair_table["aft"].to_numpy()
+            double = (mor == ST_RP) & (aft == ST_RP)
+            hours = np.where(double, pair_table["hours_m"], pair_table["hours_m"] + pair_table["hours_p"])
+            worked = ((pair_table["od"] - pair_table["pr"]).dt.total_seconds() / 3600).fillna(0.0).to_numpy()
+            shift = np.select(
+                [double, mor == ST_RANNA, aft == ST_POOBEDNA, mor == ST_MISSING_PR, aft == ST_MISSING_OD],
+                ["R+P", "Ranná", "Poobedná", "chýba príchod", "chýba odchod"], "neplatná"
+            )
+
+            order = np.lexsort((day, user_idx))  # stabilné: v rámci dňa ostáva poradie tabuľky párov
+            self._key = user_idx[order] * LEDGER_KEY_SPAN + day[order]
+            self._hours = np.r_[0.0, np.cumsum(hours[order])]
+            self._worked = np.r_[0.0, np.cumsum(worked[order])]
+            self._issues = np.r_[0, np.cumsum(hours[order] == 0)]
+            new_day = np.ones(len(self._key), dtype=bool)
+            new_day[1:] = self._key[1:] != self._key[:-1]
+            self._days = np.r_[0, np.cumsum(new_day)]
+            self.rows = pd.DataFrame({
+                "date": [EPOCH_DATE + timedelta(days=int(d)) for d in day[order]],
+                "user_code": self.user_codes[user_idx[order]],
+                "position": index.get_level_values("position").astype(str).to_numpy()[order],
+                "shift": shift[order],
+                "hours": hours[order],
+                "worked_hours": np.round(worked[order], 2),
+                "pr": pair_table["pr"].to_numpy()[order],
+                "od": pair_table["od"].to_numpy()[order],
+            }, columns=LEDGER_COLUMNS)
+
+    def users(self) -> list:
+        return self.user_codes.tolist()
+
+    def _bounds(self, user_idx: np.ndarray, first: date, last: date) -> tuple:
+        """Rozsahy riadkov [lo, hi) pre indexy userov a dni first..last (vrátane)."""
+        base = user_idx.astype("int64") * LEDGER_KEY_SPAN
+        lo = np.searchsorted(self._key, base + day_number(first), side="left")
+        hi = np.searchsorted(self._key, base + day_number(last), side="right")
+        return lo, hi
+
+    def totals(self, first: date, last: date, users=None) -> pd.DataFrame:
+        """
+        Súčty za dni first..last (vrátane) po čipoch (index user_code, stĺpce LEDGER_TOTAL_COLUMNS):
+        dni s aspoň jedným párom, páry, hodiny, odpracované hodiny a neúplné/neplatné páry.
+        Bez users všetky čipy s aspoň jedným párom v rozsahu.
+        """
+        if users is None:
+            user_idx = np.arange(len(self.user_codes))
+        else:
+            wanted = np.asarray(users, dtype=str)
+            user_idx = np.searchsorted(self.user_codes, wanted)
+            known = user_idx < len(self.user_codes)
+            known[known] = self.user_codes[user_idx[known]] == wanted[known]
+            user_idx = user_idx[known]  # neznáme čipy sa vynechajú
+        lo, hi = self._bounds(user_idx, first, last)
+        table = pd.DataFrame({
+            "days": self._days[hi] - self._days[lo],
+            "shifts": hi - lo,
+            "hours": np.round(self._hours[hi] - self._hours[lo], 2),
+            "worked_hours": np.round(self._worked[hi] - self._worked[lo], 2),
+            "issues": self._issues[hi] - self._issues[lo],
+        }, index=pd.Index(self.user_codes[user_idx], name="user_code"), columns=LEDGER_TOTAL_COLUMNS)
+        return table[table["shifts"] > 0] if users is None else table
+
+    def user_days(self, user, first: date, last: date) -> pd.DataFrame:
+        """Páry čipu user za dni first..last (vrátane), zoradené podľa dňa."""
+        i = np.searchsorted(self.user_codes, str(user))
+        if i >= len(self.user_codes) or self.user_codes[i] != str(user):
+            return self.rows.iloc[:0]
+        lo, hi = self._bounds(np.array([i]), first, last)
+        return self.rows.iloc[lo[0]:hi[0]].reset_index(drop=True)
+
+ATTENDANCE_ACTIONS = ("Príchod", "Odchod")
+
+def _attendance_timestamp(now=None) -> datetime:
+    """Čas záznamu; ak je sekundová a mikrosekundová časť nulová, doplní sa aktuálny čas."""
+    if not now:
+        now = datetime.now(tz)
+    if now.second == 0 and now.microsecond == 0:
+        current = datetime.now(tz)
+        now = now.replace(second=current.second, microsecond=current.microsecond)
+    return now
+
+def insert_attendance_batch(backend: AttendanceBackend, records, store=None) -> tuple:
+    """
+    Uloží viac príchodov/odchodov naraz jedným insertom; neplatné riadky sa neuložia, ostatné áno.
+    records: (user_code, position, action, timestamp) alebo dict s rovnakými kľúčmi; timestamp môže byť None (teraz).
+    So store (SummaryStore) sa zmažú uložené súhrny dotknutých buniek.
+    Vráti (výsledok pre každý riadok v poradí vstupu {"ok": bool, "id": id alebo None, "error": text alebo None},
+    riadky vrátené z DB, časy uložených riadkov ako ich uvidia dotazy na rozsah).
+    """
+    results, payload, stamps, slots = [], [], [], []
+    for rec in records:
+        if isinstance(rec, dict):
+            user_code, position, action, now = (rec.get(k) for k in ("user_code", "position", "action", "timestamp"))
+        else:
+            user_code, position, action, now = rec
+        user_code = (user_code or "").strip()
+        if not user_code:
+            error = "chýba user_code"
+        elif position not in POSITIONS:
+            error = f"neznáma pozícia: {position}"
+        elif action not in ATTENDANCE_ACTIONS:
+            error = f"neznáma akcia: {action}"
+        else:
+            error = None
+        results.append({"ok": False, "id": None, "error": error})
+        if error:
+            continue
+
+        now = _attendance_timestamp(now)
+        # uložíme v tvare: 2025-10-14 13:46:13.972178+00
+        payload.append({
+            "user_code": user_code,
+            "position": position,
+            "action": action,
+            "timestamp": now.strftime("%Y-%m-%d %H:%M:%S.%f") + "+00",
+            "valid": True
+        })
+        # DB dostane lokálny čas označený ako +00, takto ho aj uvidia dotazy na rozsah
+        stamps.append(now.replace(tzinfo=pytz.utc))
+        slots.append(len(results) - 1)
+
+    if not payload:
+        return results, [], []
+    with stage("save_attendance_batch", rows=len(payload)):
+        inserted = backend.insert(payload)
+    if store is not None:
+        store.invalidate(summary_cells(payload))
+    for i, slot in enumerate(slots):
+        results[slot].update(ok=True, id=inserted[i].get("id") if i < len(inserted) else None)
+    return results, inserted, stamps
+
+
+def attendance_edit_frame(df: pd.DataFrame, day=None, positions=None, user_code: str = "") -> pd.DataFrame:
+    """Záznamy na hromadnú úpravu (ATTENDANCE_COLUMNS, timestamp ako ISO text), voliteľne filtrované."""
+    if df.empty:
+        return pd.DataFrame(columns=ATTENDANCE_COLUMNS)
+    mask = np.ones(len(df), dtype=bool)
+    if day is not None:
+        mask &= (df["day"] == day_number(day)).to_numpy()
+    if positions:
+        mask &= df["position"].isin(positions).to_numpy()
+    if user_code.strip():
+        mask &= (df["user_code"].astype(str).str.strip() == user_code.strip()).to_numpy()
+    out = raw_export_frame(df[mask]).sort_values(["position", "timestamp"], kind="stable")
+    for col in ("user_code", "position", "action"):
+        out[col] = out[col].astype(object)
+    out["valid"] = out["valid"].astype(bool)
+    return out.reset_index(drop=True)
+
+def attendance_changes(original: pd.DataFrame, edited: pd.DataFrame) -> list:
+    """Celé riadky z edited, v ktorých sa oproti original zmenila niektorá z EDITABLE_COLUMNS."""
+    if original.empty:
+        return []
+    before = original.set_index("id")[EDITABLE_COLUMNS]
+    after = edited.set_index("id")[EDITABLE_COLUMNS].reindex(before.index)
+    changed = (before.astype(object) != after.astype(object)).any(axis=1)
+    rows = edited.set_index("id").loc[changed[changed].index].reset_index()
+    return rows[ATTENDANCE_COLUMNS].to_dict("records")
+
+# doplnkové smeny: (príchod, odchod) pre doplnenú rannú / poobednú
+SUPPLEMENT_SHIFTS = {
+    "ranná": (time(6, 0, 0, 123456), time(14, 0, 0, 654321)),
+    "poobedná": (time(14, 0, 0, 234567), time(22, 0, 0, 987654)),
+}
+
+def open_shift_rows(days: list, day_summary) -> pd.DataFrame:
+    """Nepokryté smeny (ranná/poobedná bez OK) pre dni; stĺpec "čip" je na doplnenie v editore."""
+    rows = []
+    for day in days:
+        summary = day_summary(day)
+        for pos in POSITIONS:
+            morning = summary[pos]["morning"]
+            afternoon = summary[pos]["afternoon"]
+            if morning["status"] not in ("Ranna OK", "R+P OK"):
+                rows.append({"deň": day, "pozícia": pos, "smena": "ranná", "stav": morning["status"], "čip": ""})
+            if afternoon["status"] not in ("Poobedna OK", "R+P OK"):
+                rows.append({"deň": day, "pozícia": pos, "smena": "poobedná", "stav": afternoon["status"], "čip": ""})
+    return pd.DataFrame(rows, columns=["deň", "pozícia", "smena", "stav", "čip"])
+
+def missing_record_rows(summary: dict) -> pd.DataFrame:
+    """Chýbajúce príchody/odchody dňa (info["missing"] zo summarize_day) ako riadky editora na doplnenie."""
+    rows = [
+        {"pozícia": pos, "akcia": m["action"], "user_code": m["user_code"], "hodina": 6, "minúta": 0, "uložiť": False}
+        for pos, info in summary.items() for m in info.get("missing", [])
+    ]
+    return pd.DataFrame(rows, columns=["pozícia", "akcia", "user_code", "hodina", "minúta", "uložiť"])
+
+# ================== EXCEL EXPORT (s rozpisom čipov) ==================
+def get_chip_assignments(df_raw: pd.DataFrame, monday, pair_table: pd.DataFrame = None):
+    """
+    Vygeneruje mapovanie (pozícia, smena, deň) -> [user_codes].
+    Ak je daná pair_table (napr. z load_attendance_pairs), df_raw sa nepáruje znova.
+    """
+    assignments = {}
+    if pair_table is None:
+        if df_raw.empty:
+            return assignments
+        if "day" not in df_raw.columns:
+            df_raw = _prepare_attendance(df_raw.copy())
+        pair_table = pair_table_from_frame(df_raw, day_number(monday), day_number(monday) + 6)
+    first_day = day_number(monday)
+    in_week = pair_table.index.get_level_values("day").isin(range(first_day, first_day + 7))
+    week = pair_table[in_week].sort_values("order")
+    for (day, pos, user, _), mor, aft in zip(week.index, week["mor"], week["aft"]):
+        i = day - first_day
+        if mor in (ST_RANNA, ST_RP):
+            users = assignments.setdefault((pos, "06:00-14_00", i), [])
+            if user not in users:  # pri "stream" môže mať používateľ v bunke viac párov
+                users.append(user)
+        if aft in (ST_POOBEDNA, ST_RP):
+            users = assignments.setdefault((pos, "14:00-22:00", i), [])
+            if user not in users:
+                users.append(user)
+    return assignments
+
+EXPORT_STYLE_OK = "dochadzka_ok"  # hodiny v týždennom prehľade
+EXPORT_STYLE_WARN = "dochadzka_warn"  # "⚠..." v týždennom prehľade
+EXPORT_STYLE_CENTER = "dochadzka_center"  # rozpis čipov
+
+def _export_workbook():
+    """Write-only workbook so zdieľanými pomenovanými štýlmi (jeden záznam štýlu pre všetky bunky)."""
+    from openpyxl import Workbook
+    from openpyxl.styles import PatternFill, Alignment, NamedStyle
+
+    wb = Workbook(write_only=True)
+    wb.add_named_style(NamedStyle(
+        name=EXPORT_STYLE_OK, fill=PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
+    ))
+    wb.add_named_style(NamedStyle(
+        name=EXPORT_STYLE_WARN, fill=PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
+    ))
+    wb.add_named_style(NamedStyle(
+        name=EXPORT_STYLE_CENTER, alignment=Alignment(horizontal="center", vertical="center")
+    ))
+    return wb
+
+def _styled(ws, value, style):
+    from openpyxl.cell import WriteOnlyCell
+
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+def _write_matrix_sheet(wb, title, df_matrix):
+    """Prehľad pozície x dni; hodiny zelené, "⚠..." žlté."""
+    from openpyxl.utils.dataframe import dataframe_to_rows
+
+    ws = wb.create_sheet(title)
+    rows = dataframe_to_rows(df_matrix.reset_index().rename(columns={"index": "Pozícia"}), index=False, header=True)
+    ws.append(next(rows))
+    for r in rows:
+        for i in range(1, 1 + len(df_matrix.columns)):
+            val = r[i]
+            if isinstance(val, (int, float)):
+                r[i] = _styled(ws, val, EXPORT_STYLE_OK)
+            elif isinstance(val, str) and val.strip().startswith("⚠"):
+                r[i] = _styled(ws, val, EXPORT_STYLE_WARN)
+        ws.append(r)
+
+def _write_frame_sheet(wb, title, df):
+    from openpyxl.utils.dataframe import dataframe_to_rows
+
+    ws = wb.create_sheet(title)
+    for r in dataframe_to_rows(df, index=False, header=True):
+        ws.append(r)
+
+def _write_chip_sheet(wb, df_raw, mondays, pair_table, week_column=False):
+    """Rozpis čipov po týždňoch; s week_column je v prvom stĺpci pondelok týždňa."""
+    ws = wb.create_sheet("Rozpis čipov")
+    days = ["pondelok", "utorok", "streda", "štvrtok", "piatok", "sobota", "nedeľa"]
+    header = (["week"] if week_column else []) + ["position", "shift"] + days
+    ws.append([_styled(ws, v, EXPORT_STYLE_CENTER) for v in header])
+
+    POS = sorted(df_raw["position"].unique()) if not df_raw.empty else POSITIONS
+    for monday in mondays:
+        chip_map = get_chip_assignments(df_raw, monday, pair_table)
+        prefix = [monday.strftime("%d.%m.%Y")] if week_column else []
+        for pos in POS:
+            for shift in ["06:00-14_00", "14:00-22:00"]:
+                row_vals = []
+                for i in range(7):
+                    users = chip_map.get((pos, shift, i), [])
+                    row_vals.append(", ".join(users) if users else "")
+                ws.append([_styled(ws, v, EXPORT_STYLE_CENTER) for v in prefix + [pos, shift] + row_vals])
+
+def _save_workbook(wb, out=None):
+    if out is not None:
+        wb.save(out)
+        return out
+    buf = BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return buf
+
+def excel_with_colors(df_matrix, df_day_details, df_raw, monday, pair_table=None, out=None):
+    """
+    Vytvorí farebný Excel so 4 sheetmi:
+    - Týždenný prehľad
+    - Denné - detail
+    - Surové dáta
+    - Rozpis čipov
+    Riadky sa zapisujú prúdovo (openpyxl write-only), bunky sa v pamäti nedržia.
+    out: binárny buffer/súbor, do ktorého sa zapíše (predvolene nový BytesIO); vráti sa out.
+    """
+    wb = _export_workbook()
+    _write_matrix_sheet(wb, "Týždenný prehľad", df_matrix)
+    _write_frame_sheet(wb, "Denné - detail", df_day_details)
+    _write_frame_sheet(wb, "Surové dáta", df_raw)
+    _write_chip_sheet(wb, df_raw, [monday], pair_table)
+    return _save_workbook(wb, out)
+
+def excel_range_report(report, df_raw, out=None):
+    """Jeden Excel za celé obdobie RangeReport (prehľad, detail všetkých dní, surové dáta, čipy po týždňoch)."""
+    wb = _export_workbook()
+    _write_matrix_sheet(wb, "Prehľad obdobia", report.matrix().reset_index().rename(columns={"index": "position"}))
+    _write_frame_sheet(wb, "Denné - detail", report.day_details())
+    _write_frame_sheet(wb, "Surové dáta", df_raw)
+    _write_chip_sheet(wb, df_raw, report.mondays, report.pair_table, week_column=True)
+    return _save_workbook(wb, out)
+
+def isoformat_series(ts: pd.Series) -> pd.Series:
+    """
+    Ako ts.apply(lambda x: x.isoformat() if pd.notna(x) else ""), ale pre celý stĺpec naraz:
+    "2025-10-13T06:00:48.123456+00:00", bez zlomku pri nulových mikrosekundách, "" pre NaT.
+    """
+    if not isinstance(ts.dtype, pd.DatetimeTZDtype):
+        return ts.apply(lambda x: x.isoformat() if pd.notna(x) else "")
+    wall = ts.dt.tz_localize(None)
+    valid = wall.notna().to_numpy()
+    text = np.datetime_as_string(wall.to_numpy(dtype="datetime64[us]"), unit="us").astype(object)
+    whole = (wall.dt.microsecond == 0).to_numpy()
+    text[whole] = [t[:19] for t in text[whole]]
+
+    # posun voči UTC v minútach -> "+HH:MM" (rôznych hodnôt je len pár)
+    offset = ((wall - ts.dt.tz_convert("UTC").dt.tz_localize(None)).dt.total_seconds() // 60).fillna(0).astype("int64")
+    labels = {m: f"{'+' if m >= 0 else '-'}{abs(m) // 60:02d}:{abs(m) % 60:02d}" for m in offset.unique()}
+    out = text + offset.map(labels).to_numpy(dtype=object)
+    out[~valid] = ""
+    return pd.Series(out, index=ts.index, dtype=object)
+
+def raw_export_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Stĺpce ATTENDANCE_COLUMNS pre sheet "Surové dáta", timestamp ako ISO text."""
+    df_raw = df[[c for c in ATTENDANCE_COLUMNS if c in df.columns]].copy()
+    if "timestamp" in df_raw.columns:
+        df_raw["timestamp"] = isoformat_series(df_raw["timestamp"])
+    return df_raw
+
+def build_week_export(monday: date, week_summary, detail_day: date, attendance_cache, start_dt, end_dt) -> bytes:
+    """Celý export týždňa (bytes XLSX). Beží vo vlákne, na st.* nesiaha."""
+    df_matrix = week_summary.matrix().reset_index().rename(columns={"index": "position"})
+    df_day_details = week_summary.day_details(detail_day)
+    # surové riadky sa sťahujú len pre sheet "Surové dáta"
+    df_raw = raw_export_frame(attendance_cache.get(start_dt, end_dt))
+    with stage("export_week", monday=monday, rows=len(df_raw)) as info:
+        data = excel_with_colors(df_matrix, df_day_details, df_raw, monday, week_summary.pair_table).getvalue()
+        info["bytes"] = len(data)
+    return data
+
+def build_range_export(start: date, end: date, pairs_cache, attendance_cache, summary_store=None) -> tuple:
+    """RangeReport a jeho Excel (bytes) za obdobie start..end (vrátane). Beží vo vlákne, na st.* nesiaha."""
+    start_dt, end_dt = day_range(start, end)
+    # páry až po odtlačkoch uložených súhrnov a overené v DB (fresh), inak by sa mohli uložiť zastarané
+    report = RangeReport(start, end, lambda: pairs_cache.get(start_dt, end_dt, fresh=True), summary_store)
+    df_raw = raw_export_frame(attendance_cache.get(start_dt, end_dt))
+    with stage("export_range", start=start, end=end, rows=len(df_raw)) as info:
+        data = excel_range_report(report, df_raw).getvalue()
+        info["bytes"] = len(data)
+    return report, data
+
+class ExportJobs:
+    """
+    Exporty bežiace na pozadí. Kľúč obsahuje verziu dát (týždeň: (pondelok, verzia, deň detailu),
+    obdobie: ("obdobie", od, do, verzia)); pri rovnakej verzii sa hotový export len vráti.
+    """
+
+    def __init__(self, workers=EXPORT_WORKERS, max_entries=EXPORT_MAX_ENTRIES):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self.max_entries = max_entries
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Future pre kľúč alebo None, ak export ešte nebol zadaný."""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def submit(self, key, fn, *args):
+        """Zadá export, ak pre kľúč ešte nebeží ani nie je hotový; vráti jeho Future."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or (job.done() and job.exception() is not None):
+                job = self.executor.submit(fn, *args)
+                self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            while len(self._jobs) > self.max_entries:
+                self._jobs.popitem(last=False)
+            return job
+
+
+# ================== CLI ==================
+def main(argv=None) -> int:
+    """Report za obdobie bez Streamlitu: matica hodín (CSV) alebo Excel ako z UI ("Report za obdobie")."""
+    parser = argparse.ArgumentParser(description="Report dochádzky za obdobie (matica CSV alebo XLSX).")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="prvý deň (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="posledný deň vrátane (predvolene start + 6 dní)")
+    parser.add_argument("--format", choices=["matrix", "xlsx"], default="matrix",
+                        help="matrix = pozície x dni ako CSV, xlsx = Excel reportu za obdobie")
+    parser.add_argument("--out", help="výstupný súbor (matrix predvolene na stdout)")
+    parser.add_argument("--backend", choices=["supabase", "postgres", "sqlite"],
+                        help="úložisko (predvolene DATABAZA_BACKEND z prostredia, inak supabase)")
+    parser.add_argument("--sqlite", help="cesta k SQLite súboru (DATABAZA_SQLITE)")
+    parser.add_argument("--dsn", help="Postgres DSN (DATABAZA_DSN)")
+    parser.add_argument("--archive", help="adresár archívu uzavretých týždňov (DATABAZA_ARCHIVE)")
+    parser.add_argument("--no-store", action="store_true", help="nepoužiť uložené súhrny dní (SummaryStore)")
+    parser.add_argument("--store", action="store_true",
+                        help="novo spočítané súhrny uzavretých dní zapísať do DB (inak sa len čítajú)")
+    args = parser.parse_args(argv)
+    end = args.end or args.start + timedelta(days=6)
+    if end < args.start:
+        parser.error("--end je pred --start")
+    if args.format == "xlsx" and not args.out:
+        parser.error("--format xlsx potrebuje --out")
+
+    # nastavenia ako v st.secrets, z prostredia (DATABAZA_URL, DATABAZA_KEY, ...) a z argumentov
+    settings = {k: v for k, v in os.environ.items() if k.startswith("DATABAZA_")}
+    overrides = {"DATABAZA_BACKEND": args.backend, "DATABAZA_SQLITE": args.sqlite, "DATABAZA_DSN": args.dsn,
+                 "DATABAZA_ARCHIVE": args.archive}
+    settings.update({k: v for k, v in overrides.items() if v})
+    configure_logging()
+    backend = make_backend(settings)
+    start_dt, end_dt = day_range(args.start, end)
+    store = None if args.no_store else SummaryStore(backend, writable=args.store)
+    report = RangeReport(args.start, end, lambda: backend.fetch_pairs(start_dt, end_dt), store, processes=True)
+    if args.format == "xlsx":
+        df_raw = raw_export_frame(_prepare_attendance(backend.fetch_range(start_dt, end_dt)))
+        with open(args.out, "wb") as f:
+            excel_range_report(report, df_raw, f)
+    else:
+        report.matrix().to_csv(args.out or sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
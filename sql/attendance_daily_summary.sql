@@ -0,0 +1,35 @@
+-- Uložené súhrny uzavretých dní pre admin aplikáciu (SummaryStore).
+-- Jeden riadok na (deň, pozícia): výsledok summarize_day pre pozíciu v stĺpci result,
+-- version = SUMMARY_VERSION výpočtu a fingerprint = odtlačok dňa ("počet:najväčšie id" jeho záznamov,
+-- pri párovaní "stream" aj susedných dní), z ktorého sa počítal.
+
+create table if not exists attendance_daily_summary (
+    day date not null,
+    position text not null,
+    version integer not null,
+    fingerprint text not null,
+    morning_status text not null,
+    afternoon_status text not null,
+    total_hours double precision not null,
+    result jsonb not null,
+    updated_at timestamptz not null default now(),
+    primary key (day, position)
+);
+
+-- Odtlačky dní (SupabaseBackend.day_stats volá RPC attendance_day_stats): počet a najväčšie id záznamov
+-- po dňoch, deň z času uloženého v DB ako v attendance_pairs.
+create or replace function attendance_day_stats(start_ts timestamptz, end_ts timestamptz)
+returns table (
+    day date,
+    "rows" bigint,
+    max_id bigint
+)
+language sql stable
+as $$
+    select (a.timestamp at time zone 'UTC')::date as day,
+           count(*) as "rows",
+           max(a.id) as max_id
+    from attendance a
+    where a.timestamp >= start_ts and a.timestamp < end_ts
+    group by 1
+$$;
@@ -0,0 +1,25 @@
+-- Živé zmeny pre admin aplikáciu (PostgresChangeFeed počúva LISTEN attendance_changes).
+-- Každý vložený alebo upravený riadok attendance sa pošle ako JSON so stĺpcami ATTENDANCE_COLUMNS.
+
+create or replace function attendance_notify()
+returns trigger
+language plpgsql
+as $$
+begin
+    perform pg_notify('attendance_changes', json_build_object(
+        'id', new.id,
+        'user_code', new.user_code,
+        'position', new.position,
+        'action', new.action,
+        'timestamp', new.timestamp,
+        'valid', new.valid
+    )::text);
+    return new;
+end
+$$;
+
+drop trigger if exists attendance_notify on attendance;
+
+create trigger attendance_notify
+after insert or update on attendance
+for each row execute function attendance_notify();
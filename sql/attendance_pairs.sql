@@ -0,0 +1,32 @@
+-- Agregácia párov pre admin aplikáciu (SupabaseBackend.fetch_pairs volá RPC attendance_pairs).
+-- Jeden riadok na (deň, pozícia, user_code): prvý Príchod, posledný Odchod, počty a najmenšie id.
+-- Deň sa berie z času uloženého v DB (lokálny čas označený ako +00), rovnako ako v aplikácii.
+
+create index if not exists attendance_timestamp_idx on attendance (timestamp);
+
+create or replace function attendance_pairs(start_ts timestamptz, end_ts timestamptz)
+returns table (
+    day date,
+    position text,
+    user_code text,
+    pr timestamptz,
+    od timestamptz,
+    pr_count bigint,
+    od_count bigint,
+    first_id bigint
+)
+language sql stable
+as $$
+    select (a.timestamp at time zone 'UTC')::date as day,
+           a.position,
+           a.user_code,
+           min(a.timestamp) filter (where lower(a.action) = 'príchod') as pr,
+           max(a.timestamp) filter (where lower(a.action) = 'odchod') as od,
+           count(*) filter (where lower(a.action) = 'príchod') as pr_count,
+           count(*) filter (where lower(a.action) = 'odchod') as od_count,
+           min(a.id) as first_id
+    from attendance a
+    where a.timestamp >= start_ts and a.timestamp < end_ts
+    group by 1, 2, 3
+    order by first_id
+$$;
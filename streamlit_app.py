@@ -1,20 +1,28 @@
+"""
+Admin rozhranie dochádzky (Streamlit). Výpočty, úložiská a exporty sú v dochadzka.py,
+tu je UI a zdieľané inštancie pre proces (úložisko, cache, živé zmeny, exporty na pozadí).
+"""
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date, time, timedelta
-import pytz
-from supabase import create_client, Client
-from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Alignment
-from openpyxl.utils.dataframe import dataframe_to_rows
-
-# ================== CONFIG ==================
-st.set_page_config(
-    page_title="Admin - Dochádzka",
-    layout="wide",
-    initial_sidebar_state="expanded"
+import cProfile
+import pstats
+import marshal
+from time import perf_counter
+from io import StringIO
+
+from dochadzka import (
+    AnomalyIndex, ATTENDANCE_ACTIONS, attendance_changes, ATTENDANCE_COLUMNS, attendance_edit_frame,
+    AttendanceBackend, AttendanceCache, begin_stages, build_range_export, build_week_export, CACHE_MAX_RANGES,
+    ChangeFeed, configure_logging, day_number, ExportJobs, frame_bytes, GuardLedger, insert_attendance_batch,
+    LIVE_WAIT_SECONDS, make_backend, missing_record_rows, open_shift_rows, pair_table_from_frame, pairing_range,
+    pairing_stamps, POSITIONS, PostgresChangeFeed, _prepare_attendance, RangeReport, stage, stage_records,
+    summary_cells, SummaryStore, SUPPLEMENT_SHIFTS, tz, WeekSummary,
 )
 
+configure_logging()
+
+# ================== CONFIG ==================
 hide_css = """
 <style>
 #MainMenu {visibility: hidden;}
@@ -22,299 +30,164 @@ footer {visibility: hidden;}
 header {visibility: hidden;}
 </style>
 """
-st.markdown(hide_css, unsafe_allow_html=True)
 
 # ================== SECRETS ==================
-DATABAZA_URL = st.secrets["DATABAZA_URL"]
-DATABAZA_KEY = st.secrets["DATABAZA_KEY"]
-ADMIN_PASS = st.secrets.get("ADMIN_PASS", "")
-
-databaze: Client = create_client(DATABAZA_URL, DATABAZA_KEY)
-tz = pytz.timezone("Europe/Bratislava")
-
-# ================== KONŠTANTY ==================
-# POSITIONS = [
-#     "Veliteľ", "CCTV", "Brány", "Sklad2", "Sklad3",
-#     "Turniket2", "Turniket3", "Plombovac2", "Plombovac3"
-# ]
-POSITIONS = [
-    "Veliteľ", "Plombovac", "Kontrolor_DC3", "Kontrolor_DC2", "Mobilny_SBS"
-]
-SHIFT_HOURS = 7.5
-DOUBLE_SHIFT_HOURS = 15.25
-VELITEL_DOUBLE = 16.25
-SWAP_WINDOW_MINUTES = 30  # <-- zmena: 30 minút
-
-# ================== HELPERS ==================
+# čítajú sa až pri použití (get_backend, main)
+# DATABAZA_BACKEND: "supabase" (DATABAZA_URL + DATABAZA_KEY), "postgres" (DATABAZA_DSN)
+# alebo "sqlite" (DATABAZA_SQLITE = cesta k súboru, lokálna náhrada pre offline testy), viď make_backend
+# DATABAZA_ARCHIVE: voliteľný adresár lokálneho archívu uzavretých týždňov (ArchivedBackend)
+# ADMIN_PASS: heslo do admin rozhrania
+
+# ================== ÚLOŽISKO A CACHE ==================
+# jedna inštancia na proces (st.cache_resource), zdieľaná medzi rerunmi aj reláciami
+@st.cache_resource
+def get_backend() -> AttendanceBackend:
+    """Úložisko podľa DATABAZA_BACKEND v secrets, jedno pre celý proces."""
+    return make_backend(st.secrets)
+
+@st.cache_resource
+def get_attendance_cache() -> AttendanceCache:
+    """Jedna cache pre celý proces (zdieľaná medzi rerunmi aj reláciami)."""
+    return AttendanceCache(get_backend().fetch_range)
+
 def load_attendance(start_dt: datetime, end_dt: datetime) -> pd.DataFrame:
     """Načíta záznamy z tabuľky attendance medzi start_dt (inclusive) a end_dt (exclusive)."""
-    res = (
-        databaze.table("attendance")
-        .select("*")
-        .gte("timestamp", start_dt.isoformat())
-        .lt("timestamp", end_dt.isoformat())
-        .execute()
-    )
-    df = pd.DataFrame(res.data)
-    if df.empty:
-        return df
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-    df["timestamp"] = df["timestamp"].apply(
-        lambda x: tz.localize(x) if pd.notna(x) and x.tzinfo is None else x
-    )
-    df["date"] = df["timestamp"].dt.date
-    df["time"] = df["timestamp"].dt.time
+    cache = get_attendance_cache()
+    with stage("load_attendance", start=start_dt.date(), end=end_dt.date()) as info:
+        df = cache.get(start_dt, end_dt)
+        info.update(rows=len(df), fetched_rows=cache.fetched_rows(start_dt, end_dt), bytes=frame_bytes(df))
     return df
 
-def get_user_pairs(pos_day_df: pd.DataFrame):
-    """Pre daný pos_day_df (záznamy pre jednu pozíciu a deň) vráti dict user-> {pr, od, pr_count, od_count}."""
-    pairs = {}
-    if pos_day_df.empty:
-        return pairs
-    for user in pos_day_df["user_code"].unique():
-        u = pos_day_df[pos_day_df["user_code"] == user]
-        pr = u[u["action"].str.lower() == "príchod"]["timestamp"]
-        od = u[u["action"].str.lower() == "odchod"]["timestamp"]
-        pr_min = pr.min() if not pr.empty else pd.NaT
-        od_max = od.max() if not od.empty else pd.NaT
-        pairs[user] = {"pr": pr_min, "od": od_max, "pr_count": len(pr), "od_count": len(od)}
-    return pairs
-
-def classify_pair(pr, od, position):
-    """Klasifikuje pár pr/od podľa časov a pozície, vracia (mor_status, aft_status, hours_m, hours_p, msgs)."""
-    msgs = []
-    if (pd.isna(pr) or pr is None) and (pd.isna(od) or od is None):
-        return ("none", "none", 0.0, 0.0, msgs)
-    if pd.isna(pr) or pr is None:
-        msgs.append("missing_prichod")
-        return ("missing_pr", "none", 0.0, 0.0, msgs)
-    if pd.isna(od) or od is None:
-        msgs.append("missing_odchod")
-        return ("none", "missing_od", 0.0, 0.0, msgs)
-
-    pr_t = pr.time()
-    od_t = od.time()
-
-    # Veliteľ má špeciálne hodiny
-    if position.lower().startswith("vel"):
-        if pr_t <= time(7, 0) and (od_t >= time(21, 0) or od_t < time(2, 0)):
-            return ("R+P OK", "R+P OK", VELITEL_DOUBLE, VELITEL_DOUBLE, msgs)
-
-    # Dvojitá smena (non-veliteľ)
-    if pr_t <= time(7, 0) and (od_t >= time(21, 0) or od_t < time(2, 0)):
-        return ("R+P OK", "R+P OK", DOUBLE_SHIFT_HOURS, DOUBLE_SHIFT_HOURS, msgs)
-
-    # Ranná
-    if pr_t <= time(7, 0) and od_t <= time(15, 0):
-        return ("Ranna OK", "none", SHIFT_HOURS, 0.0, msgs)
-
-    # Poobedná
-    if pr_t >= time(13, 0) and od_t >= time(21, 0):
-        return ("none", "Poobedna OK", 0.0, SHIFT_HOURS, msgs)
-
-    msgs.append("invalid_times")
-    return ("invalid", "invalid", 0.0, 0.0, msgs)
-
-def merge_intervals(pairs):
+@st.cache_resource
+def get_pairs_cache() -> AttendanceCache:
+    """Cache agregovaných párov; agregáty sa nedajú doťahovať po id, preto incremental=False."""
+    return AttendanceCache(get_backend().fetch_pairs, prepare=lambda table: table, incremental=False)
+
+def load_attendance_pairs(start_dt: datetime, end_dt: datetime) -> pd.DataFrame:
     """
-    Zlúči intervaly (príchod, odchod) pre pozíciu.
-    Ak je medzera medzi intervalmi <= SWAP_WINDOW_MINUTES, spoja sa (považujeme to za swap/pokrývanie).
-    Vráti zoznam zlúčených (start, end) (timezone-aware datetimes).
+    Tabuľka párov (ako build_pair_table) pre rozsah start_dt (inclusive) až end_dt (exclusive).
+    Agreguje sa v DB, z DB príde jeden riadok na (deň, pozícia, user_code) namiesto všetkých pípnutí.
     """
-    intervals = []
-    for pair in pairs.values():
-        if pd.notna(pair["pr"]) and pd.notna(pair["od"]):
-            intervals.append((pair["pr"], pair["od"]))
-    if not intervals:
-        return []
-
-    intervals.sort(key=lambda x: x[0])
-    merged = [intervals[0]]
-    for start, end in intervals[1:]:
-        last_start, last_end = merged[-1]
-        gap_min = (start - last_end).total_seconds() / 60
-        if gap_min <= SWAP_WINDOW_MINUTES:
-            # merge (považujeme to za plynulé pokrytie)
-            merged[-1] = (last_start, max(last_end, end))
-        else:
-            merged.append((start, end))
-    return merged
-
-def summarize_position_day(pos_day_df: pd.DataFrame, position):
-    """Zhrnie jednu pozíciu za deň: ranná, poobedná, detaily.
-    Pôvodné správanie sa zachová; pokiaľ dôjde k nejakému problému/invalid, doplní sa merge_intervals (30 min)."""
-    morning = {"status": "absent", "hours": 0.0, "detail": None}
-    afternoon = {"status": "absent", "hours": 0.0, "detail": None}
-    details = []
-
-    if pos_day_df.empty:
-        return morning, afternoon, details
-
-    pairs = get_user_pairs(pos_day_df)
-
-    # preferujeme užívateľa s kompletnou R+P OK (ak existuje) — pôvodné správanie
-    rp_user = None
-    for user, pair in pairs.items():
-        role_m, role_p, h_m, h_p, msgs = classify_pair(pair["pr"], pair["od"], position)
-        if role_m == "R+P OK" and role_p == "R+P OK":
-            rp_user = (user, pair, h_m, h_p)
-            break
-
-    if rp_user:
-        user, pair, h_m, h_p = rp_user
-        morning = {"status": "R+P OK", "hours": h_m, "detail": f"Príchod: {pair['pr']}, Odchod: {pair['od']}"}
-        afternoon = {"status": "R+P OK", "hours": h_p, "detail": f"Príchod: {pair['pr']}, Odchod: {pair['od']}"}
-        return morning, afternoon, details
-
-    # inak skontrolujeme jednotlivcov podľa pôvodnej logiky a zbierame detaily (msgs)
-    had_invalid_or_missing = False
-    for user, pair in pairs.items():
-        role_m, role_p, h_m, h_p, msgs = classify_pair(pair["pr"], pair["od"], position)
-        if role_m == "Ranna OK" and morning["status"] not in ("Ranna OK", "R+P OK"):
-            morning = {"status": "Ranna OK", "hours": h_m, "detail": f"{user}: Príchod: {pair['pr']}, Odchod: {pair['od']}"}
-        if role_p == "Poobedna OK" and afternoon["status"] not in ("Poobedna OK", "R+P OK"):
-            afternoon = {"status": "Poobedna OK", "hours": h_p, "detail": f"{user}: Príchod: {pair['pr']}, Odchod: {pair['od']}"}
-
-        if msgs:
-            had_invalid_or_missing = True
-            for m in msgs:
-                details.append(f"{user}: {m} — pr:{pair['pr']} od:{pair['od']}")
-
-    # Ak všetko podľa pôvodnej logiky vyzerá OK (ráno alebo poobedie rozpoznané), nechaj tak
-    if (morning["status"] in ("Ranna OK", "R+P OK") or afternoon["status"] in ("Poobedna OK", "R+P OK")) and not had_invalid_or_missing:
-        return morning, afternoon, details
-
-    # Inak (napr. invalidy, chýbajúce odchody/príchody alebo neúplné) spravíme doplnkové overenie:
-    # zlúčime intervaly s ohľadom na SWAP_WINDOW_MINUTES a prehodnotíme pokrytie pozície
-    merged = merge_intervals(pairs)
-    total_hours = round(sum((end - start).total_seconds() / 3600 for start, end in merged), 2) if merged else 0.0
-
-    # ak žiadne komplet intervaly, vrátime pôvodné detaily (missing/invalid)
-    if not merged:
-        # ponecháme pôvodné morning/afternoon a detaily
-        return morning, afternoon, details
-
-    # rozhodovanie podľa zlúčeného pokrytia
-    if position.lower().startswith("vel"):
-        double_threshold = VELITEL_DOUBLE
+    cache = get_pairs_cache()
+    with stage("load_attendance_pairs", start=start_dt.date(), end=end_dt.date()) as info:
+        table = cache.get(start_dt, end_dt)
+        info.update(rows=len(table), fetched_rows=cache.fetched_rows(start_dt, end_dt), bytes=frame_bytes(table))
+    return table
+
+def invalidate_caches(ts=None):
+    """Po zápise zahodí dotknuté rozsahy v cache záznamov aj párov (ts môže byť aj list; bez ts všetko)."""
+    get_attendance_cache().invalidate(ts)
+    get_pairs_cache().invalidate(None if ts is None else pairing_stamps(ts))
+
+# ================== ŽIVÉ ZMENY ==================
+def apply_changes(rows: list):
+    """
+    Nové/zmenené riadky attendance zapracuje do cache bez čítania z DB:
+    načítané rozsahy záznamov sa doplnia (AttendanceCache.apply), rozsahy párov obsahujúce zmenu sa zahodia.
+    Archivované týždne so zmenou (DATABAZA_ARCHIVE) sa zahodia, stiahnu sa pri ďalšom načítaní.
+    """
+    delta = pd.DataFrame([{c: r.get(c) for c in ATTENDANCE_COLUMNS} for r in rows], columns=ATTENDANCE_COLUMNS)
+    with stage("apply_changes", rows=len(delta)):
+        delta["id"] = delta["id"].astype("int64")
+        delta["valid"] = delta["valid"].fillna(True).astype(bool)
+        delta = _prepare_attendance(delta)
+        get_attendance_cache().apply(delta)
+        get_pairs_cache().invalidate(pairing_stamps(delta["timestamp"].tolist()))
+        get_backend().discard_archived(delta["timestamp"].tolist())
+
+@st.cache_resource
+def get_change_feed() -> ChangeFeed:
+    """
+    Zmeny attendance pre celý proces, odberateľom je apply_changes.
+    Postgres (aj Supabase s DATABAZA_DSN) posiela zmeny cez LISTEN/NOTIFY; inak ide len o lokálny ChangeFeed
+    s vlastnými zápismi aplikácie a ostatné zmeny sa dotiahnu pri doťahovaní cache.
+    """
+    feed = get_backend().change_feed()
+    if feed is None and st.secrets.get("DATABAZA_DSN"):
+        feed = PostgresChangeFeed(st.secrets["DATABAZA_DSN"])
+    feed = feed or ChangeFeed()
+    feed.subscribe(apply_changes)
+    return feed.start()
+
+def publish_changes(rows: list, ts=None):
+    """Po vlastnom zápise: zapísané riadky do ChangeFeed; ak DB riadky nevrátila, zahodia sa rozsahy s ts."""
+    if rows:
+        get_change_feed().publish(rows)
     else:
-        double_threshold = DOUBLE_SHIFT_HOURS
-
-    earliest = min(s[0] for s in merged)
-    latest = max(s[1] for s in merged)
-    e_t = earliest.time()
-    l_t = latest.time()
-
-    # Ak zlúčené intervaly dávajú kompletnú dvojitú smenu (napr. people swapped) -> R+P OK
-    if e_t <= time(7, 0) and (l_t >= time(21, 0) or l_t < time(2, 0)) and total_hours >= double_threshold - 0.01:
-        morning["status"] = "R+P OK"
-        afternoon["status"] = "R+P OK"
-        # rozdeľme hours rovnomerne (len pre report)
-        morning["hours"] = round(total_hours / 2, 2)
-        afternoon["hours"] = round(total_hours / 2, 2)
-        morning["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
-        afternoon["detail"] = morning["detail"]
-        return morning, afternoon, details
-
-    # Ak zlúčené intervaly naplnia ranné okno
-    if e_t <= time(7, 0) and latest.time() <= time(15, 0) and total_hours >= SHIFT_HOURS - 0.01:
-        morning["status"] = "Ranna OK"
-        morning["hours"] = round(total_hours, 2)
-        morning["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
-        return morning, afternoon, details
-
-    # Ak zlúčené intervaly naplnia poobedné okno
-    if e_t >= time(13, 0) and l_t >= time(21, 0) and total_hours >= SHIFT_HOURS - 0.01:
-        afternoon["status"] = "Poobedna OK"
-        afternoon["hours"] = round(total_hours, 2)
-        afternoon["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
-        return morning, afternoon, details
-
-    # Inak rozdelíme reálne pokrytie na rannú/poobednú podľa prierezu okien (6-15 a 13-22)
-    morning_hours = 0.0
-    afternoon_hours = 0.0
-    for start, end in merged:
-        morning_window_start = datetime.combine(start.date(), time(6,0)).replace(tzinfo=start.tzinfo)
-        morning_window_end = datetime.combine(start.date(), time(15,0)).replace(tzinfo=start.tzinfo)
-        afternoon_window_start = datetime.combine(start.date(), time(13,0)).replace(tzinfo=start.tzinfo)
-        afternoon_window_end = datetime.combine(start.date(), time(22,0)).replace(tzinfo=start.tzinfo)
-
-        # intersect with morning window
-        inter_start = max(start, morning_window_start)
-        inter_end = min(end, morning_window_end)
-        if inter_end > inter_start:
-            morning_hours += (inter_end - inter_start).total_seconds() / 3600
-
-        # intersect with afternoon window
-        inter_start = max(start, afternoon_window_start)
-        inter_end = min(end, afternoon_window_end)
-        if inter_end > inter_start:
-            afternoon_hours += (inter_end - inter_start).total_seconds() / 3600
-
-    morning_hours = round(morning_hours, 2)
-    afternoon_hours = round(afternoon_hours, 2)
-
-    if morning_hours > 0:
-        morning["status"] = "Čiastočná"
-        morning["hours"] = morning_hours
-        morning["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
-    if afternoon_hours > 0:
-        afternoon["status"] = "Čiastočná"
-        afternoon["hours"] = afternoon_hours
-        afternoon["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
-
-    # ak žiadne okno nenaplnené, označíme absent s celkovým pokrytím
-    if morning_hours == 0 and afternoon_hours == 0:
-        morning["status"] = "absent"
-        morning["hours"] = total_hours
-        morning["detail"] = " + ".join([f"{u}: {p['pr']}–{p['od']}" for u, p in pairs.items()])
-
-    return morning, afternoon, details
-
-def summarize_day(df_day: pd.DataFrame, target_date: date):
-    """Zhrnie všetky pozície pre daný deň."""
-    results = {}
-    for pos in POSITIONS:
-        pos_df = df_day[df_day["position"] == pos] if not df_day.empty else pd.DataFrame()
-        morning, afternoon, details = summarize_position_day(pos_df, pos)
-
-        if morning["status"] == "R+P OK" and afternoon["status"] == "R+P OK":
-            total = VELITEL_DOUBLE if pos.lower().startswith("vel") else DOUBLE_SHIFT_HOURS
-        elif morning["status"] in ("Ranna OK", "R+P OK") and afternoon["status"] in ("Poobedna OK", "R+P OK"):
-            total = VELITEL_DOUBLE if pos.lower().startswith("vel") else DOUBLE_SHIFT_HOURS
-        else:
-            total = morning.get("hours", 0.0) + afternoon.get("hours", 0.0)
+        invalidate_caches(ts)
 
-        results[pos] = {
-            "morning": morning,
-            "afternoon": afternoon,
-            "details": details,
-            "total_hours": round(total, 2)
-        }
+# ================== SÚHRNY ==================
+@st.cache_resource(max_entries=16)
+def get_week_summary(monday: date, data_version, _pair_table: pd.DataFrame) -> WeekSummary:
+    """
+    WeekSummary pre týždeň; prepočíta sa len pri novej verzii dát (pair_table.attrs["data_version"]).
+    Uzavreté dni sa berú z uložených súhrnov (get_summary_store).
+    """
+    return WeekSummary(monday, _pair_table, get_summary_store())
+
+@st.cache_resource
+def get_live_summaries() -> dict:
+    """Posledná WeekSummary živého režimu pre každý pondelok (zdieľaná medzi rerunmi aj reláciami)."""
+    return {}
 
+def live_week_summary(monday: date, df: pd.DataFrame) -> WeekSummary:
+    """
+    WeekSummary z načítaných záznamov týždňa (load_attendance s rozsahom z pairing_range) pre živý režim.
+    Ak je posledná známa verzia týždňa v df.attrs["changes"], prepočítajú sa len bunky dotknuté odvtedy,
+    inak sa týždeň spáruje a zhrnie celý.
+    """
+    summaries = get_live_summaries()
+    version = df.attrs.get("data_version")
+    current = summaries.get(monday)
+    if current is not None and current.data_version == version:
+        return current
+    changes = df.attrs.get("changes", [])
+    since = next((i for i, (v, _) in enumerate(changes) if current is not None and v == current.data_version), None)
+    if since is None:
+        summary = WeekSummary(monday, pair_table_from_frame(df, day_number(monday), day_number(monday) + 6))
+    else:
+        summary = current.patched(df, frozenset().union(*(cells for _, cells in changes[since:])))
+    summary.data_version = version
+    summary.pair_table.attrs["data_version"] = version
+    summaries.pop(monday, None)
+    summaries[monday] = summary
+    while len(summaries) > CACHE_MAX_RANGES:
+        summaries.pop(next(iter(summaries)))
+    return summary
+
+@st.cache_resource
+def get_summary_store() -> SummaryStore:
+    return SummaryStore(get_backend())
+
+@st.cache_resource(max_entries=4)
+def get_anomaly_index(start_dt: datetime, end_dt: datetime) -> AnomalyIndex:
+    """AnomalyIndex pre rozsah, zdieľaný medzi rerunmi (dopĺňa sa len o nové riadky)."""
+    return AnomalyIndex()
+
+@st.cache_resource(max_entries=4)
+def get_guard_ledger(start: date, end: date, data_version, _pair_table: pd.DataFrame) -> GuardLedger:
+    """GuardLedger pre rozsah; postaví sa znova len pri novej verzii párov (pair_table.attrs["data_version"])."""
+    return GuardLedger(_pair_table)
+
+# ================== ZÁPISY ==================
+def save_attendance_batch(records) -> list:
+    """
+    Uloží viac príchodov/odchodov naraz (insert_attendance_batch): jeden insert do DB a jedno zahodenie
+    dotknutých rozsahov v cache. Vráti výsledok pre každý riadok v poradí vstupu:
+    {"ok": bool, "id": id alebo None, "error": text alebo None}; neplatné riadky sa neuložia, ostatné áno.
+    """
+    results, inserted, stamps = insert_attendance_batch(get_backend(), records, get_summary_store())
+    if stamps:
+        publish_changes(inserted, stamps)
     return results
 
 def save_attendance(user_code, position, action, now=None):
-    """Uloží príchod/odchod do tabuľky attendance (Supabase) s presným timestampom."""
-    user_code = user_code.strip()
-    if not now:
-        now = datetime.now(tz)
-    # ak je sekundová a mikrosekundová časť nulová, doplníme aktuálny čas
-    if now.second == 0 and now.microsecond == 0:
-        current = datetime.now(tz)
-        now = now.replace(second=current.second, microsecond=current.microsecond)
-
-    # uložíme v tvare: 2025-10-14 13:46:13.972178+00
-    ts_str = now.strftime("%Y-%m-%d %H:%M:%S.%f") + "+00"
-
-    databaze.table("attendance").insert({
-        "user_code": user_code,
-        "position": position,
-        "action": action,
-        "timestamp": ts_str,
-        "valid": True
-    }).execute()
+    """Uloží príchod/odchod do tabuľky attendance s presným timestampom (jeden riadok cez save_attendance_batch)."""
+    result = save_attendance_batch([(user_code, position, action, now)])[0]
+    if not result["ok"]:
+        raise ValueError(result["error"])
     return True
+
 def update_attendance_record(record_id: int, field: str, new_value: str):
     """
     Aktualizuje jeden záznam v attendance podľa ID.
@@ -323,360 +196,472 @@ def update_attendance_record(record_id: int, field: str, new_value: str):
     if field not in ("position", "action"):
         raise ValueError("Nepodporované pole")
 
-    databaze.table("attendance") \
-        .update({field: new_value}) \
-        .eq("id", record_id) \
-        .execute()
+    rows = get_backend().update(record_id, {field: new_value})
 
-# ================== EXCEL EXPORT (s rozpisom čipov) ==================
-from datetime import timedelta as _tdelta  # lokálna alias
-from datetime import time as _time  # lokálna alias pre clarity
+    # upravený riadok sa zapracuje do cache (ak ho DB nevrátila, zahodí sa celá cache);
+    # pôvodnú pozíciu nepoznáme, uložené súhrny dňa sa zmažú pre všetky pozície
+    get_summary_store().invalidate(summary_cells(rows, all_positions=True))
+    publish_changes(rows)
 
-def get_chip_assignments(df_raw: pd.DataFrame, monday):
+def update_attendance_records(rows) -> list:
     """
-    Vygeneruje mapovanie (pozícia, smena, deň) -> [user_codes].
+    Hromadná úprava: z riadkov attendance (s id) sa jedným dávkovým update podľa id zapíšu len EDITABLE_COLUMNS
+    (pozícia, akcia, valid) a cache sa zahodí raz. Riadok, ktorý medzitým niekto zmazal, sa znova nevloží.
+    Vráti výsledok pre každý riadok ako save_attendance_batch.
     """
-    assignments = {}
-    if df_raw.empty:
-        return assignments
-
-    df_raw["timestamp"] = pd.to_datetime(df_raw["timestamp"], errors="coerce")
-    df_raw["date"] = df_raw["timestamp"].dt.date
-
-    for pos in df_raw["position"].unique():
-        pos_df = df_raw[df_raw["position"] == pos]
-        for i in range(7):
-            d = monday + _tdelta(days=i)
-            day_df = pos_df[pos_df["date"] == d]
-            if day_df.empty:
-                continue
-            pairs = get_user_pairs(day_df)
-            for user, pair in pairs.items():
-                if pd.isna(pair["pr"]) or pd.isna(pair["od"]):
-                    continue
-                pr_t = pair["pr"].time()
-                od_t = pair["od"].time()
-
-                # Ranná
-                if pr_t <= time(7, 0) and od_t <= time(15, 0):
-                    shift = "06:00-14_00"
-                # Poobedná
-                elif pr_t >= time(13, 0) and od_t >= time(21, 0):
-                    shift = "14:00-22:00"
-                # Dvojitá
-                elif pr_t <= time(7, 0) and (od_t >= time(21, 0) or od_t < time(2, 0)):
-                    assignments[(pos, "06:00-14_00", i)] = assignments.get((pos, "06:00-14_00", i), []) + [user]
-                    assignments[(pos, "14:00-22:00", i)] = assignments.get((pos, "14:00-22:00", i), []) + [user]
-                    continue
-                else:
-                    continue
-
-                assignments[(pos, shift, i)] = assignments.get((pos, shift, i), []) + [user]
-    return assignments
-
-def excel_with_colors(df_matrix, df_day_details, df_raw, monday):
-    """
-    Vytvorí farebný Excel so 4 sheetmi:
-    - Týždenný prehľad
-    - Denné - detail
-    - Surové dáta
-    - Rozpis čipov
-    """
-    wb = Workbook()
-    ws1 = wb.active
-    ws1.title = "Týždenný prehľad"
-    green = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    yellow = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
-
-    # === SHEET 1: Týždenný prehľad ===
-    for r in dataframe_to_rows(df_matrix.reset_index().rename(columns={"index": "Pozícia"}), index=False, header=True):
-        ws1.append(r)
-
-    for row in ws1.iter_rows(min_row=2, min_col=2, max_col=1 + len(df_matrix.columns), max_row=1 + len(df_matrix)):
-        for cell in row:
-            val = cell.value
-            if isinstance(val, (int, float)):
-                cell.fill = green
-            elif isinstance(val, str) and val.strip().startswith("⚠"):
-                cell.fill = yellow
-
-    # === SHEET 2: Denné - detail ===
-    ws2 = wb.create_sheet("Denné - detail")
-    for r in dataframe_to_rows(df_day_details, index=False, header=True):
-        ws2.append(r)
-
-    # === SHEET 3: Surové dáta ===
-    ws3 = wb.create_sheet("Surové dáta")
-    for r in dataframe_to_rows(df_raw, index=False, header=True):
-        ws3.append(r)
-
-    # === SHEET 4: Rozpis čipov ===
-    ws4 = wb.create_sheet("Rozpis čipov")
-    days = ["pondelok", "utorok", "streda", "štvrtok", "piatok", "sobota", "nedeľa"]
-    header = ["position", "shift"] + days
-    ws4.append(header)
-
-    chip_map = get_chip_assignments(df_raw, monday)
-    POS = sorted(df_raw["position"].unique()) if not df_raw.empty else POSITIONS
-
-    for pos in POS:
-        for shift in ["06:00-14_00", "14:00-22:00"]:
-            row_vals = []
-            for i in range(7):
-                users = chip_map.get((pos, shift, i), [])
-                row_vals.append(", ".join(users) if users else "")
-            ws4.append([pos, shift] + row_vals)
-
-    for col in ws4.columns:
-        for cell in col:
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    # --- Uloženie ---
-    out = BytesIO()
-    wb.save(out)
-    out.seek(0)
-    return out
+    results, payload, slots = [], [], []
+    for row in rows:
+        if row.get("position") not in POSITIONS:
+            error = f"neznáma pozícia: {row.get('position')}"
+        elif row.get("action") not in ATTENDANCE_ACTIONS:
+            error = f"neznáma akcia: {row.get('action')}"
+        else:
+            error = None
+        results.append({"ok": False, "id": row.get("id"), "error": error})
+        if error:
+            continue
+        payload.append({"id": int(row["id"]), "position": row["position"], "action": row["action"],
+                        "valid": bool(row.get("valid"))})
+        slots.append(len(results) - 1)
+
+    if not payload:
+        return results
+    with stage("update_attendance_records", rows=len(payload)):
+        saved = get_backend().update_many(payload)
+    # dni podľa pôvodných riadkov aj podľa DB (timestamp sa úpravou nemení)
+    get_summary_store().invalidate(summary_cells([rows[slot] for slot in slots] + saved, all_positions=True))
+    publish_changes(saved)
+    saved_ids = {int(r["id"]) for r in saved}
+    for slot in slots:
+        if int(rows[slot]["id"]) in saved_ids:
+            results[slot]["ok"] = True
+        else:
+            results[slot]["error"] = "záznam už neexistuje"
+    return results
+
+# ================== EXPORTY ==================
+@st.cache_resource
+def get_export_jobs() -> ExportJobs:
+    """Jeden pool exportov pre celý proces (zdieľaný medzi rerunmi aj reláciami)."""
+    return ExportJobs()
 
 # ================== STREAMLIT UI ==================
-st.title("🕓 Admin — Dochádzka (Denný + Týždenný prehľad)")
-
-# --- Login ---
-if "admin_logged" not in st.session_state:
-    st.session_state.admin_logged = False
-
-if not st.session_state.admin_logged:
-    st.sidebar.header("Admin prihlásenie")
-    pw = st.sidebar.text_input("Heslo", type="password")
-    if st.sidebar.button("Prihlásiť"):
-        if ADMIN_PASS and pw == ADMIN_PASS:
-            st.session_state.admin_logged = True
-            st.experimental_rerun()
-        else:
-            st.sidebar.error("Nesprávne heslo alebo ADMIN_PASS nie je nastavené.")
-if not st.session_state.admin_logged:
-    st.stop()
-
-# --- Výber týždňa a dňa ---
-today = datetime.now(tz).date()
-week_ref = st.sidebar.date_input(
-    "Vyber deň v týždni (týždeň začína pondelkom):",
-    value=today
-)
-monday = week_ref - timedelta(days=week_ref.weekday())
-start_dt = tz.localize(datetime.combine(monday, time(0, 0)))
-end_dt = tz.localize(datetime.combine(monday + timedelta(days=7), time(0, 0)))
-df_week = load_attendance(start_dt, end_dt)
-
-# 🔧 Prednastavenie denného výberu
-default_day = today if monday <= today <= monday + timedelta(days=6) else monday
-selected_day = st.sidebar.date_input(
-    "Denný prehľad - vyber deň",
-    value=default_day,
-    min_value=monday,
-    max_value=monday + timedelta(days=6)
-)
-df_day = df_week[df_week["date"] == selected_day] if not df_week.empty else pd.DataFrame()
-
-if df_week.empty:
-    st.warning("Rozsah nie je dostupný v DB (žiadne dáta pre vybraný týždeň).")
-else:
-    summary = summarize_day(df_day, selected_day)
-
-# ================== Denný prehľad zobrazenie ==================
-st.header(f"✅ Denný prehľad — {selected_day.strftime('%A %d.%m.%Y')}")
-cols = st.columns(3)
-day_details_rows = []
-
-for i, pos in enumerate(POSITIONS):
-    col = cols[i % 3]
-    info = summary[pos]
-    m = info["morning"]
-    p = info["afternoon"]
-
-    col.markdown(f"### **{pos}**")
-    col.markdown(f"**Ranná:** {m['status']} — {m['hours']} h")
-    col.markdown(f"**Poobedná:** {p['status']} — {p['hours']} h")
-
-    if info["details"]:
-        for d in info["details"]:
-            col.error(d)
-
-    day_details_rows.append({
-        "position": pos,
-        "morning_status": m['status'],
-        "morning_hours": m.get('hours', 0),
-        "morning_detail": m.get('detail') or "-",
-        "afternoon_status": p['status'],
-        "afternoon_hours": p.get('hours', 0),
-        "afternoon_detail": p.get('detail') or "-",
-        "total_hours": info['total_hours']
-    })
-
-    # ak ide o minulý deň, zobrazíme formuláre na doplnenie chýbajúcich záznamov
-    if selected_day < today and info["details"]:
-        for idx, d in enumerate(info["details"]):
-            if "missing_prichod" in d:
-                st.markdown(f"#### Doplniť chýbajúci PRÍCHOD pre pozíciu {pos}")
-                user_code = st.text_input(f"User code ({pos})", value="USER123456", key=f"{pos}_prichod_user_{idx}")
-                hour = st.select_slider("Hodina", options=list(range(6, 23, 1)), key=f"{pos}_prichod_hour_{idx}")
-                minute = st.select_slider("Minúta", options=[0, 15, 30, 45], key=f"{pos}_prichod_minute_{idx}")
-                if st.button(f"Uložiť príchod ({pos})", key=f"{pos}_prichod_save_{idx}"):
-                    ts = tz.localize(datetime.combine(selected_day, time(hour, minute)))
-                    save_attendance(user_code, pos, "Príchod", ts)
-                    st.success("Záznam uložený ✅")
-                    st.experimental_rerun()
-            if "missing_odchod" in d:
-                st.markdown(f"#### Doplniť chýbajúci ODCHOD pre pozíciu {pos}")
-                user_code = st.text_input(f"User code ({pos})", value="USER123456", key=f"{pos}_odchod_user_{idx}")
-                hour = st.select_slider("Hodina", options=list(range(6, 23, 1)), key=f"{pos}_odchod_hour_{idx}")
-                minute = st.select_slider("Minúta", options=[0, 15, 30, 45], key=f"{pos}_odchod_minute_{idx}")
-                if st.button(f"Uložiť odchod ({pos})", key=f"{pos}_odchod_save_{idx}"):
-                    ts = tz.localize(datetime.combine(selected_day, time(hour, minute)))
-                    save_attendance(user_code, pos, "Odchod", ts)
-                    st.success("Záznam uložený ✅")
-                    st.experimental_rerun()
+def render_stage_panel():
+    """Sidebar panel s meraniami aktuálneho rerunu a posledným cProfile dumpom."""
+    st.sidebar.subheader("⏱️ Merania rerunu")
+    records = stage_records()
+    if records:
+        st.sidebar.dataframe(pd.DataFrame(records).drop(columns=["thread"]), use_container_width=True)
+        st.sidebar.caption(f"Spolu: {sum(r['ms'] for r in records):.0f} ms")
+    else:
+        st.sidebar.caption("Žiadne merania.")
+    connections = get_backend().connection_stats()
+    if connections:
+        with st.sidebar.expander("🔌 Spojenia na DB (celý proces)"):
+            st.dataframe(pd.Series(connections, name="hodnota").astype(str), use_container_width=True)
+    dump = st.session_state.get("profile_dump")
+    if dump:
+        st.sidebar.download_button(
+            "Stiahnuť pstats (posledný profilovaný rerun)",
+            data=dump["data"],
+            file_name=f"dochadzka_{dump['at']}.pstats",
+            mime="application/octet-stream"
+        )
+        with st.sidebar.expander("cProfile — top funkcie"):
+            st.code(dump["text"])
+
+def run_app():
+    """main() s novým zoznamom meraní; so zapnutým "profile_rerun" beží celý rerun pod cProfile."""
+    begin_stages()
+    if not st.session_state.get("profile_rerun"):
+        main()
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(main)
+    finally:
+        profiler.create_stats()
+        # rovnaký formát ako Profile.dump_stats, otvorí sa cez pstats.Stats("súbor.pstats")
+        data = marshal.dumps(profiler.stats)
+        text = StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(25)
+        st.session_state["profile_dump"] = {
+            "at": datetime.now(tz).strftime("%Y%m%d_%H%M%S"),
+            "data": data,
+            "text": text.getvalue(),
+        }
 
-# ================== Týždenný prehľad ==================
-st.header(f"📅 Týždenný prehľad ({monday.strftime('%d.%m.%Y')} – {(monday + timedelta(days=6)).strftime('%d.%m.%Y')})")
-days = [monday + timedelta(days=i) for i in range(7)]
-cols_matrix = [d.strftime("%a %d.%m") for d in days]
-matrix = pd.DataFrame(index=POSITIONS, columns=cols_matrix)
-
-for d in days:
-    df_d = df_week[df_week["date"] == d] if not df_week.empty else pd.DataFrame()
-    summ = summarize_day(df_d, d)
-    for pos in POSITIONS:
-        matrix.at[pos, d.strftime("%a %d.%m")] = summ[pos]["total_hours"] if summ[pos]["total_hours"] > 0 else "—"
-
-matrix["Spolu"] = matrix.apply(lambda row: sum(x if isinstance(x, (int, float)) else 0 for x in row), axis=1)
-st.dataframe(matrix.fillna("—"), use_container_width=True)
-
-# ================== Export Excel ==================
-if st.button("Exportuj Excel (Farebné)"):
-    df_matrix = matrix.reset_index().rename(columns={"index": "position"})
-    df_day_details = pd.DataFrame(day_details_rows)
-    df_raw = df_week.copy()
-    if "timestamp" in df_raw.columns:
-        df_raw["timestamp"] = df_raw["timestamp"].apply(lambda x: x.isoformat() if pd.notna(x) else "")
-    xls = excel_with_colors(df_matrix, df_day_details, df_raw, monday)
-    st.download_button(
-        "Stiahnuť XLSX",
-        data=xls,
-        file_name=f"dochadzka_{monday}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+def main():
+    st.set_page_config(
+        page_title="Admin - Dochádzka",
+        layout="wide",
+        initial_sidebar_state="expanded"
     )
-
-# --- dvojtýždňová kontrola duplicít (voliteľné zobrazenie) ---
-start_2w = today - timedelta(days=7)
-start_dt_2w = tz.localize(datetime.combine(start_2w, time(0, 0)))
-end_dt_2w = tz.localize(datetime.combine(today + timedelta(days=1), time(0, 0)))
-df_2w = load_attendance(start_dt_2w, end_dt_2w)
-
-df_2w_summary = []
-for pos in POSITIONS:
-    pos_df = df_2w[df_2w["position"] == pos] if not df_2w.empty else pd.DataFrame()
-    pairs = get_user_pairs(pos_df)
-    for user, pair in pairs.items():
-        pr_count = pair["pr_count"]
-        od_count = pair["od_count"]
-        if pr_count != 1 or od_count != 1:
-            df_2w_summary.append({
-                "position": pos,
-                "user_code": user,
-                "pr_count": pr_count,
-                "od_count": od_count,
-                "first_pr": pair["pr"],
-                "last_od": pair["od"]
-            })
-
-
-st.divider()
-st.header("🛠️ Manuálna oprava záznamu (podľa ID)")
-
-with st.expander("✏️ Upraviť existujúci záznam"):
-    record_id = st.number_input(
-        "Zadaj ID záznamu (attendance.id)",
-        min_value=1,
-        step=1
+    st.markdown(hide_css, unsafe_allow_html=True)
+    ADMIN_PASS = st.secrets.get("ADMIN_PASS", "")
+
+    st.title("🕓 Admin — Dochádzka (Denný + Týždenný prehľad)")
+
+    # --- Login ---
+    if "admin_logged" not in st.session_state:
+        st.session_state.admin_logged = False
+
+    if not st.session_state.admin_logged:
+        st.sidebar.header("Admin prihlásenie")
+        pw = st.sidebar.text_input("Heslo", type="password")
+        if st.sidebar.button("Prihlásiť"):
+            if ADMIN_PASS and pw == ADMIN_PASS:
+                st.session_state.admin_logged = True
+                st.experimental_rerun()
+            else:
+                st.sidebar.error("Nesprávne heslo alebo ADMIN_PASS nie je nastavené.")
+    if not st.session_state.admin_logged:
+        st.stop()
+
+    # --- Merania (len pre prihláseného admina) ---
+    show_stages = st.sidebar.checkbox("⏱️ Merania", key="show_stages")
+    st.sidebar.checkbox("Profilovať celý rerun (cProfile)", key="profile_rerun")
+    live = st.sidebar.checkbox("🔴 Živé zmeny (obnoví sa pri novom pípnutí)", key="live_updates")
+    live_feed = get_change_feed() if live else None
+    live_version = live_feed.version if live else None
+
+    # --- Výber týždňa a dňa ---
+    today = datetime.now(tz).date()
+    week_ref = st.sidebar.date_input(
+        "Vyber deň v týždni (týždeň začína pondelkom):",
+        value=today
     )
+    monday = week_ref - timedelta(days=week_ref.weekday())
+    start_dt = tz.localize(datetime.combine(monday, time(0, 0)))
+    end_dt = tz.localize(datetime.combine(monday + timedelta(days=7), time(0, 0)))
+    if live:
+        # živý režim: záznamy týždňa v cache dopĺňa ChangeFeed, prepočítajú sa len dotknuté (deň, pozícia)
+        week_summary = live_week_summary(monday, load_attendance(*pairing_range(start_dt, end_dt)))
+        pairs_week = week_summary.pair_table
+        st.sidebar.caption(
+            f"Páry v týždni: {len(pairs_week)} (z DB teraz: {get_attendance_cache().fetched_rows(start_dt, end_dt)} riadkov)"
+        )
+    else:
+        pairs_week = load_attendance_pairs(start_dt, end_dt)
+        st.sidebar.caption(
+            f"Páry v týždni: {len(pairs_week)} (z DB teraz: {get_pairs_cache().fetched_rows(start_dt, end_dt)} riadkov)"
+        )
 
-    change_type = st.selectbox(
-        "Čo chceš zmeniť?",
-        ["Pozícia", "Aktivita (Príchod / Odchod)"]
+    # 🔧 Prednastavenie denného výberu
+    default_day = today if monday <= today <= monday + timedelta(days=6) else monday
+    selected_day = st.sidebar.date_input(
+        "Denný prehľad - vyber deň",
+        value=default_day,
+        min_value=monday,
+        max_value=monday + timedelta(days=6)
     )
-
-    if change_type == "Pozícia":
-        new_value = st.selectbox(
-            "Nová pozícia",
-            POSITIONS
+    if not live:
+        week_summary = get_week_summary(monday, pairs_week.attrs.get("data_version"), pairs_week)
+
+    if pairs_week.empty:
+        st.warning("Rozsah nie je dostupný v DB (žiadne dáta pre vybraný týždeň).")
+    summary = week_summary.day(selected_day)
+
+    # ================== Denný prehľad zobrazenie ==================
+    st.header(f"✅ Denný prehľad — {selected_day.strftime('%A %d.%m.%Y')}")
+    cols = st.columns(3)
+
+    for i, pos in enumerate(POSITIONS):
+        col = cols[i % 3]
+        info = summary[pos]
+        m = info["morning"]
+        p = info["afternoon"]
+
+        col.markdown(f"### **{pos}**")
+        col.markdown(f"**Ranná:** {m['status']} — {m['hours']} h")
+        col.markdown(f"**Poobedná:** {p['status']} — {p['hours']} h")
+
+        if info["details"]:
+            for d in info["details"]:
+                col.error(d)
+
+    # ak ide o minulý deň, chýbajúce záznamy sa doplnia naraz v jednom formulári
+    if selected_day < today:
+        missing = missing_record_rows(summary)
+        if not missing.empty:
+            with st.form(f"missing_records_{selected_day}"):
+                st.markdown("#### Doplniť chýbajúce príchody / odchody")
+                edited = st.data_editor(
+                    missing,
+                    hide_index=True,
+                    disabled=["pozícia", "akcia"],
+                    column_config={
+                        "hodina": st.column_config.SelectboxColumn("Hodina", options=list(range(6, 23))),
+                        "minúta": st.column_config.SelectboxColumn("Minúta", options=[0, 15, 30, 45]),
+                        "uložiť": st.column_config.CheckboxColumn("Uložiť"),
+                    },
+                    key=f"missing_editor_{selected_day}",
+                )
+                if st.form_submit_button("💾 Uložiť označené záznamy"):
+                    to_save = edited[edited["uložiť"]]
+                    results = save_attendance_batch([
+                        (row.user_code, row.pozícia, row.akcia,
+                         tz.localize(datetime.combine(selected_day, time(int(row.hodina), int(row.minúta)))))
+                        for row in to_save.itertuples(index=False)
+                    ])
+                    for row, res in zip(to_save.itertuples(index=False), results):
+                        if not res["ok"]:
+                            st.error(f"{row.pozícia} {row.akcia}: {res['error']}")
+                    if any(res["ok"] for res in results):
+                        st.experimental_rerun()
+                    if not results:
+                        st.warning("⚠️ Označ riadky a vyplň user code.")
+
+    # ================== Týždenný prehľad ==================
+    st.header(f"📅 Týždenný prehľad ({monday.strftime('%d.%m.%Y')} – {(monday + timedelta(days=6)).strftime('%d.%m.%Y')})")
+    matrix = week_summary.matrix()
+    st.dataframe(matrix, use_container_width=True)
+
+    # ================== Export Excel ==================
+    # export sa robí na pozadí a pamätá sa podľa verzie dát; uzavretý týždeň sa pripraví hneď
+    export_jobs = get_export_jobs()
+    export_key = (monday, pairs_week.attrs.get("data_version"), selected_day)
+    export_job = export_jobs.get(export_key)
+    week_closed = monday + timedelta(days=7) <= today
+    export_clicked = st.button("Exportuj Excel (Farebné)")
+    if export_clicked or (export_job is None and week_closed):
+        export_job = export_jobs.submit(
+            export_key, build_week_export,
+            monday, week_summary, selected_day, get_attendance_cache(), start_dt, end_dt
         )
-        field = "position"
+    if export_job is not None:
+        if not export_job.done():
+            st.info("⏳ Export sa pripravuje na pozadí…")
+            st.button("Obnoviť stav exportu")
+        elif export_job.exception() is not None:
+            st.error(f"Export zlyhal: {export_job.exception()}")
+        else:
+            st.download_button(
+                "Stiahnuť XLSX",
+                data=export_job.result(),
+                file_name=f"dochadzka_{monday}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
 
-    else:
-        new_value = st.selectbox(
-            "Nová aktivita",
-            ["Príchod", "Odchod"]
-        )
-        field = "action"
-
-    if st.button("💾 Uložiť zmenu"):
-        try:
-            update_attendance_record(
-                record_id=int(record_id),
-                field=field,
-                new_value=new_value
+    # ================== Report za obdobie ==================
+    st.header("📆 Report za obdobie (mesiac / rok / vlastný rozsah)")
+    if st.checkbox("Zobraziť report za obdobie", key="range_report"):
+        report_kind = st.radio("Obdobie", ["Mesiac", "Rok", "Vlastný rozsah"], horizontal=True, key="range_kind")
+        if report_kind == "Mesiac":
+            c1, c2 = st.columns(2)
+            r_year = c1.number_input("Rok", min_value=2020, max_value=2100, value=today.year, step=1, key="range_m_year")
+            r_month = c2.selectbox("Mesiac", list(range(1, 13)), index=today.month - 1, key="range_month")
+            range_start = date(int(r_year), r_month, 1)
+            range_end = (range_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        elif report_kind == "Rok":
+            r_year = st.number_input("Rok", min_value=2020, max_value=2100, value=today.year, step=1, key="range_y_year")
+            range_start, range_end = date(int(r_year), 1, 1), date(int(r_year), 12, 31)
+        else:
+            picked = st.date_input("Od – do", value=(monday, monday + timedelta(days=6)), key="range_custom")
+            range_start, range_end = (picked[0], picked[-1]) if isinstance(picked, (list, tuple)) else (picked, picked)
+
+        range_start_dt = tz.localize(datetime.combine(range_start, time(0, 0)))
+        range_end_dt = tz.localize(datetime.combine(range_end + timedelta(days=1), time(0, 0)))
+        range_version = load_attendance_pairs(range_start_dt, range_end_dt).attrs.get("data_version")
+        range_key = ("obdobie", range_start, range_end, range_version)
+        range_job = export_jobs.get(range_key)
+        if st.button(f"Vytvoriť report {range_start.strftime('%d.%m.%Y')} – {range_end.strftime('%d.%m.%Y')}"):
+            range_job = export_jobs.submit(
+                range_key, build_range_export, range_start, range_end, get_pairs_cache(), get_attendance_cache(),
+                get_summary_store()
+            )
+        if range_job is not None:
+            if not range_job.done():
+                st.info("⏳ Report sa počíta na pozadí…")
+                st.button("Obnoviť stav reportu")
+            elif range_job.exception() is not None:
+                st.error(f"Report zlyhal: {range_job.exception()}")
+            else:
+                range_report, range_xls = range_job.result()
+                st.dataframe(range_report.matrix(), use_container_width=True)
+                st.download_button(
+                    "Stiahnuť XLSX za obdobie",
+                    data=range_xls,
+                    file_name=f"dochadzka_{range_start}_{range_end}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+
+    # ================== Hodiny po čipoch ==================
+    st.header("👷 Hodiny po čipoch")
+    if st.checkbox("Zobraziť hodiny po čipoch (kontrola miezd)", key="show_ledger"):
+        picked = st.date_input("Od – do", value=(today.replace(day=1), today), key="ledger_range")
+        ledger_start, ledger_end = (picked[0], picked[-1]) if isinstance(picked, (list, tuple)) else (picked, picked)
+        ledger_start_dt = tz.localize(datetime.combine(ledger_start, time(0, 0)))
+        ledger_end_dt = tz.localize(datetime.combine(ledger_end + timedelta(days=1), time(0, 0)))
+        ledger_pairs = load_attendance_pairs(ledger_start_dt, ledger_end_dt)
+        ledger = get_guard_ledger(ledger_start, ledger_end, ledger_pairs.attrs.get("data_version"), ledger_pairs)
+        ledger_users = st.multiselect("Čipy (prázdne = všetky)", ledger.users(), key="ledger_users")
+        totals = ledger.totals(ledger_start, ledger_end, ledger_users or None)
+        if totals.empty:
+            st.info("V období nie sú žiadne páry.")
+        else:
+            st.dataframe(totals, use_container_width=True)
+            st.download_button(
+                "Stiahnuť CSV",
+                data=totals.to_csv().encode("utf-8"),
+                file_name=f"hodiny_{ledger_start}_{ledger_end}.csv",
+                mime="text/csv"
             )
-            st.success(f"Záznam ID {record_id} bol úspešne upravený ✅")
-            st.experimental_rerun()
-        except Exception as e:
-            st.error(f"Chyba pri ukladaní: {e}")
-
-# --- posledných 12 dní (okrem dnes) ---
-start_5d = today - timedelta(days=4)
-days_5d = [start_5d + timedelta(days=i) for i in range(5)]
-st.subheader("📝 Doplnkové smeny za posledné 4 dní")
-
-for day in days_5d:
-    st.markdown(f"### 📅 {day.strftime('%A %d.%m.%Y')}")
-    df_day = df_week[df_week["date"] == day] if not df_week.empty else pd.DataFrame()
-    summary = summarize_day(df_day, day)
-
-    for pos in POSITIONS:
-        morning = summary[pos]["morning"]
-        afternoon = summary[pos]["afternoon"]
-
-        # ======== Doplniť rannú smenu ========
-        if morning["status"] not in ("Ranna OK", "R+P OK"):
-            st.markdown(f"#### 🌅 Doplniť rannú smenu — {pos}")
-            user_code_m = st.text_input(
-                f"Zadaj čip pre rannú ({pos}, {day})",
-                key=f"user_m_{pos}_{day}"
+            ledger_user = st.selectbox("Detail čipu", totals.index.tolist(), key="ledger_user")
+            st.dataframe(ledger.user_days(ledger_user, ledger_start, ledger_end), use_container_width=True)
+
+    # ================== Anomálie (posledné 2 týždne) ==================
+    # počíta sa len pri otvorenej sekcii, index sa dopĺňa o nové riadky z cache
+    st.header("🔍 Anomálie — posledné 2 týždne")
+    if st.checkbox("Zobraziť anomálie (počty, dvojité pípnutia, prekrývanie smien)", key="show_anomalies"):
+        start_2w = today - timedelta(days=7)
+        start_dt_2w = tz.localize(datetime.combine(start_2w, time(0, 0)))
+        end_dt_2w = tz.localize(datetime.combine(today + timedelta(days=1), time(0, 0)))
+        anomaly_index = get_anomaly_index(start_dt_2w, end_dt_2w)
+        anomaly_index.refresh(load_attendance(start_dt_2w, end_dt_2w))
+        anomalies = anomaly_index.table()
+        if anomalies.empty:
+            st.success("Žiadne anomálie ✅")
+        else:
+            st.dataframe(anomalies, use_container_width=True)
+            anomaly_user = st.selectbox("Detail čipu", anomaly_index.users(), key="anomaly_user")
+            st.dataframe(anomalies[anomalies["user_code"] == anomaly_user], use_container_width=True)
+            st.dataframe(anomaly_index.user_taps(anomaly_user), use_container_width=True)
+
+    st.divider()
+    st.header("🛠️ Hromadná úprava záznamov")
+
+    # editor načíta záznamy týždňa len pri zapnutej sekcii; zmeny sa uložia naraz po odoslaní formulára
+    if st.checkbox("Upraviť záznamy týždňa v tabuľke", key="bulk_edit"):
+        week_days = [monday + timedelta(days=i) for i in range(7)]
+        fcols = st.columns(3)
+        edit_day = fcols[0].selectbox(
+            "Deň", [None] + week_days, format_func=lambda d: "celý týždeň" if d is None else d.strftime("%a %d.%m."),
+            key="bulk_edit_day"
+        )
+        edit_positions = fcols[1].multiselect("Pozície", POSITIONS, key="bulk_edit_positions")
+        edit_user = fcols[2].text_input("User code", key="bulk_edit_user")
+        original = attendance_edit_frame(load_attendance(start_dt, end_dt), edit_day, edit_positions, edit_user)
+
+        with st.form("bulk_edit_form"):
+            edited = st.data_editor(
+                original,
+                hide_index=True,
+                use_container_width=True,
+                disabled=["id", "user_code", "timestamp"],
+                column_config={
+                    "position": st.column_config.SelectboxColumn("pozícia", options=POSITIONS, required=True),
+                    "action": st.column_config.SelectboxColumn("akcia", options=list(ATTENDANCE_ACTIONS), required=True),
+                    "valid": st.column_config.CheckboxColumn("platný"),
+                },
+                key="bulk_edit_editor",
             )
-            if st.button(f"💾 Uložiť rannú — {pos} ({day})", key=f"{pos}_morning_btn_{day}"):
-                if not user_code_m.strip():
-                    st.warning("⚠️ Zadaj čip používateľa!")
-                else:
-                    ts_pr = tz.localize(datetime.combine(day, time(6, 0, 0, 123456)))
-                    ts_od = tz.localize(datetime.combine(day, time(14, 0, 0, 654321)))
-                    save_attendance(user_code_m, pos, "Príchod", ts_pr)
-                    save_attendance(user_code_m, pos, "Odchod", ts_od)
-                    st.success(f"Ranná smena pre {pos} uložená ✅")
+            if st.form_submit_button("💾 Uložiť zmeny"):
+                changes = attendance_changes(original, edited)
+                results = update_attendance_records(changes)
+                for row, res in zip(changes, results):
+                    if not res["ok"]:
+                        st.error(f"Záznam ID {row['id']}: {res['error']}")
+                if any(res["ok"] for res in results):
                     st.experimental_rerun()
+                if not changes:
+                    st.info("Žiadne zmeny.")
 
-        # ======== Doplniť poobednú smenu ========
-        if afternoon["status"] not in ("Poobedna OK", "R+P OK"):
-            st.markdown(f"#### 🌇 Doplniť poobednú smenu — {pos}")
-            user_code_p = st.text_input(
-                f"Zadaj čip pre poobednú ({pos}, {day})",
-                key=f"user_p_{pos}_{day}"
+    st.header("🛠️ Manuálna oprava záznamu (podľa ID)")
+
+    with st.expander("✏️ Upraviť existujúci záznam"):
+        record_id = st.number_input(
+            "Zadaj ID záznamu (attendance.id)",
+            min_value=1,
+            step=1
+        )
+
+        change_type = st.selectbox(
+            "Čo chceš zmeniť?",
+            ["Pozícia", "Aktivita (Príchod / Odchod)"]
+        )
+
+        if change_type == "Pozícia":
+            new_value = st.selectbox(
+                "Nová pozícia",
+                POSITIONS
             )
-            if st.button(f"💾 Uložiť poobednú — {pos} ({day})", key=f"{pos}_afternoon_btn_{day}"):
-                if not user_code_p.strip():
-                    st.warning("⚠️ Zadaj čip používateľa!")
-                else:
-                    ts_pr = tz.localize(datetime.combine(day, time(14, 0, 0, 234567)))
-                    ts_od = tz.localize(datetime.combine(day, time(22, 0, 0, 987654)))
-                    save_attendance(user_code_p, pos, "Príchod", ts_pr)
-                    save_attendance(user_code_p, pos, "Odchod", ts_od)
-                    st.success(f"Poobedná smena pre {pos} uložená ✅")
+            field = "position"
+
+        else:
+            new_value = st.selectbox(
+                "Nová aktivita",
+                ["Príchod", "Odchod"]
+            )
+            field = "action"
+
+        if st.button("💾 Uložiť zmenu"):
+            try:
+                update_attendance_record(
+                    record_id=int(record_id),
+                    field=field,
+                    new_value=new_value
+                )
+                st.success(f"Záznam ID {record_id} bol úspešne upravený ✅")
+                st.experimental_rerun()
+            except Exception as e:
+                st.error(f"Chyba pri ukladaní: {e}")
+
+    # --- posledné 4 dni + dnes: doplnkové smeny v jednom formulári ---
+    start_5d = today - timedelta(days=4)
+    days_5d = [start_5d + timedelta(days=i) for i in range(5)]
+    st.subheader("📝 Doplnkové smeny za posledné 4 dní")
+
+    # vlastný rozsah (dni môžu byť mimo vybraného týždňa); prepočet len pri novej verzii dát,
+    # písanie do editora vo formulári rerun nespúšťa
+    start_dt_5d = tz.localize(datetime.combine(start_5d, time(0, 0)))
+    end_dt_5d = tz.localize(datetime.combine(today + timedelta(days=1), time(0, 0)))
+    pairs_5d = load_attendance_pairs(start_dt_5d, end_dt_5d)
+    open_key = (start_5d, pairs_5d.attrs.get("data_version"))
+    if st.session_state.get("open_shifts_key") != open_key:
+        report_5d = RangeReport(start_5d, today, pairs_5d)
+        st.session_state["open_shifts"] = open_shift_rows(days_5d, report_5d.day)
+        st.session_state["open_shifts_key"] = open_key
+    open_shifts = st.session_state["open_shifts"]
+
+    if open_shifts.empty:
+        st.success("Všetky smeny sú pokryté ✅")
+    else:
+        with st.form("supplementary_shifts"):
+            edited = st.data_editor(
+                open_shifts,
+                hide_index=True,
+                disabled=["deň", "pozícia", "smena", "stav"],
+                column_config={"čip": st.column_config.TextColumn("Čip", help="Čip strážnika, ktorý smenu odslúžil")},
+                key=f"supplementary_editor_{open_key}",
+            )
+            if st.form_submit_button("💾 Uložiť všetky doplnené smeny"):
+                filled = edited[edited["čip"].fillna("").str.strip() != ""]
+                records = []
+                for row in filled.itertuples(index=False):
+                    t_pr, t_od = SUPPLEMENT_SHIFTS[row.smena]
+                    records.append((row.čip, row.pozícia, "Príchod", tz.localize(datetime.combine(row.deň, t_pr))))
+                    records.append((row.čip, row.pozícia, "Odchod", tz.localize(datetime.combine(row.deň, t_od))))
+                results = save_attendance_batch(records)
+                for rec, res in zip(records, results):
+                    if not res["ok"]:
+                        st.error(f"{rec[1]} {rec[0]} ({rec[2]}): {res['error']}")
+                if any(res["ok"] for res in results):
                     st.experimental_rerun()
+                if not records:
+                    st.warning("⚠️ Zadaj čip aspoň pri jednej smene!")
+
+    if show_stages:
+        render_stage_panel()
+
+    if live:
+        # čaká sa na zmenu v ChangeFeed; výpis do sidebaru dovolí Streamlitu prerušiť čakanie pri kliknutí
+        waiting = st.sidebar.empty()
+        deadline = perf_counter() + LIVE_WAIT_SECONDS
+        while not live_feed.wait(live_version, 1.0) and perf_counter() < deadline:
+            waiting.caption(f"🔴 Čaká sa na zmeny… ({deadline - perf_counter():.0f} s)")
+        st.experimental_rerun()
+
+
+if __name__ == "__main__":
+    run_app()
@@ -0,0 +1,46 @@
+"""Spoločné fixtures: SQLiteBackend v pamäti ako náhrada DB a záznamy attendance."""
+import os
+import sys
+from datetime import date
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dochadzka as app  # noqa: E402
+from benchmark import generate_attendance  # noqa: E402
+
+MONDAY = date(2025, 1, 6)
+
+
+def tap(user, position, action, when: str) -> dict:
+    """Jeden záznam pre AttendanceBackend.insert; when = "YYYY-MM-DD HH:MM" v lokálnom čase."""
+    return {"user_code": user, "position": position, "action": action,
+            "timestamp": f"{when}:00.000000+00", "valid": True}
+
+
+def prepared_delta(rows: list) -> pd.DataFrame:
+    """Riadky z ChangeFeed -> pripravený DataFrame pre AttendanceCache.apply (ako apply_changes v aplikácii)."""
+    delta = pd.DataFrame([{c: r.get(c) for c in app.ATTENDANCE_COLUMNS} for r in rows], columns=app.ATTENDANCE_COLUMNS)
+    delta["id"] = delta["id"].astype("int64")
+    delta["valid"] = delta["valid"].fillna(True).astype(bool)
+    return app._prepare_attendance(delta)
+
+
+@pytest.fixture
+def backend():
+    return app.SQLiteBackend(":memory:")
+
+
+@pytest.fixture
+def week_backend(backend):
+    """SQLiteBackend s dvomi týždňami syntetických záznamov od MONDAY."""
+    backend.insert(generate_attendance(2, guards=20, monday=MONDAY))
+    return backend
+
+
+@pytest.fixture(params=["day", "stream"])
+def pairing_mode(request, monkeypatch):
+    monkeypatch.setattr(app, "PAIRING_MODE", request.param)
+    return request.param
@@ -0,0 +1,258 @@
+import json
+import threading
+import time as clock
+from datetime import timedelta
+
+import httpx
+import pandas as pd
+import pytest
+
+import dochadzka as app
+from conftest import MONDAY, tap
+
+
+def rest_client(handler):
+    """Supabase klient, ktorého PostgREST požiadavky vybaví handler (httpx.MockTransport)."""
+    from postgrest.utils import SyncClient
+    from supabase import create_client
+
+    client = create_client("http://localhost:54321", "eyJhbGciOiJIUzI1NiJ9.e30.x")
+    session = client.postgrest.session
+    client.postgrest.session = SyncClient(base_url=session.base_url, headers=session.headers,
+                                          transport=httpx.MockTransport(handler))
+    return client
+
+
+class FakePostgrest:
+    """GET na attendance nad zoznamom riadkov: filtre gte/lt/gt, order=id, stránka z Range orezaná na max_rows."""
+
+    def __init__(self, rows: list, max_rows: int):
+        self.rows = sorted(rows, key=lambda r: r["id"])
+        self.max_rows = max_rows
+        self.ranges = []
+        self._lock = threading.Lock()
+
+    def _matches(self, row, column, condition):
+        op, value = condition.split(".", 1)
+        if column == "timestamp":
+            left, right = pd.Timestamp(row["timestamp"].replace(" ", "T")), pd.Timestamp(value)
+        else:
+            left, right = row[column], int(value)
+        return {"gte": left >= right, "lt": left < right, "gt": left > right}[op]
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        rows = self.rows
+        for column in ("timestamp", "id"):
+            for condition in request.url.params.get_list(column):
+                rows = [r for r in rows if self._matches(r, column, condition)]
+        first, last = (int(x) for x in request.headers["range"].split("-"))
+        page = rows[first:min(last + 1, first + self.max_rows)]
+        with self._lock:
+            self.ranges.append((first, last))
+        total = len(rows) if "count=exact" in request.headers.get("prefer", "") else "*"
+        return httpx.Response(200, json=page, headers={"Content-Range": f"{first}-{first + len(page) - 1}/{total}"})
+
+
+@pytest.mark.parametrize("max_rows", [7, 10, 1000])
+def test_paged_fetch_stitches_pages_without_gaps_or_duplicates(week_backend, monkeypatch, max_rows):
+    monkeypatch.setattr(app, "FETCH_PAGE_SIZE", 10)
+    start_dt, end_dt = app.day_range(MONDAY, MONDAY + timedelta(days=6))
+    source = week_backend.fetch_range(*app.day_range(MONDAY, MONDAY + timedelta(days=13)))
+    server = FakePostgrest(source.to_dict("records"), max_rows)
+    backend = app.SupabaseBackend(rest_client(server))
+
+    df = backend.fetch_range(start_dt, end_dt)
+    expected = week_backend.fetch_range(start_dt, end_dt)
+    assert df["id"].is_unique and df["id"].is_monotonic_increasing
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    page = min(max_rows, 10)
+    assert sorted(server.ranges)[1:] == [(first, first + page - 1) for first in range(page, len(expected), page)]
+
+    after = int(expected["id"].iloc[len(expected) // 2])
+    newer = backend.fetch_range(start_dt, end_dt, after_id=after)
+    assert newer["id"].tolist() == expected.loc[expected["id"] > after, "id"].tolist()
+
+
+def test_attendance_changes_returns_only_edited_rows(week_backend):
+    df = app._prepare_attendance(week_backend.fetch_range(*app.day_range(MONDAY, MONDAY)))
+    original = app.attendance_edit_frame(df, MONDAY)
+    edited = original.copy()
+    first, second, third = original.index[:3]
+    edited.loc[first, "action"] = "Odchod" if original.loc[first, "action"] == "Príchod" else "Príchod"
+    edited.loc[second, "valid"] = False
+    edited.loc[third, "user_code"] = "INY"  # needitovateľný stĺpec sa neberie
+
+    changes = app.attendance_changes(original, edited)
+    assert [r["id"] for r in changes] == sorted([original.loc[first, "id"], original.loc[second, "id"]])
+    assert all(list(r) == app.ATTENDANCE_COLUMNS for r in changes)
+    assert app.attendance_changes(original, original.copy()) == []
+
+
+def test_supabase_update_many_patches_only_editable_columns_by_id():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=[])
+
+    backend = app.SupabaseBackend(rest_client(handler))
+    backend.update_many([
+        {"id": 3, "user_code": "A", "position": "Plombovac", "action": "Odchod", "valid": True, "timestamp": "x"},
+        {"id": 1, "user_code": "B", "position": "Plombovac", "action": "Odchod", "valid": True, "timestamp": "y"},
+        {"id": 2, "user_code": "C", "position": "Veliteľ", "action": "Príchod", "valid": False, "timestamp": "z"},
+    ])
+
+    sent = sorted((r.method, r.url.params["id"], json.loads(r.content)) for r in requests)
+    assert sent == [
+        ("PATCH", "in.(2)", {"position": "Veliteľ", "action": "Príchod", "valid": False}),
+        ("PATCH", "in.(3,1)", {"position": "Plombovac", "action": "Odchod", "valid": True}),
+    ]
+
+
+def test_sqlite_update_many_does_not_bring_back_deleted_rows(backend):
+    rows = backend.insert([tap("A", "Plombovac", "Príchod", f"{MONDAY} 06:00"),
+                           tap("A", "Plombovac", "Odchod", f"{MONDAY} 14:00")])
+    with backend.conn:
+        backend.conn.execute("DELETE FROM attendance WHERE id = ?", [rows[1]["id"]])
+
+    updated = backend.update_many([{**r, "valid": False} for r in rows])
+
+    assert [r["id"] for r in updated] == [rows[0]["id"]]
+    df = backend.fetch_range(*app.day_range(MONDAY, MONDAY))
+    assert df["id"].tolist() == [rows[0]["id"]] and not df["valid"].astype(bool).any()
+
+
+def pooled(handler, **kwargs) -> app.PooledHttp:
+    """PooledHttp bez pauzy medzi opakovaniami, požiadavky vybaví handler."""
+    from postgrest.utils import SyncClient
+
+    http = app.PooledHttp(SyncClient(base_url="http://localhost:54321/rest/v1"), backoff=0, **kwargs)
+    http.session = SyncClient(base_url="http://localhost:54321/rest/v1", transport=httpx.MockTransport(handler))
+    return http
+
+
+def replies(*outcomes):
+    """Handler, ktorý postupne vráti status alebo vyhodí výnimku z outcomes."""
+    outcomes = list(outcomes)
+
+    def handler(request):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, json=[])
+
+    return handler
+
+
+def test_pooled_http_retries_reads_on_transient_status():
+    http = pooled(replies(503, 503, 200))
+    assert http.request("GET", "/attendance").status_code == 200
+    stats = http.stats()
+    assert (stats["requests"], stats["retries"], stats["errors"]) == (3, 2, 0)
+
+    http = pooled(replies(503, 503, 503), retries=2)
+    assert http.request("GET", "/attendance").status_code == 503
+    assert http.stats()["requests"] == 3
+
+
+def test_pooled_http_does_not_repeat_writes_that_reached_the_server():
+    http = pooled(replies(503, 201))
+    assert http.request("POST", "/attendance", json=[]).status_code == 503
+    assert http.stats()["retries"] == 0
+
+    http = pooled(replies(httpx.ReadError("spojenie spadlo"), 201))
+    with pytest.raises(httpx.ReadError):
+        http.request("POST", "/attendance", json=[])
+    stats = http.stats()
+    assert (stats["requests"], stats["retries"], stats["errors"]) == (1, 0, 1)
+
+    # nové spojenie zlyhalo: server požiadavku nedostal, opakuje sa aj zápis
+    http = pooled(replies(httpx.ConnectError("odmietnuté"), 201))
+    assert http.request("POST", "/attendance", json=[]).status_code == 201
+    assert http.stats()["retries"] == 1
+
+    # RPC v tejto aplikácii len číta
+    http = pooled(replies(502, 200))
+    assert http.request("POST", "/rpc/attendance_pairs", json={}).status_code == 200
+
+
+def test_pooled_http_caps_requests_in_flight():
+    lock = threading.Lock()
+    running = [0, 0]  # práve bežiace, najviac naraz
+
+    def handler(request):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        clock.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return httpx.Response(200, json=[])
+
+    http = pooled(handler, max_in_flight=2)
+    threads = [threading.Thread(target=http.request, args=("GET", "/attendance")) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert running[1] == 2
+    assert http.stats()["requests"] == 6
+
+
+def test_archived_backend_round_trip_matches_direct_fetch(week_backend, tmp_path):
+    archive = app.ArchivedBackend(week_backend, str(tmp_path))
+    start_dt, end_dt = app.day_range(MONDAY + timedelta(days=3), MONDAY + timedelta(days=10))
+    expected = app._prepare_attendance(week_backend.fetch_range(start_dt, end_dt))
+
+    first = archive.fetch_range(start_dt, end_dt)
+    again = archive.fetch_range(start_dt, end_dt)
+
+    assert sorted(p.name for p in tmp_path.glob("*.json")) == [f"{MONDAY}.json", f"{MONDAY + timedelta(days=7)}.json"]
+    assert first.attrs["fetched_rows"] > 0 and again.attrs["fetched_rows"] == 0
+    for df in (first, again):
+        pd.testing.assert_frame_equal(df.reset_index(drop=True), expected.reset_index(drop=True), check_like=True)
+    week = archive.fetch_range(*app.day_range(MONDAY, MONDAY + timedelta(days=6)))
+    pd.testing.assert_frame_equal(
+        week, app._prepare_attendance(week_backend.fetch_range(*app.day_range(MONDAY, MONDAY + timedelta(days=6)))),
+        check_like=True,
+    )
+
+
+def test_archived_backend_refetches_only_the_week_changed_in_the_database(week_backend, tmp_path):
+    archive = app.ArchivedBackend(week_backend, str(tmp_path))
+    start_dt, end_dt = app.day_range(MONDAY, MONDAY + timedelta(days=13))
+    archive.fetch_range(start_dt, end_dt)
+    first_week = app._prepare_attendance(week_backend.fetch_range(*app.day_range(MONDAY, MONDAY + timedelta(days=6))))
+
+    # nový riadok mimo archívu zmení počet a max. id: stiahne sa len jeho týždeň
+    second_week = MONDAY + timedelta(days=8)
+    week_backend.insert([tap("N1", "Plombovac", "Príchod", f"{second_week} 13:30")])
+    df = archive.fetch_range(start_dt, end_dt)
+    assert df.attrs["fetched_rows"] == len(df) - len(first_week)
+    assert "N1" in set(df["user_code"])
+    pd.testing.assert_frame_equal(df.reset_index(drop=True),
+                                  app._prepare_attendance(week_backend.fetch_range(start_dt, end_dt)), check_like=True)
+
+
+def test_archived_backend_drops_edited_weeks(week_backend, tmp_path):
+    archive = app.ArchivedBackend(week_backend, str(tmp_path))
+    start_dt, end_dt = app.day_range(MONDAY, MONDAY + timedelta(days=13))
+    archive.fetch_range(start_dt, end_dt)
+    row = week_backend.fetch_range(*app.day_range(MONDAY, MONDAY)).iloc[0].to_dict()
+
+    # úprava mimo archívu počet ani id nemení: ostane stará hodnota, kým ju nezahodí ChangeFeed
+    week_backend.update_many([{**row, "valid": False}])
+    df = archive.fetch_range(start_dt, end_dt)
+    assert df.attrs["fetched_rows"] == 0 and bool(df.loc[df["id"] == row["id"], "valid"].iloc[0])
+    archive.discard_archived([row["timestamp"]])
+    assert not (tmp_path / f"{MONDAY}.json").exists() and (tmp_path / f"{MONDAY + timedelta(days=7)}.json").exists()
+    df = archive.fetch_range(start_dt, end_dt)
+    assert not bool(df.loc[df["id"] == row["id"], "valid"].iloc[0])
+
+    # úprava cez archív zahodí dotknutý týždeň hneď
+    archive.update_many([{**row, "valid": True}])
+    assert not (tmp_path / f"{MONDAY}.json").exists()
+    df = archive.fetch_range(start_dt, end_dt)
+    assert bool(df.loc[df["id"] == row["id"], "valid"].iloc[0])
+    pd.testing.assert_frame_equal(df.reset_index(drop=True),
+                                  app._prepare_attendance(week_backend.fetch_range(start_dt, end_dt)), check_like=True)
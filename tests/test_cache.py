@@ -0,0 +1,169 @@
+import threading
+import time as clock
+from datetime import timedelta
+
+import dochadzka as app
+from conftest import MONDAY, tap
+
+
+class CountingFetch:
+    """Obal backend.fetch_range: počíta volania a súbežné dotazy na rozsah, voliteľne drží dotaz na bráne."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = []
+        self.in_flight = {}
+        self.max_in_flight = {}
+        self.gates = {}
+        self.entered = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, start_dt, end_dt, **kwargs):
+        key = (start_dt, end_dt)
+        with self._lock:
+            self.calls.append((key, kwargs))
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+            self.max_in_flight[key] = max(self.max_in_flight.get(key, 0), self.in_flight[key])
+        try:
+            gate = self.gates.get(key)
+            if gate is not None:
+                self.entered.set()
+                gate.wait(5)
+            return self.backend.fetch_range(start_dt, end_dt, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight[key] -= 1
+
+
+def day_key(offset: int):
+    day = MONDAY + timedelta(days=offset)
+    return app.day_range(day, day)
+
+
+def test_within_refresh_and_ttl_range_comes_from_memory(week_backend):
+    fetch = CountingFetch(week_backend)
+    cache = app.AttendanceCache(fetch, ttl=3600, refresh=3600)
+
+    first = cache.get(*day_key(0))
+    again = cache.get(*day_key(0))
+
+    assert again is first
+    assert len(fetch.calls) == 1
+    assert cache.fetched_rows(*day_key(0)) == 0
+
+
+def test_ttl_reload_keeps_frame_and_version_until_data_change(week_backend):
+    fetch = CountingFetch(week_backend)
+    cache = app.AttendanceCache(fetch, ttl=0, refresh=0)
+
+    first = cache.get(*day_key(0))
+    same = cache.get(*day_key(0))
+    assert same is first and len(fetch.calls) == 2
+    assert all(kwargs == {} for _, kwargs in fetch.calls)
+
+    week_backend.insert([tap("N1", "Veliteľ", "Príchod", f"{MONDAY} 05:55")])
+    changed = cache.get(*day_key(0))
+    assert changed is not first
+    assert changed.attrs["data_version"] > first.attrs["data_version"]
+    assert len(changed) == len(first) + 1
+
+
+def test_incremental_refresh_fetches_only_new_rows(week_backend):
+    fetch = CountingFetch(week_backend)
+    cache = app.AttendanceCache(fetch, ttl=3600, refresh=0)
+    first = cache.get(*day_key(0))
+
+    week_backend.insert([tap("N1", "Plombovac", "Príchod", f"{MONDAY} 13:10")])
+    df = cache.get(*day_key(0))
+
+    assert fetch.calls[-1][1] == {"after_id": int(first["id"].max())}
+    assert cache.fetched_rows(*day_key(0)) == 1
+    assert len(df) == len(first) + 1
+    # nový riadok len pribudol: základná verzia ostáva, zmena je zapísaná s dotknutou bunkou
+    assert df.attrs["base_version"] == first.attrs["base_version"]
+    (previous, touched), = df.attrs["changes"]
+    assert previous == first.attrs["data_version"]
+    assert touched == {(app.day_number(MONDAY), "Plombovac")}
+
+    cache.get(*day_key(0))
+    assert cache.fetched_rows(*day_key(0)) == 0
+
+
+def test_least_recently_used_range_is_evicted(week_backend):
+    fetch = CountingFetch(week_backend)
+    cache = app.AttendanceCache(fetch, ttl=3600, refresh=3600, max_ranges=2)
+
+    cache.get(*day_key(0))
+    cache.get(*day_key(1))
+    cache.get(*day_key(0))  # day 0 je teraz použitý naposledy
+    cache.get(*day_key(2))  # vyhodí day 1
+
+    cache.get(*day_key(0))
+    assert len(fetch.calls) == 3
+    cache.get(*day_key(1))
+    assert len(fetch.calls) == 4
+    assert [key for key, _ in fetch.calls].count(day_key(1)) == 2
+    assert cache._key_locks == {}
+
+
+def test_invalidate_drops_only_ranges_with_the_timestamp(week_backend):
+    fetch = CountingFetch(week_backend)
+    cache = app.AttendanceCache(fetch, ttl=3600, refresh=3600)
+    monday = cache.get(*day_key(0))
+    tuesday = cache.get(*day_key(1))
+
+    cache.invalidate(day_key(1)[0] + timedelta(hours=8))
+
+    assert cache.get(*day_key(0)) is monday
+    assert cache.get(*day_key(1)) is not tuesday
+    assert len(fetch.calls) == 3
+
+    cache.invalidate()
+    cache.get(*day_key(0))
+    assert len(fetch.calls) == 4
+
+
+def test_invalidate_during_load_does_not_store_the_result(week_backend):
+    cache = None
+
+    def fetch(start_dt, end_dt, **kwargs):
+        df = week_backend.fetch_range(start_dt, end_dt, **kwargs)
+        if not calls:
+            cache.invalidate()  # zápis počas dotazu: načítané dáta môžu byť staršie
+        calls.append(kwargs)
+        return df
+
+    calls = []
+    cache = app.AttendanceCache(fetch, ttl=3600, refresh=3600)
+    cache.get(*day_key(0))
+    cache.get(*day_key(0))
+    assert len(calls) == 2
+
+
+def test_versions_are_unique_across_caches(week_backend):
+    rows = app.AttendanceCache(week_backend.fetch_range).get(*day_key(0))
+    pairs = app.AttendanceCache(week_backend.fetch_pairs, prepare=lambda t: t, incremental=False).get(*day_key(0))
+    assert rows.attrs["data_version"] != pairs.attrs["data_version"]
+
+
+def test_evicted_range_is_not_fetched_twice_at_once(week_backend):
+    """Vyhodenie rozsahu počas jeho doťahovania nesmie dať ďalšiemu vláknu nový zámok toho istého rozsahu."""
+    fetch = CountingFetch(week_backend)
+    cache = app.AttendanceCache(fetch, ttl=3600, refresh=0, max_ranges=1)
+    key = day_key(0)
+    cache.get(*key)
+
+    fetch.gates[key] = threading.Event()
+    refreshing = threading.Thread(target=cache.get, args=key)
+    refreshing.start()
+    assert fetch.entered.wait(5)
+    cache.get(*day_key(1))  # vyhodí rozsah, ktorý sa práve doťahuje
+    waiting = threading.Thread(target=cache.get, args=key)
+    waiting.start()
+    clock.sleep(0.1)
+    fetch.gates[key].set()
+    refreshing.join(5)
+    waiting.join(5)
+
+    assert fetch.max_in_flight[key] == 1
+    assert cache._key_locks == {}
@@ -0,0 +1,229 @@
+from datetime import time, timedelta
+
+import numpy as np
+import pandas as pd
+
+import dochadzka as app
+from conftest import MONDAY, prepared_delta, tap
+
+
+def week_range(monday=MONDAY):
+    return app.day_range(monday, monday + timedelta(days=6))
+
+
+def test_sqlite_backend_pairs_match_pairing_in_python(week_backend):
+    start_dt, end_dt = week_range()
+    df = app._prepare_attendance(week_backend.fetch_range(start_dt, end_dt))
+    pushed = week_backend.fetch_pairs(start_dt, end_dt)
+    local = app.build_pair_table(df)
+
+    assert len(df) == week_backend.range_stats(start_dt, end_dt)[0]
+    # order sa počíta inak (poradie id v DB vs. pozícia riadku), ostatné stĺpce sú zhodné
+    pd.testing.assert_frame_equal(pushed.drop(columns="order"), local.drop(columns="order"), check_categorical=False)
+
+
+def test_classify_pairs_matches_classify_pair():
+    day = pd.Timestamp("2025-01-06", tz="UTC")
+    moments = [None] + [day + pd.Timedelta(hours=h, minutes=m, microseconds=us)
+                        for h in (0, 1, 2, 6, 7, 12, 13, 14, 15, 20, 21, 23)
+                        for m, us in ((0, 0), (0, 1), (59, 0))]
+    cases = [(pr, od, pos) for pr in moments for od in moments for pos in ("Veliteľ", "Plombovac")]
+
+    def sec(ts):
+        return np.nan if ts is None else (ts - day).total_seconds()
+
+    mor, aft, hours_m, hours_p = app.classify_pairs(
+        [sec(pr) for pr, _, _ in cases], [sec(od) for _, od, _ in cases], app.is_velitel([p for _, _, p in cases])
+    )
+    for i, (pr, od, pos) in enumerate(cases):
+        expected = app.classify_pair(pr if pr is not None else pd.NaT, od if od is not None else pd.NaT, pos)[:4]
+        got = (app.STATUS_NAMES[mor[i]], app.STATUS_NAMES[aft[i]], hours_m[i], hours_p[i])
+        assert got == expected, (pr, od, pos)
+
+
+def test_get_user_pairs_matches_pair_table(week_backend):
+    df = app._prepare_attendance(week_backend.fetch_range(*week_range()))
+    expected = app.pairs_by_cell(app.build_pair_table(df))
+    cells = 0
+    for (day, position), cell in df[df["day"] >= 0].groupby(["day", "position"], observed=True):
+        got = app.get_user_pairs(cell)
+        want = expected[(day, position)]
+        assert list(got) == list(want)
+        for user, pair in got.items():
+            assert pair == {k: want[user][k] for k in ("pr", "od", "pr_count", "od_count")}, (day, position, user)
+        cells += 1
+    assert cells == len(expected)
+    assert app.get_user_pairs(df.iloc[:0]) == {}
+
+
+def test_patched_week_matches_full_rebuild(week_backend, pairing_mode):
+    """Živý režim: zmeny z ChangeFeed -> AttendanceCache.apply -> WeekSummary.patched = nový výpočet celého týždňa."""
+    start_dt, end_dt = app.pairing_range(*week_range())
+    first_day = app.day_number(MONDAY)
+    cache = app.AttendanceCache(week_backend.fetch_range)
+    feed = app.ChangeFeed()
+    feed.subscribe(lambda rows: cache.apply(prepared_delta(rows)))
+
+    df = cache.get(start_dt, end_dt)
+    summary = app.WeekSummary(MONDAY, app.pair_table_from_frame(df, first_day, first_day + 6))
+    version = df.attrs["data_version"]
+
+    tuesday, sunday = MONDAY + timedelta(days=1), MONDAY + timedelta(days=6)
+    inserted = week_backend.insert([
+        tap("N1", "Plombovac", "Príchod", f"{tuesday} 13:30"),
+        tap("N1", "Plombovac", "Odchod", f"{tuesday} 22:05"),
+        tap("N2", "Veliteľ", "Príchod", f"{sunday} 22:00"),
+        tap("N2", "Veliteľ", "Odchod", f"{sunday + timedelta(days=1)} 06:00"),
+    ])
+    existing = df[df["position"] == "Mobilny_SBS"].iloc[0]
+    changed = week_backend.update(int(existing["id"]), {"action": "Odchod" if existing["action"] == "Príchod" else "Príchod"})
+    feed.publish(inserted + changed)
+    feed.publish(inserted)  # ten istý riadok druhýkrát sa preskočí
+
+    df = cache.get(start_dt, end_dt)
+    changes = df.attrs["changes"]
+    since = [v for v, _ in changes].index(version)
+    touched = frozenset().union(*(cells for _, cells in changes[since:]))
+    patched = summary.patched(df, touched)
+    full = app.WeekSummary(MONDAY, app.pair_table_from_frame(df, first_day, first_day + 6))
+
+    assert feed.version == 1
+    assert patched is not summary
+    assert all(patched.day(d) == full.day(d) for d in full.days)
+    pd.testing.assert_frame_equal(patched.matrix(), full.matrix())
+
+
+def test_stream_pairing_follows_shift_across_midnight(backend, monkeypatch):
+    monkeypatch.setattr(app, "PAIRING_MODE", "stream")
+    backend.insert([
+        tap("U1", "Veliteľ", "Príchod", f"{MONDAY} 21:55"),
+        tap("U1", "Veliteľ", "Odchod", f"{MONDAY + timedelta(days=1)} 06:05"),
+        tap("U2", "Plombovac", "Príchod", f"{MONDAY} 05:55"),
+        tap("U2", "Plombovac", "Odchod", f"{MONDAY} 14:00"),
+        tap("U2", "Plombovac", "Príchod", f"{MONDAY} 14:00"),
+        tap("U2", "Plombovac", "Odchod", f"{MONDAY} 22:00"),
+    ])
+    day = app.day_number(MONDAY)
+    start_dt, end_dt = app.day_range(MONDAY, MONDAY + timedelta(days=1))
+    table = backend.fetch_pairs(start_dt, end_dt)
+
+    night = app.pairs_for(table, day, "Veliteľ")
+    assert list(night) == ["U1"]
+    assert night["U1"]["pr"].time() == time(21, 55) and night["U1"]["od"].time() == time(6, 5)
+    assert app.pairs_for(table, day + 1, "Veliteľ") == {}
+
+    # dve smeny toho istého čipu v jeden deň = dva páry (n = 0, 1)
+    shifts = app.pairs_for(table, day, "Plombovac")
+    assert list(shifts) == ["U2", "U2 (2)"]
+    summary = app.summarize_day(None, MONDAY, table, app.coverage_table(table))["Plombovac"]
+    assert (summary["morning"]["status"], summary["afternoon"]["status"]) == ("Ranna OK", "Poobedna OK")
+
+    # v režime "day" sa nočná smena rozpadne na chýbajúci odchod a chýbajúci príchod
+    monkeypatch.setattr(app, "PAIRING_MODE", "day")
+    by_day = app.build_pair_table(app._prepare_attendance(backend.fetch_range(start_dt, end_dt)))
+    assert pd.isna(app.pairs_for(by_day, day, "Veliteľ")["U1"]["od"])
+    assert pd.isna(app.pairs_for(by_day, day + 1, "Veliteľ")["U1"]["pr"])
+
+
+def test_range_report_from_stored_summaries_skips_pairing(week_backend):
+    start, end = MONDAY, MONDAY + timedelta(days=13)
+    start_dt, end_dt = app.day_range(start, end)
+    loads = []
+
+    def load_pairs():
+        loads.append(1)
+        return week_backend.fetch_pairs(start_dt, end_dt)
+
+    store = app.SummaryStore(week_backend)
+    first = app.RangeReport(start, end, load_pairs, store)
+    again = app.RangeReport(start, end, load_pairs, store)
+    assert len(loads) == 1
+    pd.testing.assert_frame_equal(again.matrix(), first.matrix())
+
+    # riadok pridaný mimo aplikácie: prepočíta sa len jeho deň
+    week_backend.insert([tap("N1", "Plombovac", "Príchod", f"{end} 13:30")])
+    stamps = store.day_stamps(first.days)
+    assert set(store.lookup(first.days, stamps)) == set(first.days) - {end}
+    fresh = app.RangeReport(start, end, load_pairs, store)
+    pd.testing.assert_frame_equal(fresh.matrix(), app.RangeReport(start, end, week_backend.fetch_pairs(start_dt, end_dt)).matrix())
+
+
+def test_range_export_does_not_store_summaries_from_stale_cached_pairs(week_backend):
+    """Riadok pridaný mimo aplikácie medzi načítaním párov do cache a reportom sa nesmie uložiť pod nový odtlačok."""
+    start, end = MONDAY, MONDAY + timedelta(days=6)
+    start_dt, end_dt = app.day_range(start, end)
+    pairs_cache = app.AttendanceCache(week_backend.fetch_pairs, prepare=lambda t: t, incremental=False,
+                                      ttl=3600, refresh=3600)
+    attendance_cache = app.AttendanceCache(week_backend.fetch_range, ttl=3600, refresh=3600)
+    store = app.SummaryStore(week_backend)
+    stale = pairs_cache.get(start_dt, end_dt)
+
+    wednesday = MONDAY + timedelta(days=2)
+    week_backend.insert([tap("N1", "Plombovac", "Príchod", f"{wednesday} 13:30"),
+                         tap("N1", "Plombovac", "Odchod", f"{wednesday} 22:00")])
+    # DataFrame z cache (starší ako odtlačok) sa použije, ale neuloží
+    week = app.WeekSummary(MONDAY, stale, store)
+    assert store.lookup(week.days, store.day_stamps(week.days)) == {}
+
+    report, _ = app.build_range_export(start, end, pairs_cache, attendance_cache, store)
+    expected = app.RangeReport(start, end, week_backend.fetch_pairs(start_dt, end_dt)).matrix()
+    pd.testing.assert_frame_equal(report.matrix(), expected)
+    assert pairs_cache.get(start_dt, end_dt) is not stale
+
+    def no_pairs():
+        raise AssertionError("všetky dni majú byť z uložených súhrnov")
+
+    pd.testing.assert_frame_equal(app.RangeReport(start, end, no_pairs, store).matrix(), expected)
+
+
+def test_day_stamps_change_only_for_days_that_pair_the_new_row(week_backend, pairing_mode):
+    days = [MONDAY + timedelta(days=i) for i in range(14)]
+    store = app.SummaryStore(week_backend)
+    before = store.day_stamps(days)
+    assert set(before) == set(days)
+
+    wednesday = MONDAY + timedelta(days=2)
+    week_backend.insert([tap("N1", "Plombovac", "Príchod", f"{wednesday} 13:30")])
+    after = store.day_stamps(days)
+
+    changed = {d for d in days if after[d] != before[d]}
+    neighbours = {wednesday - timedelta(days=1), wednesday, wednesday + timedelta(days=1)}
+    assert changed == ({wednesday} if pairing_mode == "day" else neighbours)
+
+
+def test_insert_attendance_batch_skips_invalid_rows_and_reports_each_row(week_backend):
+    tuesday = MONDAY + timedelta(days=1)
+    store = app.SummaryStore(week_backend)
+    days = [MONDAY, tuesday]
+    app.RangeReport(MONDAY, tuesday, lambda: week_backend.fetch_pairs(*app.day_range(MONDAY, tuesday)), store)
+    before = len(week_backend.fetch_range(*app.day_range(MONDAY, tuesday)))
+
+    at = app.tz.localize(app.datetime.combine(tuesday, time(13, 30, 5)))
+    results, inserted, stamps = app.insert_attendance_batch(week_backend, [
+        (" N1 ", "Plombovac", "Príchod", at),
+        ("", "Plombovac", "Príchod", at),
+        {"user_code": "N2", "position": "Kuchyňa", "action": "Príchod", "timestamp": at},
+        {"user_code": "N3", "position": "Plombovac", "action": "Pauza", "timestamp": at},
+        {"user_code": "N4", "position": "Veliteľ", "action": "Odchod", "timestamp": at},
+    ], store)
+
+    assert [r["error"] for r in results] == [
+        None, "chýba user_code", "neznáma pozícia: Kuchyňa", "neznáma akcia: Pauza", None,
+    ]
+    assert [r["ok"] for r in results] == [True, False, False, False, True]
+    assert [r["id"] for r in results] == [inserted[0]["id"], None, None, None, inserted[1]["id"]]
+    assert [row["user_code"] for row in inserted] == ["N1", "N4"]
+    assert stamps == [app.pytz.utc.localize(app.datetime.combine(tuesday, time(13, 30, 5)))] * 2
+
+    df = week_backend.fetch_range(*app.day_range(MONDAY, tuesday))
+    assert len(df) == before + 2
+    # uložené súhrny dotknutých buniek sú zmazané, ostatné ostávajú
+    stored = week_backend.fetch_summaries(MONDAY, tuesday)
+    assert {(str(r["day"])[:10], r["position"]) for r in stored if str(r["day"])[:10] == str(tuesday)} == {
+        (str(tuesday), pos) for pos in app.POSITIONS if pos not in ("Plombovac", "Veliteľ")
+    }
+    assert len(store.lookup(days, store.day_stamps(days))) == 1
+
+    assert app.insert_attendance_batch(week_backend, [("", "Plombovac", "Príchod", at)]) == (
+        [{"ok": False, "id": None, "error": "chýba user_code"}], [], [],
+    )
@@ -0,0 +1,220 @@
+from datetime import timedelta
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dochadzka as app
+from conftest import MONDAY, prepared_delta, tap
+
+
+def baseline_merge_intervals(pairs):
+    """Pôvodné merge_intervals (cyklus cez zoradené intervaly), referencia pre sweep_coverage."""
+    intervals = []
+    for pair in pairs.values():
+        if pd.notna(pair["pr"]) and pd.notna(pair["od"]):
+            intervals.append((pair["pr"], pair["od"]))
+    if not intervals:
+        return []
+    intervals.sort(key=lambda x: x[0])
+    merged = [intervals[0]]
+    for start, end in intervals[1:]:
+        last_start, last_end = merged[-1]
+        if (start - last_end).total_seconds() / 60 <= app.SWAP_WINDOW_MINUTES:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def random_cells(rng, cells=200):
+    """Bunky s náhodnými pármi (aj prekrývajúcimi sa, tesne za sebou a s chýbajúcim odchodom)."""
+    day = pd.Timestamp("2025-01-06", tz="Europe/Bratislava")
+    out = []
+    for _ in range(cells):
+        pairs = {}
+        for i in range(rng.integers(0, 7)):
+            start = day + pd.Timedelta(minutes=int(rng.integers(0, 20 * 60)))
+            # dĺžky okolo SWAP_WINDOW_MINUTES, aby vznikali medzery tesne pod aj nad hranicou
+            end = start + pd.Timedelta(minutes=int(rng.choice([rng.integers(1, 60), rng.integers(60, 9 * 60)])))
+            pairs[f"U{i}"] = {"pr": start, "od": end if rng.random() > 0.1 else pd.NaT}
+        out.append(pairs)
+    return out
+
+
+def test_sweep_coverage_matches_baseline_merge_intervals():
+    cells = random_cells(np.random.default_rng(7))
+    starts, ends, groups = [], [], []
+    for g, pairs in enumerate(cells):
+        for pair in pairs.values():
+            if pd.notna(pair["od"]):
+                starts.append(pair["pr"])
+                ends.append(pair["od"])
+                groups.append(g)
+    start, end, offset = app._interval_arrays(pd.Series(starts), pd.Series(ends))
+    seg_group, seg_start, seg_end, per_group = app.sweep_coverage(start, end, offset, groups, len(cells))
+
+    for g, pairs in enumerate(cells):
+        expected = baseline_merge_intervals(pairs)
+        mine = seg_group == g
+        got = [(pd.Timestamp(a, tz="UTC"), pd.Timestamp(b, tz="UTC")) for a, b in zip(seg_start[mine], seg_end[mine])]
+        assert got == expected, g
+        assert app.merge_intervals(pairs) == expected
+        hours = sum((b - a).total_seconds() / 3600 for a, b in expected)
+        assert per_group["total_hours"][g] == pytest.approx(hours)
+        assert per_group["segments"][g] == len(expected)
+
+
+def test_isoformat_series_matches_isoformat():
+    stamps = pd.Series(pd.to_datetime([
+        "2025-03-30 00:59:59.999999+00:00", "2025-03-30 01:00:00+00:00",  # zmena času +01:00 -> +02:00
+        "2025-10-26 00:30:00.000001+00:00", "2025-10-26 01:30:00+00:00", None, "2025-01-06 05:55:00.5+00:00",
+    ], utc=True, format="ISO8601"))
+    for ts in (stamps, stamps.dt.tz_convert("Europe/Bratislava"), stamps.dt.tz_convert("America/St_Johns")):
+        expected = ts.apply(lambda x: x.isoformat() if pd.notna(x) else "")
+        pd.testing.assert_series_equal(app.isoformat_series(ts), expected)
+
+
+def baseline_excel(df_matrix, df_day_details, df_raw, chip_map):
+    """Pôvodný zápis excel_with_colors (bežný Workbook, štýl na každej bunke), rozpis čipov z chip_map."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, PatternFill
+    from openpyxl.utils.dataframe import dataframe_to_rows
+
+    wb = Workbook()
+    ws1 = wb.active
+    ws1.title = "Týždenný prehľad"
+    green = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
+    yellow = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
+    for r in dataframe_to_rows(df_matrix.reset_index().rename(columns={"index": "Pozícia"}), index=False, header=True):
+        ws1.append(r)
+    for row in ws1.iter_rows(min_row=2, min_col=2, max_col=1 + len(df_matrix.columns), max_row=1 + len(df_matrix)):
+        for cell in row:
+            if isinstance(cell.value, (int, float)):
+                cell.fill = green
+            elif isinstance(cell.value, str) and cell.value.strip().startswith("⚠"):
+                cell.fill = yellow
+    ws2 = wb.create_sheet("Denné - detail")
+    for r in dataframe_to_rows(df_day_details, index=False, header=True):
+        ws2.append(r)
+    ws3 = wb.create_sheet("Surové dáta")
+    for r in dataframe_to_rows(df_raw, index=False, header=True):
+        ws3.append(r)
+    ws4 = wb.create_sheet("Rozpis čipov")
+    days = ["pondelok", "utorok", "streda", "štvrtok", "piatok", "sobota", "nedeľa"]
+    ws4.append(["position", "shift"] + days)
+    for pos in sorted(df_raw["position"].unique()):
+        for shift in ["06:00-14_00", "14:00-22:00"]:
+            ws4.append([pos, shift] + [", ".join(chip_map.get((pos, shift, i), [])) for i in range(7)])
+    for col in ws4.columns:
+        for cell in col:
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+    out = BytesIO()
+    wb.save(out)
+    out.seek(0)
+    return out
+
+
+def workbook_cells(data) -> dict:
+    """Hárok -> riadky (hodnota, farba výplne, zarovnanie) pre porovnanie dvoch zošitov."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(data)
+    return {
+        ws.title: [[(c.value, c.fill.fgColor.rgb if c.fill.fill_type else None, c.alignment.horizontal) for c in row]
+                   for row in ws.iter_rows()]
+        for ws in wb.worksheets
+    }
+
+
+def test_streamed_excel_has_the_cells_of_the_baseline_writer(week_backend):
+    start_dt, end_dt = app.day_range(MONDAY, MONDAY + timedelta(days=6))
+    df = app._prepare_attendance(week_backend.fetch_range(start_dt, end_dt))
+    summary = app.WeekSummary(MONDAY, week_backend.fetch_pairs(start_dt, end_dt))
+    df_matrix = summary.matrix().reset_index().rename(columns={"index": "position"})
+    df_matrix[df_matrix.columns[3]] = df_matrix[df_matrix.columns[3]].astype(object)
+    df_matrix.iloc[0, 3] = "⚠ chýba odchod"  # žltá bunka
+    details = summary.day_details(MONDAY)
+
+    # pôvodne sa timestamp prevádzal po riadkoch cez isoformat
+    old_raw = df[app.ATTENDANCE_COLUMNS].copy()
+    old_raw["timestamp"] = old_raw["timestamp"].apply(lambda x: x.isoformat() if pd.notna(x) else "")
+    chip_map = app.get_chip_assignments(old_raw, MONDAY, summary.pair_table)
+    expected = workbook_cells(baseline_excel(df_matrix, details, old_raw, chip_map))
+
+    got = workbook_cells(app.excel_with_colors(df_matrix, details, app.raw_export_frame(df), MONDAY, summary.pair_table))
+    assert list(got) == list(expected)
+    for title in expected:
+        assert got[title] == expected[title], title
+
+
+def test_anomaly_index_rebuilds_after_edit_and_extends_on_new_rows(week_backend):
+    start_dt, end_dt = app.day_range(MONDAY, MONDAY + timedelta(days=6))
+    cache = app.AttendanceCache(week_backend.fetch_range)
+    feed = app.ChangeFeed()
+    feed.subscribe(lambda rows: cache.apply(prepared_delta(rows)))
+    index = app.AnomalyIndex()
+
+    def fresh_table(df):
+        rebuilt = app.AnomalyIndex()
+        rebuilt.refresh(df)
+        return rebuilt.table()
+
+    df = cache.get(start_dt, end_dt)
+    assert index.refresh(df)
+    assert not index.refresh(df)
+
+    # nové riadky: index sa len doplní (základná verzia sa nemení)
+    tuesday = MONDAY + timedelta(days=1)
+    feed.publish(week_backend.insert([tap("N1", "Plombovac", "Príchod", f"{tuesday} 13:30"),
+                                      tap("N1", "Plombovac", "Príchod", f"{tuesday} 13:31")]))
+    df = cache.get(start_dt, end_dt)
+    assert index.refresh(df) and index.base_version == df.attrs["base_version"]
+    assert "dvojité pípnutie" in set(index.table()["typ"])
+    pd.testing.assert_frame_equal(index.table(), fresh_table(df))
+
+    # úprava existujúceho riadku: nová základná verzia, index sa postaví nanovo
+    row = df[(df["user_code"] == "N1") & (df["timestamp"].dt.minute == 31)].iloc[0]
+    feed.publish(week_backend.update_many([{"id": int(row["id"]), "position": "Plombovac", "action": "Odchod",
+                                            "valid": True}]))
+    edited = cache.get(start_dt, end_dt)
+    assert edited.attrs["base_version"] != df.attrs["base_version"]
+    assert index.refresh(edited)
+    pd.testing.assert_frame_equal(index.table(), fresh_table(edited))
+    n1 = index.table()[index.table()["user_code"] == "N1"]
+    assert n1.empty
+
+
+def test_guard_ledger_totals_match_hand_computed_hours(backend):
+    day = [MONDAY + timedelta(days=i) for i in range(8)]
+    backend.insert([
+        # G1: ranná 7.5 h, R+P 15.25 h, veliteľ R+P 16.25 h, poobedná 7.5 h
+        tap("G1", "Plombovac", "Príchod", f"{day[0]} 06:00"), tap("G1", "Plombovac", "Odchod", f"{day[0]} 14:00"),
+        tap("G1", "Plombovac", "Príchod", f"{day[1]} 05:55"), tap("G1", "Plombovac", "Odchod", f"{day[1]} 22:05"),
+        tap("G1", "Veliteľ", "Príchod", f"{day[2]} 06:00"), tap("G1", "Veliteľ", "Odchod", f"{day[2]} 21:30"),
+        tap("G1", "Plombovac", "Príchod", f"{day[6]} 14:00"), tap("G1", "Plombovac", "Odchod", f"{day[6]} 22:00"),
+        # G2: poobedná 7.5 h, chýba odchod (0 h), neplatné časy (0 h, odpracované 4 h), ranná v ďalšom týždni
+        tap("G2", "Plombovac", "Príchod", f"{day[0]} 14:00"), tap("G2", "Plombovac", "Odchod", f"{day[0]} 22:00"),
+        tap("G2", "Plombovac", "Príchod", f"{day[1]} 14:00"),
+        tap("G2", "Plombovac", "Príchod", f"{day[3]} 08:00"), tap("G2", "Plombovac", "Odchod", f"{day[3]} 12:00"),
+        tap("G2", "Plombovac", "Príchod", f"{day[7]} 06:00"), tap("G2", "Plombovac", "Odchod", f"{day[7]} 14:00"),
+    ])
+    ledger = app.GuardLedger(backend.fetch_pairs(*app.day_range(day[0], day[7])))
+
+    def row(days, shifts, hours, worked, issues):
+        return {"days": days, "shifts": shifts, "hours": hours, "worked_hours": worked, "issues": issues}
+
+    week = ledger.totals(day[0], day[6])
+    assert week.to_dict("index") == {
+        "G1": row(4, 4, 7.5 + 15.25 + 16.25 + 7.5, round(8 + 16 + 10 / 60 + 15.5 + 8, 2), 0),
+        "G2": row(3, 3, 7.5, 8 + 0 + 4.0, 2),
+    }
+    assert ledger.totals(day[1], day[2]).to_dict("index") == {
+        "G1": row(2, 2, 15.25 + 16.25, round(16 + 10 / 60 + 15.5, 2), 0),
+        "G2": row(1, 1, 0.0, 0.0, 1),
+    }
+    assert ledger.totals(day[4], day[5]).empty
+    both_weeks = ledger.totals(day[0], day[7], users=["G2", "XX"])
+    assert both_weeks.to_dict("index") == {"G2": row(4, 4, 15.0, 20.0, 2)}
+    assert ledger.user_days("G1", day[0], day[6])["shift"].tolist() == ["Ranná", "R+P", "R+P", "Poobedná"]